@@ -0,0 +1,103 @@
+"""
+Throughput del filtro por fecha de publicación: parseo por fila en cada filtrado
+(implementación anterior) vs día parseado una vez en DatasetRecord.
+
+Uso:
+    python benchmarks/bench_date_filter.py --rows 200000 --passes 3
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "descubrimiento")))
+
+import dates as dates_mod  # noqa: E402
+from records import DatasetRecord  # noqa: E402
+from run_discovery import _filter_by_publication_date, _parse_date  # noqa: E402
+
+
+SHAPES = (
+    "{d}T{h:02d}:15:00.000Z",         # Socrata
+    "{d}T{h:02d}:15:07.123456",      # CKAN metadata_created
+    "{d}",
+)
+
+
+def legacy_filter(rows, dfrom, dto):
+    """Copia del filtro anterior (fromisoformat + strptime con excepciones, sin memo)."""
+    dfrom_d = _parse_date(dfrom)
+    dto_d = _parse_date(dto)
+
+    def parse_item_date(item_date):
+        if not item_date:
+            return None
+        s = item_date.strip()
+        if s.endswith("Z"):
+            s = s[:-1] + "+00:00"
+        try:
+            return datetime.fromisoformat(s).date()
+        except Exception:
+            pass
+        for fmt in ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
+            try:
+                return datetime.strptime(s[:26], fmt).date()
+            except ValueError:
+                continue
+        return None
+
+    out = []
+    for r in rows:
+        pd = r.get("publication_date")
+        dt = parse_item_date(pd) if isinstance(pd, str) else None
+        if dfrom_d and (not dt or dt < dfrom_d):
+            continue
+        if dto_d and (not dt or dt > dto_d):
+            continue
+        out.append(r)
+    return out
+
+
+def synthetic_dates(n):
+    for i in range(n):
+        day = f"{2015 + i % 10}-{1 + i % 12:02d}-{1 + i % 28:02d}"
+        yield SHAPES[i % len(SHAPES)].format(d=day, h=i % 24)
+
+
+def timed(fn, passes):
+    start = time.perf_counter()
+    for _ in range(passes):
+        kept = fn()
+    return time.perf_counter() - start, len(kept)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Throughput del filtro por fecha de publicación")
+    ap.add_argument("--rows", type=int, default=200000)
+    ap.add_argument("--passes", type=int, default=3, help="Veces que se filtra el mismo catálogo")
+    args = ap.parse_args()
+    dates = list(synthetic_dates(args.rows))
+    dfrom, dto = "2017-01-01", "2021-12-31"
+
+    dicts = [{"id": str(i), "publication_date": d} for i, d in enumerate(dates)]
+    t_legacy, n_legacy = timed(lambda: legacy_filter(dicts, dfrom, dto), args.passes)
+
+    dates_mod._parse_day_str.cache_clear()
+    start = time.perf_counter()
+    for d in dates:
+        dates_mod.parse_day(d)
+    t_parse = time.perf_counter() - start
+    records = [DatasetRecord(id=str(i), publication_date=d) for i, d in enumerate(dates)]
+    t_new, n_new = timed(lambda: _filter_by_publication_date(records, dfrom, dto), args.passes)
+    assert n_legacy == n_new, (n_legacy, n_new)
+
+    total = args.rows * args.passes
+    print(f"filas: {args.rows} x {args.passes} pasadas ({n_new} conservadas)")
+    print(f"anterior:            {t_legacy:7.3f} s ({total / t_legacy:12,.0f} filas/s)")
+    print(f"DatasetRecord:       {t_new:7.3f} s ({total / t_new:12,.0f} filas/s)")
+    print(f"parse_day (1 vez):   {t_parse:7.3f} s ({args.rows / t_parse:12,.0f} filas/s, memo vacío)")
+
+
+if __name__ == "__main__":
+    main()
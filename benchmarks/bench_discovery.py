@@ -0,0 +1,150 @@
+"""
+Benchmark de punta a punta contra el portal sintético de `fake_portal.py`.
+
+Escenarios (cada uno en un proceso aparte, para medir su pico de RSS por separado):
+- socrata: `fetch_by_domains` sobre N dominios.
+- ckan: `fetch_ckan_by_config` sobre un portal CKAN.
+- country-socrata / country-ckan: `run_for_country` completo (consulta, normalización,
+  deduplicación, filtro y exportación), con el tiempo de cada etapa (`stage_seconds`;
+  con `--near-dupes` se suma la etapa near_dupes).
+
+Reporta páginas/s, filas/s, pico de RSS, latencia p50/p95, MB por la red y decodificados,
+y tiempo por etapa. Ejemplos:
+    python benchmarks/bench_discovery.py --datasets 5000 --latency 0.01
+    python benchmarks/bench_discovery.py --burst-every 20 --error-rate 0.02 --workers 3 --prefetch 4
+    python benchmarks/bench_discovery.py --scenarios ckan --json-out /tmp/bench.json
+    python benchmarks/bench_discovery.py --scenarios ckan --gzip --lean
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DISCOVERY_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "descubrimiento"))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_portal import FakePortal, add_portal_arguments, state_from_args  # noqa: E402
+
+
+SCENARIOS = ("socrata", "ckan", "country-socrata", "country-ckan")
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _run_scenario(name: str, portal_url: str, domains: List[str], opts: Dict[str, Any]) -> Dict[str, Any]:
+    """Corre un escenario en el proceso actual (un hijo recién creado)."""
+    os.environ["SOCRATA_DISCOVERY_BASE"] = portal_url + "/api/catalog/v1"
+    sys.path.insert(0, DISCOVERY_DIR)
+    import ckan_client
+    import rate_limit
+    import run_discovery
+    import socrata_discovery
+    from metrics import HTTP, StageTimer
+
+    # El portal local no tiene la cuota horaria de Socrata: solo limitador adaptativo
+    rate_limit.register_quota(socrata_discovery.DISCOVERY_BASE)
+    ckan_client.set_lean(opts["lean"])
+    stats: Dict[str, int] = {}
+    limit = opts["datasets"] * max(1, len(domains))
+    timer = StageTimer()
+    t0 = time.perf_counter()
+    if name == "socrata":
+        rows = sum(1 for _ in timer.timed("fetch", socrata_discovery.iter_by_domains(
+            domains, per_domain_limit=limit, stats=stats, workers=opts["workers"])))
+    elif name == "ckan":
+        rows = sum(1 for _ in timer.timed("fetch", ckan_client.iter_ckan_by_config(
+            base_url=portal_url, per_query_limit=limit, stats=stats, prefetch=opts["prefetch"])))
+    else:
+        if name == "country-socrata":
+            config = {"platform": "socrata", "domains": domains}
+        else:
+            config = {"platform": "ckan", "base_url": portal_url}
+        with tempfile.TemporaryDirectory() as tmp:
+            run_discovery.OUTPUT_DIR = tmp
+            run_discovery.STATE_DIR = os.path.join(tmp, "state")
+            rows, metrics = run_discovery.run_for_country(
+                "Benchmark", config, per_domain_limit=limit, published_from=opts["published_from"],
+                with_metrics=True, workers=opts["workers"], prefetch=opts["prefetch"], formats=opts["formats"],
+                near_dupes=opts["near_dupes"])
+        stats = {"requests": metrics["http_requests"], "retries": metrics["http_retries"],
+                 "throttled": metrics["http_throttled"], "bytes_wire": metrics["http_bytes_wire"],
+                 "bytes_decoded": metrics["http_bytes_decoded"]}
+    elapsed = time.perf_counter() - t0
+
+    stages = metrics["stage_seconds"] if name.startswith("country") else timer.totals()
+    latency = next(iter(HTTP.to_dict().values()), {}).get("latency_seconds", {})
+    return {
+        "scenario": name,
+        "rows": rows,
+        "pages": int(stats.get("requests", 0)),
+        "retries": int(stats.get("retries", 0)),
+        "throttled": int(stats.get("throttled", 0)),
+        "elapsed_seconds": round(elapsed, 3),
+        "pages_per_s": round(stats.get("requests", 0) / elapsed, 1) if elapsed else 0.0,
+        "rows_per_s": round(rows / elapsed, 1) if elapsed else 0.0,
+        "peak_rss_mb": _peak_rss_mb(),
+        "latency_p50": latency.get("p50"),
+        "latency_p95": latency.get("p95"),
+        "wire_mb": round(stats.get("bytes_wire", 0) / 2**20, 2),
+        "decoded_mb": round(stats.get("bytes_decoded", 0) / 2**20, 2),
+        "stages": stages,
+    }
+
+
+def _print_result(r: Dict[str, Any]) -> None:
+    print(f"{r['scenario']:<16} filas={r['rows']:>7}  páginas={r['pages']:>5}  "
+          f"t={r['elapsed_seconds']:>7.3f}s  {r['pages_per_s']:>8.1f} pág/s  {r['rows_per_s']:>10.1f} filas/s  "
+          f"RSS={r['peak_rss_mb']:>6.1f} MB  retries={r['retries']} 429/503={r['throttled']}  "
+          f"latencia p50<={r['latency_p50']}s p95<={r['latency_p95']}s  "
+          f"red={r['wire_mb']}/{r['decoded_mb']} MB")
+    print("    etapas: " + ", ".join(f"{k}={v:.3f}s" for k, v in r["stages"].items()))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de descubrimiento contra un portal sintético local")
+    add_portal_arguments(ap)
+    ap.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--prefetch", type=int, default=0)
+    ap.add_argument("--formats", nargs="+", default=["json", "csv"])
+    ap.add_argument("--lean", action="store_true", help="CKAN con `fl` (solo los campos normalizados)")
+    ap.add_argument("--published-from", dest="published_from", default=None,
+                    help="Ventana de publicación para los escenarios country-*")
+    ap.add_argument("--near-dupes", dest="near_dupes", action="store_true",
+                    help="Agrupar casi-duplicados en los escenarios country-* (etapa near_dupes)")
+    ap.add_argument("--json-out", dest="json_out", default=None, help="Guardar resultados en JSON")
+    args = ap.parse_args()
+
+    state = state_from_args(args)
+    opts = {"datasets": args.datasets, "workers": args.workers, "prefetch": args.prefetch,
+            "formats": args.formats, "published_from": args.published_from, "lean": args.lean,
+            "near_dupes": args.near_dupes}
+    results = []
+    with FakePortal(state) as portal:
+        print(f"Portal sintético en {portal.url}: {args.datasets} datasets x {len(state.domains)} dominios, "
+              f"latencia={args.latency}s, errores={args.error_rate}, ráfaga 429 cada {args.burst_every or '-'}")
+        for name in args.scenarios:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                result = pool.submit(_run_scenario, name, portal.url, state.domains, opts).result()
+            _print_result(result)
+            results.append(result)
+        print(f"Servidor: {state.requests} solicitudes, {state.errors} errores 500, {state.throttled} respuestas 429")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"portal": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Decodificación de una página package_search de CKAN (rows=1000, con `resources` y
+`extras` como en los portales reales): tiempo y memoria pico por modo de `json_decoder`.
+
+Modos:
+- json: `json.loads` de la página completa (lo que hacía `resp.json()`).
+- orjson: página completa con orjson (si está instalado).
+- +proj: además recorta cada package a `CKAN_ITEM_FIELDS`.
+- stream: items decodificados y proyectados de a uno.
+
+Uso:
+    python benchmarks/bench_json_decode.py --rows 1000 --resources 15 --passes 5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "descubrimiento")))
+
+import json_decoder  # noqa: E402
+from ckan_client import CKAN_ITEM_FIELDS, CKAN_ITEMS_PATH  # noqa: E402
+
+
+def synthetic_page(rows: int, resources: int) -> bytes:
+    results = []
+    for i in range(rows):
+        results.append({
+            "id": f"{i:08d}-aaaa-bbbb-cccc-000000000000",
+            "name": f"paquete-{i}",
+            "title": f"Paquete de datos abiertos número {i}",
+            "notes": "Descripción del conjunto de datos publicada por la institución. " * 4,
+            "metadata_created": "2021-03-04T10:11:12.123456",
+            "metadata_modified": "2024-05-06T07:08:09.654321",
+            "num_resources": resources,
+            "license_id": "cc-by", "license_title": "Creative Commons Attribution",
+            "state": "active", "private": False, "type": "dataset",
+            "organization": {"id": f"org-{i % 50}", "name": f"org-{i % 50}", "title": f"Organización {i % 50}",
+                             "description": "Institución pública " * 5, "image_url": "", "created": "2019-01-01"},
+            "groups": [{"id": "g", "name": "salud", "title": "Salud", "display_name": "Salud",
+                        "description": "Grupo temático " * 5, "image_display_url": ""}],
+            "tags": [{"id": f"t{j}", "name": f"tag{j}", "display_name": f"tag{j}", "state": "active",
+                      "vocabulary_id": None} for j in range(5)],
+            "resources": [{"id": f"r{i}-{j}", "name": f"Recurso {j}", "url": f"https://portal/r/{i}/{j}.csv",
+                           "format": "CSV", "mimetype": "text/csv", "size": 123456, "description": "Archivo " * 10,
+                           "created": "2021-03-04T10:11:12", "last_modified": None, "position": j,
+                           "datastore_active": True, "hash": "", "package_id": str(i)} for j in range(resources)],
+            "extras": [{"key": f"extra{j}", "value": "valor " * 8} for j in range(6)],
+        })
+    page = {"help": "https://portal/api/3/action/help_show?name=package_search", "success": True,
+            "result": {"count": rows * 10, "facets": {}, "results": results, "sort": "score desc",
+                       "search_facets": {}}}
+    return json.dumps(page, ensure_ascii=False).encode("utf-8")
+
+
+def measure(body: bytes, backend: str, stream: bool, fields, passes: int):
+    json_decoder.configure(backend=backend, stream=stream)
+    start = time.perf_counter()
+    for _ in range(passes):
+        json_decoder.decode_page(body, CKAN_ITEMS_PATH, fields)
+    per_page = (time.perf_counter() - start) / passes
+    tracemalloc.start()
+    doc = json_decoder.decode_page(body, CKAN_ITEMS_PATH, fields)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del doc
+    return per_page, peak, retained
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de decodificación de páginas CKAN")
+    ap.add_argument("--rows", type=int, default=1000)
+    ap.add_argument("--resources", type=int, default=15, help="Recursos por package")
+    ap.add_argument("--passes", type=int, default=5)
+    args = ap.parse_args()
+
+    body = synthetic_page(args.rows, args.resources)
+    print(f"Página: {args.rows} packages, {len(body) / 2**20:.1f} MiB")
+    modes = [("json", "json", False, None), ("json+proj", "json", False, CKAN_ITEM_FIELDS)]
+    try:
+        json_decoder.configure(backend="orjson")
+        modes += [("orjson", "orjson", False, None), ("orjson+proj", "orjson", False, CKAN_ITEM_FIELDS)]
+    except RuntimeError:
+        print("(orjson no instalado: se omiten sus modos)")
+    modes.append(("stream+proj", "json", True, CKAN_ITEM_FIELDS))
+
+    for name, backend, stream, fields in modes:
+        per_page, peak, retained = measure(body, backend, stream, fields, args.passes)
+        print(f"{name:<12} {per_page * 1000:8.1f} ms/página  pico={peak / 2**20:7.1f} MiB  "
+              f"retenido={retained / 2**20:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
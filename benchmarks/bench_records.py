@@ -0,0 +1,93 @@
+"""
+Mide la memoria retenida por un catálogo sintético grande normalizado como
+dicts planos vs DatasetRecord.
+
+Uso:
+    python benchmarks/bench_records.py --rows 200000
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "descubrimiento")))
+
+from ckan_client import normalize_ckan_result  # noqa: E402
+from records import as_dict  # noqa: E402
+from socrata_discovery import normalize_result  # noqa: E402
+
+
+DOMAINS = [f"datos{i}.gov.example" for i in range(40)]
+TYPES = ["dataset", "map", "chart", "file", "href"]
+LICENSES = ["CC BY 4.0", "ODbL", "Dominio público", "CC0"]
+ORGS = [f"Ministerio {i}" for i in range(150)]
+
+
+def socrata_item(i: int) -> dict:
+    # Las cadenas se construyen por fila, como ocurre al decodificar JSON de la API
+    return {
+        "resource": {
+            "name": f"Dataset {i}",
+            "id": f"{i:04x}-abcd",
+            "type": "".join(TYPES[i % len(TYPES)]),
+            "description": f"Descripción del dataset número {i}",
+            "updatedAt": "2024-03-01T12:00:00.000Z",
+            "publication_date": "2023-05-10T00:00:00.000Z",
+        },
+        "metadata": {"domain": "".join(DOMAINS[i % len(DOMAINS)])},
+        "permalink": f"https://example.org/d/{i}",
+        "link": f"https://example.org/l/{i}",
+        "classification": {
+            "domain_category": "".join(ORGS[i % len(ORGS)]),
+            "categories": ["salud", "educación"] if i % 2 else ["finanzas"],
+            "tags": [f"tag{i % 97}", "abierto"],
+        },
+        "view": {"download_count": i % 1000},
+    }
+
+
+def ckan_item(i: int) -> dict:
+    return {
+        "title": f"Paquete {i}",
+        "id": f"ckan-{i}",
+        "notes": f"Notas del paquete {i}",
+        "name": f"paquete-{i}",
+        "organization": {"title": "".join(ORGS[i % len(ORGS)])},
+        "groups": [{"title": "salud"}],
+        "tags": [{"name": f"tag{i % 97}"}],
+        "metadata_created": "2023-05-10T00:00:00",
+        "metadata_modified": "2024-03-01T12:00:00",
+        "num_resources": i % 7,
+        "license_title": "".join(LICENSES[i % len(LICENSES)]),
+    }
+
+
+def measure(rows: int, as_records: bool) -> int:
+    tracemalloc.start()
+    catalog = []
+    for i in range(rows):
+        item = socrata_item(i) if i % 2 else ckan_item(i)
+        rec = normalize_result(item) if i % 2 else normalize_ckan_result(item)
+        catalog.append(rec if as_records else as_dict(rec))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del catalog
+    return current
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Memoria de filas normalizadas: dict vs DatasetRecord")
+    ap.add_argument("--rows", type=int, default=200000)
+    args = ap.parse_args()
+
+    as_dicts = measure(args.rows, as_records=False)
+    as_records = measure(args.rows, as_records=True)
+    mib = 1024 * 1024
+    print(f"filas: {args.rows}")
+    print(f"dict:          {as_dicts / mib:8.1f} MiB ({as_dicts / args.rows:6.0f} B/fila)")
+    print(f"DatasetRecord: {as_records / mib:8.1f} MiB ({as_records / args.rows:6.0f} B/fila)")
+    print(f"reducción:     {100.0 * (1 - as_records / as_dicts):8.1f} %")
+
+
+if __name__ == "__main__":
+    main()
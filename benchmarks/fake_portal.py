@@ -0,0 +1,354 @@
+"""
+Servidor local que imita la Discovery API de Socrata y `package_search` de CKAN con
+catálogos sintéticos, para medir los clientes sin depender de los portales reales.
+
+- Socrata: GET /api/catalog/v1 (domains, limit, offset, order por createdAt/updatedAt,
+  o scroll_id: orden por id de recurso) con la ventana offset + limit <= 10000 de la
+  API real, y GET /api/catalog/v1/domains (conteo por dominio).
+- Socrata por dataset: GET /api/views/<id>.json (metadatos de la vista según su tipo;
+  solo la mitad de las vistas tabulares trae `cachedContents`) y
+  GET /resource/<id>.json?$select=count(*).
+- CKAN: GET /api/3/action/package_search (start, rows, fl; devuelve `count`). Los
+  packages traen recursos y extras como los reales; con `fl` se devuelven solo esos
+  campos con la forma del índice Solr (o 409 si el portal simula una versión sin `fl`).
+  GET /api/3/action/package_show (id) y datastore_search (resource_id; `total`).
+- Compresión gzip opcional según Accept-Encoding.
+- Fallas configurables: latencia por página, tasa de errores 500 y ráfagas de 429
+  con Retry-After.
+
+Uso directo (queda sirviendo hasta Ctrl+C):
+    python benchmarks/fake_portal.py --datasets 5000 --latency 0.02
+"""
+import argparse
+import bisect
+import gzip
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+EPOCH = date(2015, 1, 1)
+SPAN_DAYS = 3650
+TYPES = ("dataset", "map", "chart", "file", "href")
+CATEGORIES = ("salud", "educación", "finanzas", "transporte", "ambiente", "gobierno")
+LICENSES = ("CC BY 4.0", "ODbL", "Dominio público", "CC0")
+RESOURCE_FORMATS = ("CSV", "JSON", "XLSX")
+OFFSET_WINDOW = 10000
+
+
+class PortalState:
+    """Catálogo sintético y contadores compartidos por los hilos del servidor."""
+
+    def __init__(self, datasets: int = 1000, domains: Optional[List[str]] = None, latency: float = 0.0,
+                 error_rate: float = 0.0, burst_every: int = 0, burst_len: int = 0,
+                 retry_after: int = 1, seed: int = 7, compress: bool = False, lean_supported: bool = True,
+                 domain_sizes: Optional[Dict[str, int]] = None):
+        self.datasets = datasets
+        self.domains = domains or ["datos.example.gov"]
+        # Datasets de cada dominio Socrata (default: `datasets` en todos)
+        self.domain_sizes = domain_sizes or {}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_len = burst_len
+        self.retry_after = retry_after
+        self.compress = compress
+        self.lean_supported = lean_supported
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self._burst_left = 0
+        self._scroll_orders: Dict[tuple, tuple] = {}
+
+    def fault(self) -> Optional[int]:
+        """Estado de error a devolver para esta solicitud (None = respuesta normal)."""
+        with self._lock:
+            self.requests += 1
+            if self._burst_left:
+                self._burst_left -= 1
+                self.throttled += 1
+                return 429
+            if self.burst_every and self.requests % self.burst_every == 0:
+                self._burst_left = max(0, self.burst_len - 1)
+                self.throttled += 1
+                return 429
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.errors += 1
+                return 500
+        return None
+
+    def created(self, i: int) -> date:
+        # El índice crece con la fecha de creación: el orden ascendente es el natural
+        return EPOCH + timedelta(days=i * SPAN_DAYS // max(1, self.datasets))
+
+    def size(self, domain: str) -> int:
+        return self.domain_sizes.get(domain, self.datasets)
+
+    def socrata_item(self, domain: str, i: int) -> Dict[str, Any]:
+        created = self.created(i)
+        cats = [CATEGORIES[i % len(CATEGORIES)]]
+        return {
+            "resource": {
+                "name": f"Dataset {i} de {domain}",
+                "id": f"{i:04d}-{zlib.crc32(domain.encode()) % 10000:04d}",
+                "type": TYPES[i % len(TYPES)],
+                "description": f"Descripción sintética del dataset {i}",
+                "createdAt": f"{created.isoformat()}T12:00:00.000Z",
+                "updatedAt": f"{(created + timedelta(days=30)).isoformat()}T12:00:00.000Z",
+            },
+            "classification": {"domain_category": cats[0], "categories": cats, "tags": [f"t{i % 50}"]},
+            "metadata": {"domain": domain, "license": LICENSES[i % len(LICENSES)]},
+            "permalink": f"https://{domain}/d/{i}",
+            "link": f"https://{domain}/dataset/{i}",
+            "view": {"download_count": i % 997},
+        }
+
+    def scroll_order(self, domains: List[str]) -> tuple:
+        """(ids ordenados, [(dominio, índice)] en ese orden) para paginar por scroll_id."""
+        key = tuple(domains)
+        with self._lock:
+            cached = self._scroll_orders.get(key)
+        if cached is None:
+            entries = sorted((self.socrata_item(d, i)["resource"]["id"], d, i)
+                             for d in domains for i in range(self.size(d)))
+            cached = ([e[0] for e in entries], [(e[1], e[2]) for e in entries])
+            with self._lock:
+                self._scroll_orders[key] = cached
+        return cached
+
+    @staticmethod
+    def row_count(i: int) -> int:
+        """Filas del dataset (o del recurso del DataStore) `i`."""
+        return (i * 37) % 5000 + 1
+
+    @staticmethod
+    def resource_size(i: int, j: int) -> int:
+        return 1024 * (i + 1) * (j + 1)
+
+    def socrata_view(self, i: int) -> Dict[str, Any]:
+        """Metadatos de /api/views para el dataset `i`, con la forma según su tipo."""
+        kind = TYPES[i % len(TYPES)]
+        view: Dict[str, Any] = {"id": str(i), "name": f"Dataset {i}", "viewType": "tabular"}
+        if kind == "file":
+            view.update(viewType="blobby", blobMimeType="application/pdf", blobFileSize=self.resource_size(i, 0))
+        elif kind == "map":
+            view.update(viewType="geo", displayType="map")
+        elif kind == "href":
+            access = {"csv": f"https://externo.example/{i}.csv", "xlsx": f"https://externo.example/{i}.xlsx"}
+            view.update(viewType="href", metadata={"accessPoints": access})
+        elif kind == "chart":
+            # Como en Socrata: vista tabular derivada, con displayType propio
+            view.update(displayType="chart", columns=[{"fieldName": "c0"}])
+        else:
+            cached = {"non_null": str(self.row_count(i) - 1), "null": "1"} if i % 2 == 0 else None
+            view["columns"] = [{"fieldName": f"c{k}", "cachedContents": cached} for k in range(3)]
+        return view
+
+    def ckan_item(self, i: int) -> Dict[str, Any]:
+        created = self.created(i)
+        return {
+            "id": f"pkg-{i}",
+            "name": f"paquete-{i}",
+            "title": f"Paquete {i}",
+            "notes": f"Notas sintéticas del paquete {i}",
+            "metadata_created": f"{created.isoformat()}T08:30:00.123456",
+            "metadata_modified": f"{(created + timedelta(days=30)).isoformat()}T08:30:00.123456",
+            "num_resources": i % 5,
+            "license_title": LICENSES[i % len(LICENSES)],
+            "organization": {"title": f"Organización {i % 40}", "name": f"org-{i % 40}",
+                             "description": "Institución pública que publica datos abiertos",
+                             "image_url": f"https://portal.example/img/org-{i % 40}.png"},
+            "groups": [{"title": CATEGORIES[i % len(CATEGORIES)], "name": CATEGORIES[i % len(CATEGORIES)],
+                        "description": "Grupo temático del portal"}],
+            "tags": [{"name": f"t{i % 50}", "display_name": f"t{i % 50}", "state": "active"}],
+            "resources": [{"id": f"res-{i}-{j}", "name": f"Recurso {j}", "format": RESOURCE_FORMATS[j % 3],
+                           "url": f"https://portal.example/dataset/{i}/resource/{j}.csv",
+                           "description": "Archivo de datos del recurso", "created": created.isoformat(),
+                           "size": self.resource_size(i, j), "datastore_active": j == 0}
+                          for j in range(i % 5)],
+            "extras": [{"key": "frecuencia", "value": "mensual"}, {"key": "cobertura", "value": "nacional"}],
+        }
+
+    def ckan_lean_item(self, i: int, fl: str) -> Dict[str, Any]:
+        """Documento del índice Solr restringido a `fl`, como package_search con `fl`."""
+        item = self.ckan_item(i)
+        doc = dict(item, license=item["license_title"], organization=item["organization"]["name"],
+                   groups=[g["name"] for g in item["groups"]], tags=[t["name"] for t in item["tags"]])
+        return {k: doc[k] for k in fl.split(",") if k in doc}
+
+
+def _dataset_index(key: str) -> Optional[int]:
+    """Índice sintético de un id ("0042-1234", "42" o "42-0" -> 42)."""
+    head = key.split("-", 1)[0]
+    return int(head) if head.isdigit() else None
+
+
+def _index_order(n: int, order: str) -> range:
+    return range(n - 1, -1, -1) if order.upper().endswith("DESC") else range(n)
+
+
+class FakePortalHandler(BaseHTTPRequestHandler):
+    state: PortalState = None  # se asigna en la subclase creada por `FakePortal`
+    protocol_version = "HTTP/1.1"
+    # Cabeceras y cuerpo van en escrituras separadas: sin esto Nagle + ACK retardado suman ~40 ms
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if self.state.compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=6)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        state = self.state
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+        if state.latency:
+            time.sleep(state.latency)
+        status = state.fault()
+        if status == 429:
+            return self._send_json(429, {"error": "throttled"}, {"Retry-After": str(state.retry_after)})
+        if status:
+            return self._send_json(status, {"error": "synthetic failure"})
+
+        if url.path == "/api/catalog/v1/domains":
+            results = [{"domain": d, "count": state.size(d)} for d in state.domains]
+            return self._send_json(200, {"results": results, "resultSetSize": len(results)})
+        if url.path == "/api/catalog/v1":
+            domains = [d for d in query.get("domains", "").split(",") if d] or state.domains
+            limit, offset = int(query.get("limit", 100)), int(query.get("offset", 0))
+            order = query.get("order", "")
+            # Concatenación de los catálogos de cada dominio pedido
+            total = sum(state.size(d) for d in domains)
+            if "scroll_id" in query:
+                ids, entries = state.scroll_order(domains)
+                start = bisect.bisect_right(ids, query["scroll_id"]) if query["scroll_id"] else 0
+                picked = [state.socrata_item(d, i) for d, i in entries[start:start + limit]]
+                return self._send_json(200, {"results": picked, "resultSetSize": total})
+            if offset + limit > OFFSET_WINDOW:
+                return self._send_json(400, {"error": f"offset + limit must be <= {OFFSET_WINDOW}"})
+            picked = []
+            base = 0
+            for d in domains:
+                n = state.size(d)
+                for i in range(max(offset, base), min(offset + limit, base + n)):
+                    picked.append(state.socrata_item(d, _index_order(n, order)[i - base]))
+                base += n
+            return self._send_json(200, {"results": picked, "resultSetSize": total})
+        if url.path == "/api/3/action/package_search":
+            start, rows = int(query.get("start", 0)), int(query.get("rows", 10))
+            fl = query.get("fl")
+            if fl and not state.lean_supported:
+                return self._send_json(409, {"success": False, "error": {"fl": ["The input field fl was not expected."],
+                                                                          "__type": "Validation Error"}})
+            indexes = range(start, min(start + rows, state.datasets))
+            results = [state.ckan_lean_item(i, fl) if fl else state.ckan_item(i) for i in indexes]
+            return self._send_json(200, {"success": True, "result": {"count": state.datasets, "results": results}})
+        if url.path.startswith("/api/views/") and url.path.endswith(".json"):
+            i = _dataset_index(url.path[len("/api/views/"):-len(".json")])
+            if i is None:
+                return self._send_json(404, {"error": "not found"})
+            return self._send_json(200, state.socrata_view(i))
+        if url.path.startswith("/resource/") and url.path.endswith(".json"):
+            i = _dataset_index(url.path[len("/resource/"):-len(".json")])
+            if i is None or query.get("$select") != "count(*)":
+                return self._send_json(404, {"error": "not found"})
+            return self._send_json(200, [{"count": str(state.row_count(i))}])
+        if url.path == "/api/3/action/package_show":
+            i = _dataset_index(query.get("id", "").replace("pkg-", "", 1))
+            if i is None or i >= state.datasets:
+                return self._send_json(404, {"success": False, "error": {"message": "Not found"}})
+            return self._send_json(200, {"success": True, "result": state.ckan_item(i)})
+        if url.path == "/api/3/action/datastore_search":
+            i = _dataset_index(query.get("resource_id", "").replace("res-", "", 1))
+            if i is None:
+                return self._send_json(404, {"success": False, "error": {"message": "Not found"}})
+            return self._send_json(200, {"success": True, "result": {"total": state.row_count(i), "records": []}})
+        return self._send_json(404, {"error": "not found"})
+
+    def log_message(self, *args):
+        pass
+
+
+class FakePortal:
+    """Servidor en un hilo de fondo; `url` sirve como base de Socrata y de CKAN."""
+
+    def __init__(self, state: PortalState, host: str = "127.0.0.1", port: int = 0):
+        handler = type("BoundFakePortalHandler", (FakePortalHandler,), {"state": state})
+        self.state = state
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def socrata_base(self) -> str:
+        return self.url + "/api/catalog/v1"
+
+    def __enter__(self) -> "FakePortal":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_portal_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--datasets", type=int, default=2000, help="Datasets por dominio / portal CKAN")
+    parser.add_argument("--domains", type=int, default=3, help="Dominios Socrata sintéticos")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latencia por página en segundos")
+    parser.add_argument("--error-rate", dest="error_rate", type=float, default=0.0,
+                        help="Fracción de respuestas 500")
+    parser.add_argument("--burst-every", dest="burst_every", type=int, default=0,
+                        help="Cada N solicitudes empieza una ráfaga de 429 (0 = nunca)")
+    parser.add_argument("--burst-len", dest="burst_len", type=int, default=3, help="Largo de cada ráfaga de 429")
+    parser.add_argument("--retry-after", dest="retry_after", type=int, default=1,
+                        help="Retry-After (s enteros, como los portales reales) de los 429")
+    parser.add_argument("--gzip", action="store_true", help="Comprimir respuestas si el cliente acepta gzip")
+
+
+def state_from_args(args: argparse.Namespace) -> PortalState:
+    return PortalState(
+        datasets=args.datasets,
+        domains=[f"datos{i}.example.gov" for i in range(args.domains)],
+        latency=args.latency,
+        error_rate=args.error_rate,
+        burst_every=args.burst_every,
+        burst_len=args.burst_len,
+        retry_after=args.retry_after,
+        compress=args.gzip,
+    )
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Portal Socrata/CKAN sintético para benchmarks")
+    add_portal_arguments(ap)
+    ap.add_argument("--port", type=int, default=8765)
+    args = ap.parse_args()
+    with FakePortal(state_from_args(args), port=args.port) as portal:
+        print(f"Sirviendo en {portal.url} (Socrata: {portal.socrata_base}, CKAN: {portal.url})")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,446 @@
+"""
+Cliente asyncio para Socrata Discovery API y CKAN package_search.
+
+Equivalente a `query_catalog` / `query_ckan_catalog` pero sobre un único event loop
+y un pool de conexiones compartido (aiohttp), para tener cientos de páginas en vuelo
+desde un solo proceso sin hilos. Requiere `aiohttp` (dependencia opcional).
+"""
+import asyncio
+import os
+import time
+from datetime import date
+from typing import Any, AsyncGenerator, Dict, List, Optional, Sequence, Tuple
+
+import aiohttp
+
+import socrata_discovery
+from concurrency import get_per_host_limit
+from dates import parse_day
+from enrichment import DEFAULT_WORKERS as ENRICH_WORKERS
+from json_decoder import FieldSpec, decode_page
+from metrics import HTTP, StageTimer, host_of
+from rate_limit import THROTTLE_STATUS, limiter_for
+from sinks import SummarySink
+from transport import RETRY_BACKOFF_FACTOR, RETRY_STATUS, RETRY_TOTAL
+from transport import get_config as get_transport_config
+from socrata_discovery import SOCRATA_ITEM_FIELDS, load_app_token, normalize_result
+from ckan_client import (CKAN_ITEM_FIELDS, CKAN_ITEMS_PATH, build_search_params, lean_params, lean_rejected,
+                         normalize_ckan_result)
+
+
+# Mismos reintentos que las sesiones de `transport`
+RETRY_AFTER_STATUS = frozenset({413, 429, 503})
+
+
+class RetriesExhausted(aiohttp.ClientError):
+    """Se agotaron los reintentos (equivalente a requests.exceptions.RetryError)."""
+
+
+def build_client_session(limit: int = 100, limit_per_host: Optional[int] = None,
+                         timeout: Optional[float] = None) -> aiohttp.ClientSession:
+    """
+    Crea la sesión aiohttp compartida. `limit_per_host` toma por defecto el mismo
+    tope por host que el modo con hilos (`--per-host`); los timeouts de conexión y
+    lectura y el keep-alive salen de `transport.get_config()`. `timeout` acota además
+    la duración total de cada solicitud.
+    """
+    config = get_transport_config()
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host or get_per_host_limit(),
+                                     force_close=not config.keep_alive)
+    client_timeout = aiohttp.ClientTimeout(total=timeout, sock_connect=config.connect_timeout,
+                                           sock_read=config.read_timeout)
+    return aiohttp.ClientSession(connector=connector, timeout=client_timeout)
+
+
+def _backoff(consecutive_errors: int) -> float:
+    # Misma fórmula que urllib3: sin espera en el primer reintento, luego factor * 2^(n-1)
+    if consecutive_errors <= 1:
+        return 0.0
+    return RETRY_BACKOFF_FACTOR * (2 ** (consecutive_errors - 1))
+
+
+def _retry_after(resp: aiohttp.ClientResponse) -> Optional[float]:
+    value = resp.headers.get("Retry-After")
+    if resp.status not in RETRY_AFTER_STATUS or not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _wire_bytes(resp: aiohttp.ClientResponse, body: bytes) -> int:
+    # aiohttp descomprime por su cuenta: con Content-Encoding, Content-Length es lo que viajó
+    if resp.headers.get("Content-Encoding") and resp.content_length is not None:
+        return resp.content_length
+    return len(body)
+
+
+def _update_http_stats(stats: Optional[Dict[str, int]], retries_used: int, throttled: int = 0,
+                       wire: int = 0, decoded: int = 0) -> None:
+    if stats is None:
+        return
+    stats["requests"] = stats.get("requests", 0) + 1
+    stats["bytes_wire"] = stats.get("bytes_wire", 0) + wire
+    stats["bytes_decoded"] = stats.get("bytes_decoded", 0) + decoded
+    stats["retries"] = stats.get("retries", 0) + retries_used
+    if throttled:
+        stats["throttled"] = stats.get("throttled", 0) + throttled
+
+
+async def _aget_json(session: aiohttp.ClientSession, url: str, params: Dict[str, Any],
+                     headers: Optional[Dict[str, str]] = None,
+                     stats: Optional[Dict[str, int]] = None,
+                     items_path: Optional[Sequence[str]] = None, fields: FieldSpec = None) -> Any:
+    """
+    GET con la semántica de reintentos de `transport.build_session`: hasta 3 reintentos ante
+    errores de conexión o estados 429/5xx, con backoff exponencial y respeto de Retry-After.
+    Cada intento toma un token del limitador compartido del host (`rate_limit`).
+    Lanza ClientResponseError en otros estados >= 400 y RetriesExhausted al agotar reintentos.
+    El cuerpo se decodifica con `json_decoder.decode_page`, proyectando los items de `items_path`.
+    """
+    retries = 0
+    throttled = 0
+    causes: List[str] = []
+    host = host_of(url)
+    limiter = limiter_for(url, has_token=bool(headers and "X-App-Token" in headers))
+    # aiohttp no acepta None ni bool en query params
+    query = {k: str(v) for k, v in params.items() if v is not None}
+    started = None
+    while True:
+        wait = limiter.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        attempt_t = time.perf_counter()
+        started = started or attempt_t
+        try:
+            async with session.get(url, params=query, headers=headers) as resp:
+                ttfb = time.perf_counter() - attempt_t
+                if resp.status in RETRY_STATUS:
+                    if retries >= RETRY_TOTAL:
+                        HTTP.observe(host, resp.status, time.perf_counter() - started, ttfb, 0, causes)
+                        raise RetriesExhausted(f"{url}: demasiadas respuestas {resp.status}")
+                    retries += 1
+                    causes.append(str(resp.status))
+                    delay = _retry_after(resp)
+                    if resp.status in THROTTLE_STATUS:
+                        # El Retry-After bloquea el host en el limitador (lo espera el próximo reserve)
+                        throttled += 1
+                        limiter.on_throttle(delay)
+                        if delay is None:
+                            await asyncio.sleep(_backoff(retries))
+                    else:
+                        await asyncio.sleep(_backoff(retries) if delay is None else delay)
+                    continue
+                limiter.on_success()
+                body = await resp.read()
+                wire = _wire_bytes(resp, body)
+                HTTP.observe(host, resp.status, time.perf_counter() - started, ttfb, len(body), causes, wire)
+                _update_http_stats(stats, retries, throttled, wire, len(body))
+                resp.raise_for_status()
+                decode_t = time.perf_counter()
+                data = decode_page(body, items_path, fields)
+                HTTP.observe_decode(host, time.perf_counter() - decode_t)
+                return data
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if retries >= RETRY_TOTAL:
+                raise RetriesExhausted(f"{url}: {e}") from e
+            retries += 1
+            causes.append(type(e).__name__)
+            await asyncio.sleep(_backoff(retries))
+
+
+async def aquery_catalog(domain: Optional[str] = None,
+                         q: Optional[str] = None,
+                         categories: Optional[List[str]] = None,
+                         limit: int = 100,
+                         max_pages: Optional[int] = 50,
+                         app_token: Optional[str] = None,
+                         session: Optional[aiohttp.ClientSession] = None,
+                         stats: Optional[Dict[str, int]] = None,
+                         published_from: Optional[str] = None,
+                         published_to: Optional[str] = None) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Versión async de `query_catalog` (mismos parámetros y mismo manejo de errores).
+    Pagina por scroll salvo que `set_pagination("offset")` pida offset, y corta con
+    `resultSetSize` o con una página incompleta. La ventana published_from/published_to
+    se aplica como en `query_catalog`: con published_to se pagina por offset en orden de
+    createdAt ascendente y se corta al pasarla.
+    """
+    headers = {}
+    token = app_token or load_app_token()
+    if token:
+        headers["X-App-Token"] = token
+
+    params: Dict[str, Any] = {
+        "limit": max(1, min(limit, 100)),
+        "offset": 0,
+    }
+    if domain:
+        params["domains"] = domain
+    if q:
+        params["q"] = q
+    if categories:
+        params["categories"] = ",".join(categories)
+    date_from = date.fromisoformat(published_from) if published_from else None
+    date_to = date.fromisoformat(published_to) if published_to else None
+    if date_to:
+        params["order"] = "createdAt"
+    scroll = socrata_discovery.pagination_mode() != "offset" and "order" not in params
+    if scroll:
+        del params["offset"]
+        params["scroll_id"] = ""
+    seen = 0
+
+    local_session = session or build_client_session()
+    try:
+        page = 0
+        while max_pages is None or page < max_pages:
+            page += 1
+            try:
+                data = await _aget_json(local_session, socrata_discovery.DISCOVERY_BASE, params,
+                                        headers=headers, stats=stats, items_path=("results",),
+                                        fields=SOCRATA_ITEM_FIELDS)
+            except aiohttp.ClientResponseError as e:
+                if e.status == 404:
+                    print(f"ADVERTENCIA: Dominio '{domain}' no encontrado en Discovery API (404)")
+                    break
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"ERROR: Fallo al consultar dominio '{domain}': {e}")
+                break
+
+            results = data.get("results", [])
+            if not results:
+                break
+            for item in results:
+                if date_to:
+                    created = parse_day(item.get("resource", {}).get("createdAt"))
+                    if created and created > date_to:
+                        return
+                if (date_from or date_to) and not socrata_discovery._in_window(
+                        socrata_discovery._item_publication_day(item), date_from, date_to):
+                    continue
+                yield item
+            seen += len(results)
+            total = data.get("resultSetSize")
+            if len(results) < params["limit"] or (isinstance(total, int) and seen >= total):
+                break
+            if scroll:
+                last_id = results[-1].get("resource", {}).get("id")
+                if not last_id or last_id == params["scroll_id"]:
+                    break
+                params["scroll_id"] = last_id
+            else:
+                params["offset"] += params["limit"]
+                if params["offset"] + params["limit"] > socrata_discovery.OFFSET_WINDOW:
+                    break
+    finally:
+        if session is None:
+            await local_session.close()
+
+
+async def _aget_ckan_page(session: aiohttp.ClientSession, endpoint: str, params: Dict[str, Any],
+                          stats: Optional[Dict[str, int]], base_url: str) -> Optional[Dict[str, Any]]:
+    try:
+        data = await _aget_json(session, endpoint, lean_params(endpoint, params), stats=stats,
+                                items_path=CKAN_ITEMS_PATH, fields=CKAN_ITEM_FIELDS)
+    except aiohttp.ClientResponseError as e:
+        if not lean_rejected(endpoint, params, e.status):
+            raise
+        data = await _aget_json(session, endpoint, lean_params(endpoint, params), stats=stats,
+                                items_path=CKAN_ITEMS_PATH, fields=CKAN_ITEM_FIELDS)
+    if not data.get("success", False):
+        print(f"ADVERTENCIA: CKAN API retornó success=false para {base_url}")
+        return None
+    return data.get("result", {})
+
+
+async def aquery_ckan_catalog(base_url: str = "https://datos.gob.mx",
+                              q: Optional[str] = None,
+                              organization: Optional[str] = None,
+                              groups: Optional[List[str]] = None,
+                              start: int = 0,
+                              rows: int = 100,
+                              max_pages: int = 50,
+                              session: Optional[aiohttp.ClientSession] = None,
+                              stats: Optional[Dict[str, int]] = None,
+                              prefetch: int = 0,
+                              created_from: Optional[str] = None,
+                              created_to: Optional[str] = None) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Versión async de `query_ckan_catalog`. Con prefetch > 0 las páginas restantes
+    se piden como tareas concurrentes (ventana de `prefetch`) y se entregan en orden.
+    """
+    endpoint = f"{base_url}/api/3/action/package_search"
+    params = build_search_params(q=q, organization=organization, groups=groups, start=start, rows=rows,
+                                 created_from=created_from, created_to=created_to)
+
+    local_session = session or build_client_session()
+    pending: List[asyncio.Task] = []
+    try:
+        result = await _aget_ckan_page(local_session, endpoint, params, stats, base_url)
+        if result is None:
+            return
+        count = result.get("count", 0)
+        offsets = list(range(params["start"] + params["rows"], count, params["rows"]))[:max_pages - 1]
+        if not result.get("results"):
+            return
+        for item in result["results"]:
+            yield item
+
+        window = max(1, prefetch)
+        next_idx = 0
+        while next_idx < len(offsets) or pending:
+            while next_idx < len(offsets) and len(pending) < window:
+                page_params = dict(params, start=offsets[next_idx])
+                pending.append(asyncio.ensure_future(
+                    _aget_ckan_page(local_session, endpoint, page_params, stats, base_url)))
+                next_idx += 1
+            result = await pending.pop(0)
+            if result is None or not result.get("results"):
+                break
+            for item in result["results"]:
+                yield item
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"ERROR: Fallo al consultar CKAN {base_url}: {e}")
+    finally:
+        for task in pending:
+            task.cancel()
+        if session is None:
+            await local_session.close()
+
+
+async def afetch_by_domains(domains: List[str], q: Optional[str] = None, categories: Optional[List[str]] = None,
+                            per_domain_limit: int = 500, app_token: Optional[str] = None,
+                            stats: Optional[Dict[str, int]] = None,
+                            session: Optional[aiohttp.ClientSession] = None,
+                            published_from: Optional[str] = None,
+                            published_to: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Versión async de `fetch_by_domains`: todos los dominios se recorren concurrentemente."""
+    local_session = session or build_client_session()
+
+    async def one(domain: str) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        items = aquery_catalog(domain=domain, q=q, categories=categories, limit=100, max_pages=None,
+                               app_token=app_token, session=local_session, stats=stats,
+                               published_from=published_from, published_to=published_to)
+        try:
+            async for item in items:
+                rows.append(normalize_result(item))
+                if len(rows) >= per_domain_limit:
+                    break
+        finally:
+            await items.aclose()
+        return rows
+
+    try:
+        per_domain = await asyncio.gather(*(one(d) for d in domains))
+    finally:
+        if session is None:
+            await local_session.close()
+    return [row for rows in per_domain for row in rows]
+
+
+async def afetch_ckan_by_config(base_url: str = "https://datos.gob.mx",
+                                q: Optional[str] = None,
+                                groups: Optional[List[str]] = None,
+                                per_query_limit: int = 1000,
+                                stats: Optional[Dict[str, int]] = None,
+                                prefetch: int = 0,
+                                session: Optional[aiohttp.ClientSession] = None,
+                                created_from: Optional[str] = None,
+                                created_to: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Versión async de `fetch_ckan_by_config`."""
+    all_rows: List[Dict[str, Any]] = []
+    items = aquery_ckan_catalog(base_url=base_url, q=q, groups=groups, rows=100, max_pages=100,
+                                session=session, stats=stats, prefetch=prefetch,
+                                created_from=created_from, created_to=created_to)
+    try:
+        async for item in items:
+            all_rows.append(normalize_ckan_result(item, base_url))
+            if len(all_rows) >= per_query_limit:
+                break
+    finally:
+        # Cancela de inmediato las páginas pendientes si se cortó por límite
+        await items.aclose()
+    return all_rows
+
+
+async def arun_for_country(country: str, config: Dict, q: Optional[str] = None,
+                           categories: Optional[List[str]] = None, per_domain_limit: int = 1000,
+                           published_from: Optional[str] = None, published_to: Optional[str] = None,
+                           with_metrics: bool = False, prefetch: int = 0,
+                           session: Optional[aiohttp.ClientSession] = None,
+                           formats: Sequence[str] = ("json", "csv"), index_db: Optional[str] = None,
+                           near_dupes: bool = False, summary: Optional[SummarySink] = None,
+                           enrich: bool = False, enrich_workers: int = ENRICH_WORKERS):
+    """
+    Versión async de `run_for_country`. La descarga usa la sesión compartida; la
+    deduplicación, filtro y exportación reutilizan el mismo código que el modo sync
+    y corren en un hilo para no bloquear el event loop. La etapa fetch incluye la
+    normalización (el event loop intercala varios países y no se separan).
+    El enriquecimiento (`enrich`) usa el cliente sync con su propio pool de hilos,
+    dentro del mismo hilo de exportación.
+    """
+    from run_discovery import _finalize_country, _iso_day
+
+    platform = config.get("platform", "socrata")
+    start_t = time.perf_counter()
+    http_stats = {"requests": 0, "retries": 0}
+
+    if platform == "socrata":
+        rows = await afetch_by_domains(config.get("domains", []), q=q, categories=categories,
+                                       per_domain_limit=per_domain_limit, stats=http_stats, session=session,
+                                       published_from=_iso_day(published_from), published_to=_iso_day(published_to))
+    elif platform == "ckan":
+        rows = await afetch_ckan_by_config(base_url=config.get("base_url", "https://datos.gob.mx"), q=q,
+                                           groups=categories or None, per_query_limit=per_domain_limit,
+                                           stats=http_stats, prefetch=prefetch, session=session,
+                                           created_from=_iso_day(published_from), created_to=_iso_day(published_to))
+    else:
+        print(f"ADVERTENCIA: Plataforma '{platform}' no soportada para {country}")
+        rows = []
+
+    timer = StageTimer()
+    timer.add("fetch", time.perf_counter() - start_t)
+    return await asyncio.to_thread(_finalize_country, country, platform, rows, http_stats, start_t,
+                                   published_from, published_to, with_metrics, formats, timer, index_db,
+                                   near_dupes, summary, enrich, enrich_workers)
+
+
+async def arun_all(countries: Dict[str, Dict], **kwargs) -> List[Tuple[str, int, Dict]]:
+    """
+    Procesa todos los países en un solo event loop compartiendo el pool de conexiones.
+    Con más de un país escribe también el resumen consolidado, como `run_all`.
+    """
+    from run_discovery import DEFAULT_FORMATS, save_rollup
+
+    summaries = {c: SummarySink(c, cfg.get("platform", "socrata")) for c, cfg in countries.items()}
+    async with build_client_session() as session:
+        async def one(country: str, config: Dict):
+            count, metrics = await arun_for_country(country, config, with_metrics=True, session=session,
+                                                    summary=summaries[country], **kwargs)
+            return country, count, metrics
+
+        results = list(await asyncio.gather(*(one(c, cfg) for c, cfg in countries.items())))
+    if len(summaries) > 1:
+        await asyncio.to_thread(save_rollup, summaries.values(), kwargs.get("formats", DEFAULT_FORMATS))
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    from socrata_discovery import save_json, save_csv
+
+    parser = argparse.ArgumentParser(description="Consultar Discovery API de Socrata (async) por dominios")
+    parser.add_argument("--domains", nargs="*", help="Lista de dominios a consultar")
+    parser.add_argument("--limit", type=int, default=300, help="Límite por dominio")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "output", "preview_async"),
+                        help="Ruta base de salida (sin extensión)")
+    args = parser.parse_args()
+
+    rows = asyncio.run(afetch_by_domains(args.domains or ["www.datos.gov.co"], per_domain_limit=args.limit))
+    save_json(args.out + ".json", rows)
+    save_csv(args.out + ".csv", rows)
+    print(f"Guardado: {args.out}.json y {args.out}.csv ({len(rows)} filas)")
@@ -0,0 +1,236 @@
+"""
+Diferencias entre dos catálogos exportados (p.ej. `<pais>_catalog.json` de dos corridas).
+
+Cada fila se identifica por (id, permalink), la clave de la deduplicación, y se resume en
+una huella de contenido: el `hash()` de 64 bits (SipHash) de los campos comparados. Las
+huellas solo se comparan dentro del mismo proceso, así que no hace falta un hash estable
+entre ejecuciones, y este es varias veces más rápido que uno de hashlib. El catálogo
+anterior se recorre tres veces como máximo y el nuevo una sola, siempre en streaming
+(`sinks.iter_catalog`, cualquier formato exportado):
+
+1. Anterior: se arman dos arreglos ordenados de enteros de 64 bits (hash de la clave y
+   huella). Ocupan unos 17 bytes por fila (unos 60 mientras se ordenan), en vez de un
+   dict de filas completas.
+2. Nuevo: cada fila se busca por bisección en el arreglo de claves. Si no está, es
+   `added` y se emite en el acto. Si la huella difiere, la fila nueva queda en memoria
+   hasta el paso 3 (solo las cambiadas).
+3. Anterior de nuevo, solo si hace falta: las filas que no aparecieron en el nuevo son
+   `removed`; para las cambiadas se comparan campo a campo con la nueva.
+
+El costo es O(n log n) por las bisecciones (en C) y el orden inicial, y la memoria queda
+acotada por las claves del catálogo anterior más las filas cambiadas. Una colisión de 64
+bits entre claves distintas es despreciable (~1e-8 con un millón de filas).
+
+Los valores se comparan como texto (None y "" son iguales, las listas se unen con coma) y
+las fechas por instante y no por su forma ("...Z", "+00:00", con o sin hora), así que se
+pueden comparar un CSV, un JSON y un Parquet del mismo catálogo.
+
+Uso:
+    python catalog_diff.py output/anterior/chile_catalog.json output/chile_catalog.json --ignore download_count
+"""
+import argparse
+import json
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from enrichment import ENRICH_FIELDS
+from near_dupes import NEAR_DUPE_FIELDS
+from sinks import CATALOG_FIELDS, iter_catalog
+from watermarks import parse_timestamp
+
+
+DIFF_FIELDS: Tuple[str, ...] = tuple(CATALOG_FIELDS) + ENRICH_FIELDS + NEAR_DUPE_FIELDS
+CHANGES = ("added", "removed", "changed")
+_MASK64 = (1 << 64) - 1
+# JSON y CSV guardan las fechas como vienen del portal; Parquet y Arrow como timestamps
+TIMESTAMP_FIELDS = frozenset({"publication_date", "updated_at"})
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ",".join(str(v) for v in value)
+    return str(value)
+
+
+def timestamp_key(value: Any) -> Any:
+    """
+    Fecha como datetime UTC, para comparar y hashear el instante y no su forma
+    ("...Z", "+00:00", con o sin hora). Lo que no es fecha queda como texto.
+    """
+    if not isinstance(value, str):
+        return _text(value)
+    try:
+        # Camino rápido (Python 3.11+ acepta "Z"); parse_timestamp cubre el resto
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return parse_timestamp(value) or value
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+@lru_cache(maxsize=None)
+def _timestamp_positions(fields: Tuple[str, ...]) -> Tuple[int, ...]:
+    return tuple(i for i, name in enumerate(fields) if name in TIMESTAMP_FIELDS)
+
+
+def _field_value(name: str, value: Any) -> Any:
+    return timestamp_key(value) if name in TIMESTAMP_FIELDS else _text(value)
+
+
+def row_key(row: Any) -> Tuple[str, str]:
+    return _text(row.get("id")), _text(row.get("permalink"))
+
+
+def key_hash(row: Any) -> int:
+    return hash(row_key(row)) & _MASK64
+
+
+def fingerprint(row: Any, fields: Sequence[str] = DIFF_FIELDS) -> int:
+    """Huella de 64 bits de los campos `fields` de la fila (válida dentro del proceso)."""
+    # Los None y str se resuelven en línea: son casi todos los valores y evitan una llamada
+    values = ["" if v is None else v if type(v) is str else _text(v) for v in map(row.get, fields)]
+    for i in _timestamp_positions(tuple(fields)):
+        if values[i]:
+            values[i] = timestamp_key(values[i])
+    return hash(tuple(values)) & _MASK64
+
+
+def changed_fields(before: Any, after: Any, fields: Sequence[str] = DIFF_FIELDS) -> List[str]:
+    return [f for f in fields if _field_value(f, before.get(f)) != _field_value(f, after.get(f))]
+
+
+def _entry(change: str, row: Any) -> Dict[str, Any]:
+    entry_id, permalink = row_key(row)
+    return {"change": change, "id": entry_id, "permalink": permalink, "name": row.get("name")}
+
+
+class _FingerprintIndex:
+    """Claves y huellas del catálogo anterior en dos `array('Q')` ordenados por clave."""
+
+    def __init__(self, rows: Iterator[Any], fields: Sequence[str]):
+        # clave << 64 | huella: un solo sort de enteros ordena ambos arreglos a la vez
+        packed = sorted(key_hash(r) << 64 | fingerprint(r, fields) for r in rows)
+        self.keys = array("Q", (p >> 64 for p in packed))
+        self.prints = array("Q", (p & _MASK64 for p in packed))
+        del packed
+        # 0: sin ver en el nuevo, 1: igual, 2: cambiada, 3: ya emitida en el paso 3
+        self.state = bytearray(len(self.keys))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def find(self, key: int) -> int:
+        """Posición de `key` o -1. Con claves repetidas vale la primera."""
+        i = bisect_left(self.keys, key)
+        return i if i < len(self.keys) and self.keys[i] == key else -1
+
+
+def diff_catalogs(old_path: str, new_path: str, fields: Sequence[str] = DIFF_FIELDS,
+                  ignore: Sequence[str] = (), stats: Optional[Dict[str, int]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Compara dos catálogos exportados y emite un dict por diferencia: `change` (added,
+    removed o changed), `id`, `permalink` y `name`. Las `changed` traen además `fields` y
+    los valores `before` / `after` de esos campos. Primero salen las altas, en el orden
+    del catálogo nuevo; después bajas y cambios, en el orden del anterior.
+    `stats` recibe los conteos por tipo y las filas de cada catálogo al terminar.
+    """
+    ignored = set(ignore)
+    fields = tuple(f for f in fields if f not in ignored)
+    index = _FingerprintIndex(iter_catalog(old_path), fields)
+    counts: Counter = Counter({c: 0 for c in CHANGES})
+    new_rows = 0
+    # Solo las filas cambiadas, por posición en el índice, hasta conocer su versión anterior
+    changed: Dict[int, Any] = {}
+    for row in iter_catalog(new_path):
+        new_rows += 1
+        i = index.find(key_hash(row))
+        if i < 0:
+            counts["added"] += 1
+            yield _entry("added", row)
+        elif index.state[i] == 0:
+            if index.prints[i] == fingerprint(row, fields):
+                index.state[i] = 1
+            else:
+                index.state[i] = 2
+                changed[i] = row
+        # Clave repetida en el catálogo nuevo: cuenta la primera aparición
+
+    if changed or index.state.count(0):
+        for row in iter_catalog(old_path):
+            i = index.find(key_hash(row))
+            state = index.state[i] if i >= 0 else 3
+            if state == 0:
+                counts["removed"] += 1
+                yield _entry("removed", row)
+            elif state == 2:
+                after = changed.pop(i)
+                names = changed_fields(row, after, fields)
+                if names:
+                    counts["changed"] += 1
+                    entry = _entry("changed", after)
+                    entry["fields"] = names
+                    entry["before"] = {f: row.get(f) for f in names}
+                    entry["after"] = {f: after.get(f) for f in names}
+                    yield entry
+            else:
+                continue
+            index.state[i] = 3
+    if stats is not None:
+        stats.update(counts)
+        stats["old_rows"] = len(index)
+        stats["new_rows"] = new_rows
+
+
+def save_diff(path: str, entries: Iterator[Dict[str, Any]]) -> int:
+    """Escribe las diferencias como NDJSON (una por línea); devuelve cuántas escribió."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    written = 0
+    with open(path + ".part", "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False))
+            f.write("\n")
+            written += 1
+    os.replace(path + ".part", path)
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Datasets agregados, eliminados y modificados entre dos catálogos")
+    ap.add_argument("old", help="Catálogo anterior (.json, .ndjson, .csv, .parquet o .arrows)")
+    ap.add_argument("new", help="Catálogo nuevo")
+    ap.add_argument("--out", default=None, help="Guardar las diferencias en NDJSON (default: stdout)")
+    ap.add_argument("--ignore", nargs="+", default=[],
+                    help="Campos que no cuentan como cambio (p.ej. download_count)")
+    ap.add_argument("--summary", action="store_true", help="Mostrar solo los conteos")
+    args = ap.parse_args(argv)
+
+    for path in (args.old, args.new):
+        if not os.path.exists(path):
+            raise SystemExit(f"No existe el catálogo {path}")
+    unknown = sorted(set(args.ignore) - set(DIFF_FIELDS))
+    if unknown:
+        print(f"ADVERTENCIA: campos desconocidos en --ignore: {', '.join(unknown)}")
+    stats: Dict[str, int] = {}
+    entries = diff_catalogs(args.old, args.new, ignore=args.ignore, stats=stats)
+    if args.out:
+        save_diff(args.out, entries)
+    elif args.summary:
+        for _ in entries:
+            pass
+    else:
+        for entry in entries:
+            sys.stdout.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    print(f"{stats['old_rows']} -> {stats['new_rows']} filas: {stats['added']} agregadas, "
+          f"{stats['removed']} eliminadas, {stats['changed']} modificadas",
+          file=sys.stderr if not args.out and not args.summary else sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
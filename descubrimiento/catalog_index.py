@@ -0,0 +1,331 @@
+"""
+Índice local del catálogo en SQLite, para búsquedas exploratorias sin consultar los portales.
+
+- `IndexSink` se usa como un sink más de `_finalize_country`. Hace upsert de cada fila
+  normalizada en la tabla `datasets`, cuya clave es (country, id, permalink), la misma
+  de la deduplicación.
+- Hay búsqueda de texto completo (FTS5) sobre name, description y tags. Se ignoran
+  tildes y mayúsculas ("educacion" encuentra "Educación").
+- Hay índices por país, dominio, categoría (tabla `dataset_categories`, una fila por
+  categoría) y fecha de publicación.
+- Las filas que dejan de aparecer en una corrida no se borran: como las corridas
+  pueden estar filtradas por q, categorías o fechas, su ausencia no prueba que el
+  dataset haya desaparecido del portal. `indexed_at` indica cuándo se vio cada fila
+  por última vez.
+
+Consulta desde la línea de comandos:
+    python catalog_index.py salud --country Chile México --from 2023-01-01
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from dates import parse_day
+
+
+HERE = os.path.dirname(__file__)
+DEFAULT_INDEX_DB = os.path.join(HERE, "output", "catalog.db")
+# Filas por transacción: varios países escriben a la vez y cada lote toma el lock de escritura
+BATCH_SIZE = 500
+BUSY_TIMEOUT_MS = 60000
+
+INDEX_FIELDS: Tuple[str, ...] = (
+    "id", "permalink", "name", "description", "type", "domain", "link", "domain_category",
+    "categories", "tags", "download_count", "publication_date", "updated_at", "num_resources",
+    "license", "organization",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    country TEXT NOT NULL,
+    id TEXT NOT NULL DEFAULT '',
+    permalink TEXT NOT NULL DEFAULT '',
+    name TEXT,
+    description TEXT,
+    type TEXT,
+    domain TEXT,
+    link TEXT,
+    domain_category TEXT,
+    categories TEXT,
+    tags TEXT,
+    download_count INTEGER,
+    publication_date TEXT,
+    published_on TEXT,
+    updated_at TEXT,
+    num_resources INTEGER,
+    license TEXT,
+    organization TEXT,
+    indexed_at TEXT NOT NULL,
+    UNIQUE (country, id, permalink)
+);
+CREATE INDEX IF NOT EXISTS idx_datasets_country ON datasets (country);
+CREATE INDEX IF NOT EXISTS idx_datasets_domain ON datasets (domain);
+CREATE INDEX IF NOT EXISTS idx_datasets_published_on ON datasets (published_on);
+CREATE TABLE IF NOT EXISTS dataset_categories (
+    dataset_rowid INTEGER NOT NULL,
+    category TEXT NOT NULL COLLATE NOCASE,
+    PRIMARY KEY (category, dataset_rowid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_dataset_categories_rowid ON dataset_categories (dataset_rowid);
+CREATE VIRTUAL TABLE IF NOT EXISTS datasets_fts USING fts5 (
+    name, description, tags,
+    content='datasets', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS datasets_ai AFTER INSERT ON datasets BEGIN
+    INSERT INTO datasets_fts (rowid, name, description, tags)
+    VALUES (new.rowid, new.name, new.description, new.tags);
+END;
+CREATE TRIGGER IF NOT EXISTS datasets_ad AFTER DELETE ON datasets BEGIN
+    INSERT INTO datasets_fts (datasets_fts, rowid, name, description, tags)
+    VALUES ('delete', old.rowid, old.name, old.description, old.tags);
+    DELETE FROM dataset_categories WHERE dataset_rowid = old.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS datasets_au AFTER UPDATE OF name, description, tags ON datasets BEGIN
+    INSERT INTO datasets_fts (datasets_fts, rowid, name, description, tags)
+    VALUES ('delete', old.rowid, old.name, old.description, old.tags);
+    INSERT INTO datasets_fts (rowid, name, description, tags)
+    VALUES (new.rowid, new.name, new.description, new.tags);
+END;
+"""
+
+_UPSERT = (
+    "INSERT INTO datasets (country, {cols}, published_on, indexed_at) "
+    "VALUES (?, {marks}, ?, ?) "
+    "ON CONFLICT (country, id, permalink) DO UPDATE SET {updates}, "
+    "published_on = excluded.published_on, indexed_at = excluded.indexed_at"
+).format(
+    cols=", ".join(INDEX_FIELDS),
+    marks=", ".join("?" for _ in INDEX_FIELDS),
+    updates=", ".join(f"{c} = excluded.{c}" for c in INDEX_FIELDS if c not in ("id", "permalink")),
+)
+
+_schema_lock = threading.Lock()
+
+
+def connect(path: str = DEFAULT_INDEX_DB) -> sqlite3.Connection:
+    """Abre (y crea si hace falta) el índice. Una conexión por hilo."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.row_factory = sqlite3.Row
+    with _schema_lock:
+        # WAL: las búsquedas no bloquean a los países que están escribiendo
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.executescript(SCHEMA)
+    return conn
+
+
+def _to_int(value: Any) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return ",".join(str(v) for v in value)
+    return str(value)
+
+
+def _split_categories(row: Dict[str, Any]) -> List[str]:
+    cats = _text(row.get("categories")) or ""
+    found = [c.strip() for c in cats.split(",") if c.strip()]
+    main = row.get("domain_category")
+    if main and main not in found:
+        found.append(str(main))
+    return found
+
+
+def upsert_rows(conn: sqlite3.Connection, country: str, rows: Iterable[Dict[str, Any]],
+                indexed_at: Optional[str] = None) -> int:
+    """Inserta o actualiza `rows` del país en una sola transacción. Devuelve cuántas filas."""
+    indexed_at = indexed_at or datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    count = 0
+    with conn:
+        for row in rows:
+            values = [country]
+            for field in INDEX_FIELDS:
+                value = row.get(field)
+                if field in ("download_count", "num_resources"):
+                    values.append(_to_int(value))
+                elif field in ("id", "permalink"):
+                    values.append(_text(value) or "")
+                else:
+                    values.append(_text(value))
+            day = parse_day(row.get("publication_date"))
+            values.append(day.isoformat() if day else None)
+            values.append(indexed_at)
+            conn.execute(_UPSERT, values)
+            rowid = conn.execute(
+                "SELECT rowid FROM datasets WHERE country = ? AND id = ? AND permalink = ?",
+                (country, values[1], values[2]),
+            ).fetchone()[0]
+            conn.execute("DELETE FROM dataset_categories WHERE dataset_rowid = ?", (rowid,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO dataset_categories (dataset_rowid, category) VALUES (?, ?)",
+                [(rowid, c) for c in _split_categories(row)],
+            )
+            count += 1
+    return count
+
+
+class IndexSink:
+    """
+    Sink que hace upsert de las filas de un país en el índice SQLite, por lotes de
+    `BATCH_SIZE`. Cada lote es una transacción corta para no frenar a los demás países.
+    Si la corrida falla, `abort` descarta el lote pendiente y deja los ya guardados, que
+    son filas válidas.
+    """
+
+    def __init__(self, path: str, country: str, batch_size: int = BATCH_SIZE):
+        self.path = path
+        self.country = country
+        self.batch_size = batch_size
+        self.count = 0
+        self._indexed_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self._batch: List[Dict[str, Any]] = []
+        self._conn: Optional[sqlite3.Connection] = connect(path)
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self._batch.append(row)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._batch:
+            self.count += upsert_rows(self._conn, self.country, self._batch, self._indexed_at)
+            self._batch = []
+
+    def close(self) -> None:
+        if self._conn is None:
+            return
+        self._flush()
+        self._conn.close()
+        self._conn = None
+
+    def abort(self) -> None:
+        if self._conn is None:
+            return
+        self._batch = []
+        self._conn.close()
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def _fts_query(text: str) -> str:
+    """Convierte texto libre en una consulta FTS5: todos los términos, cada uno como prefijo."""
+    terms = [t.replace('"', "") for t in text.split()]
+    return " ".join(f'"{t}"*' for t in terms if t)
+
+
+def search(conn: sqlite3.Connection, text: Optional[str] = None, countries: Optional[Sequence[str]] = None,
+           domains: Optional[Sequence[str]] = None, categories: Optional[Sequence[str]] = None,
+           published_from: Optional[str] = None, published_to: Optional[str] = None,
+           limit: int = 50) -> List[Dict[str, Any]]:
+    """
+    Busca en el índice. `text` se busca en name/description/tags (ordenado por
+    relevancia); los demás filtros se combinan con AND y cada lista con OR.
+    """
+    where: List[str] = []
+    params: List[Any] = []
+    if text and _fts_query(text):
+        sql = ("SELECT d.* FROM datasets_fts JOIN datasets d ON d.rowid = datasets_fts.rowid "
+               "WHERE datasets_fts MATCH ?")
+        params.append(_fts_query(text))
+        order = "bm25(datasets_fts)"
+    else:
+        sql = "SELECT d.* FROM datasets d WHERE 1"
+        order = "d.published_on DESC"
+    for column, values in (("d.country", countries), ("d.domain", domains)):
+        if values:
+            where.append(f"{column} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+    if categories:
+        where.append("d.rowid IN (SELECT dataset_rowid FROM dataset_categories WHERE category IN "
+                     f"({', '.join('?' for _ in categories)}))")
+        params.extend(categories)
+    day_from, day_to = parse_day(published_from), parse_day(published_to)
+    if day_from:
+        where.append("d.published_on >= ?")
+        params.append(day_from.isoformat())
+    if day_to:
+        where.append("d.published_on <= ?")
+        params.append(day_to.isoformat())
+    for clause in where:
+        sql += " AND " + clause
+    sql += f" ORDER BY {order} LIMIT ?"
+    params.append(limit)
+    return [dict(r) for r in conn.execute(sql, params)]
+
+
+def count_by(conn: sqlite3.Connection, column: str) -> List[Tuple[str, int]]:
+    """Conteo de datasets indexados por país, dominio o tipo."""
+    if column not in ("country", "domain", "type"):
+        raise ValueError(f"Columna de agrupación no soportada: {column}")
+    sql = f"SELECT {column}, COUNT(*) FROM datasets GROUP BY {column} ORDER BY COUNT(*) DESC"
+    return [(k, n) for k, n in conn.execute(sql)]
+
+
+def _print_table(rows: List[Dict[str, Any]]) -> None:
+    for r in rows:
+        print(f"[{r['country']}] {r['published_on'] or '----------'}  {r['name']}")
+        print(f"    {r['domain'] or ''}  {r['categories'] or ''}  {r['permalink'] or r['link'] or ''}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Buscar en el índice local de datasets (sin consultar los portales)")
+    ap.add_argument("text", nargs="*", help="Términos a buscar en nombre, descripción y tags")
+    ap.add_argument("--db", default=DEFAULT_INDEX_DB, help="Ruta del índice SQLite (default: output/catalog.db)")
+    ap.add_argument("--country", nargs="+", default=None, help="Países (como en latam_domains.json)")
+    ap.add_argument("--domain", nargs="+", default=None, help="Dominios del portal")
+    ap.add_argument("--category", nargs="+", default=None, help="Categorías (sin distinguir mayúsculas)")
+    ap.add_argument("--from", dest="published_from", default=None, help="Publicados desde (YYYY-MM-DD)")
+    ap.add_argument("--to", dest="published_to", default=None, help="Publicados hasta (YYYY-MM-DD)")
+    ap.add_argument("--limit", type=int, default=50)
+    ap.add_argument("--count-by", dest="count_by", choices=("country", "domain", "type"), default=None,
+                    help="En vez de listar datasets, contar los indexados por esta columna")
+    ap.add_argument("--json", dest="as_json", action="store_true", help="Salida en JSON")
+    args = ap.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        raise SystemExit(f"No existe el índice {args.db}: ejecuta run_discovery.py con --index-db")
+    conn = connect(args.db)
+    try:
+        if args.count_by:
+            counts = count_by(conn, args.count_by)
+            if args.as_json:
+                print(json.dumps(dict(counts), ensure_ascii=False, indent=2))
+            else:
+                for key, n in counts:
+                    print(f"{n:>8}  {key}")
+            return
+        rows = search(conn, " ".join(args.text), countries=args.country, domains=args.domain,
+                      categories=args.category, published_from=args.published_from,
+                      published_to=args.published_to, limit=args.limit)
+    finally:
+        conn.close()
+    if args.as_json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        _print_table(rows)
+        print(f"{len(rows)} resultado(s)")
+
+
+if __name__ == "__main__":
+    main()
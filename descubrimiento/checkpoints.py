@@ -0,0 +1,174 @@
+"""
+Checkpoints de paginación para reanudar corridas interrumpidas (`--resume`).
+
+Por país se guarda en `output/state/`:
+- `<pais>_checkpoint.json`: firma de la corrida (parámetros de consulta) y, por fuente
+  (dominio Socrata o base_url CKAN), el offset (o scroll_id) de la próxima página, las
+  filas y bytes confirmados y si la fuente terminó.
+- `<pais>_partial/<fuente>.ndjson`: filas normalizadas ya obtenidas de cada fuente.
+
+Una página se confirma cuando todas sus filas están escritas en el parcial. Al reanudar
+se reproducen las filas confirmadas y la consulta sigue desde el offset guardado; lo
+escrito después de la última confirmación se descarta. Si la firma no coincide (otros
+filtros, límite o configuración) se empieza de cero.
+"""
+import json
+import os
+import threading
+import unicodedata
+from typing import Any, Dict, Iterator, List, Optional
+
+from records import DatasetRecord, as_dict, record_from_dict
+
+
+def _source_slug(source: str) -> str:
+    s = unicodedata.normalize("NFKD", source).encode("ascii", "ignore").decode("ascii")
+    s = "".join(c if c.isalnum() or c in ".-" else "_" for c in s.lower())
+    return s.strip("_") or "fuente"
+
+
+class SourceCursor:
+    """Avance de una fuente. Lo usa un solo hilo: el que consulta esa fuente."""
+
+    def __init__(self, store: "CheckpointStore", source: str, state: Dict[str, Any]):
+        self.store = store
+        self.source = source
+        self.path = os.path.join(store.partial_dir, _source_slug(source) + ".ndjson")
+        self.offset = int(state.get("offset", 0))
+        self.rows = int(state.get("rows", 0))
+        self.done = bool(state.get("done", False))
+        self._bytes = int(state.get("bytes", 0))
+        # Cursor de la próxima página cuando la fuente se pagina por scroll (Socrata)
+        self.scroll_id: Optional[str] = state.get("scroll_id")
+        self._f = None
+
+    def replay(self) -> Iterator[DatasetRecord]:
+        """Filas confirmadas en una corrida anterior."""
+        if not self.rows:
+            return
+        with open(self.path, "rb") as f:
+            data = f.read(self._bytes)
+        for line in data.splitlines():
+            if line.strip():
+                yield record_from_dict(json.loads(line))
+
+    def _open(self):
+        if self._f is None:
+            os.makedirs(self.store.partial_dir, exist_ok=True)
+            self._f = open(self.path, "r+b" if os.path.exists(self.path) else "wb")
+            # Lo escrito después de la última confirmación no vale
+            self._f.truncate(self._bytes)
+            self._f.seek(self._bytes)
+        return self._f
+
+    def write(self, row: Any) -> None:
+        f = self._open()
+        f.write(json.dumps(as_dict(row), ensure_ascii=False).encode("utf-8"))
+        f.write(b"\n")
+        self.rows += 1
+
+    def page_done(self, next_offset: Optional[int], done: bool = False, scroll_id: Optional[str] = None) -> None:
+        """Confirma las filas escritas hasta ahora y el offset (o scroll_id) de la próxima página."""
+        if next_offset is not None:
+            self.offset = next_offset
+        if scroll_id is not None:
+            self.scroll_id = scroll_id
+        self.done = self.done or done
+        if self._f is not None:
+            self._f.flush()
+            self._bytes = self._f.tell()
+            if self.done:
+                self._f.close()
+                self._f = None
+        self.store._save(self)
+
+    def finish(self) -> None:
+        self.page_done(None, done=True)
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+class CheckpointStore:
+    """
+    Checkpoint de la corrida de un país. Con `resume=False` (o si la firma guardada no
+    coincide) descarta el estado anterior y empieza de cero.
+    """
+
+    def __init__(self, state_dir: str, country_slug: str, signature: Dict[str, Any], resume: bool = False):
+        self.path = os.path.join(state_dir, f"{country_slug}_checkpoint.json")
+        self.partial_dir = os.path.join(state_dir, f"{country_slug}_partial")
+        self.signature = json.loads(json.dumps(signature, sort_keys=True, default=str))
+        self._lock = threading.Lock()
+        self._sources: Dict[str, Dict[str, Any]] = {}
+        self._cursors: Dict[str, SourceCursor] = {}
+        saved = self._load() if resume else None
+        if saved is not None:
+            self._sources = saved
+        else:
+            self.clear()
+        # Filas que se reproducen del parcial en vez de pedirse de nuevo al portal
+        self.replayed_rows = sum(int(s.get("rows", 0)) for s in self._sources.values())
+
+    def _load(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("signature") != self.signature:
+            print(f"ADVERTENCIA: El checkpoint {self.path} es de otra consulta; se empieza de cero")
+            return None
+        sources = data.get("sources") or {}
+        for source, state in list(sources.items()):
+            path = os.path.join(self.partial_dir, _source_slug(source) + ".ndjson")
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size < int(state.get("bytes", 0)):
+                # Parcial más corto que lo confirmado (p.ej. corte de energía): la fuente se repite
+                del sources[source]
+        return sources
+
+    def cursor(self, source: str) -> SourceCursor:
+        with self._lock:
+            cur = self._cursors.get(source)
+            if cur is None:
+                cur = SourceCursor(self, source, self._sources.get(source, {}))
+                self._cursors[source] = cur
+            return cur
+
+    def _save(self, cursor: SourceCursor) -> None:
+        with self._lock:
+            state = {"offset": cursor.offset, "rows": cursor.rows, "bytes": cursor._bytes, "done": cursor.done}
+            if cursor.scroll_id is not None:
+                state["scroll_id"] = cursor.scroll_id
+            self._sources[cursor.source] = state
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"signature": self.signature, "sources": self._sources}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+
+    def pending_sources(self) -> List[str]:
+        """Fuentes consultadas en esta corrida que no llegaron al final (p.ej. por un error de red)."""
+        with self._lock:
+            return [s for s, c in self._cursors.items() if not c.done]
+
+    def close(self) -> None:
+        with self._lock:
+            for cur in self._cursors.values():
+                cur.close()
+
+    def clear(self) -> None:
+        """Borra el checkpoint y los parciales (corrida terminada o empezada de cero)."""
+        self.close()
+        with self._lock:
+            self._sources = {}
+            self._cursors = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            if os.path.isdir(self.partial_dir):
+                for name in os.listdir(self.partial_dir):
+                    os.remove(os.path.join(self.partial_dir, name))
+                os.rmdir(self.partial_dir)
@@ -1,42 +1,210 @@
 import os
 import json
-from typing import Dict, Any, Generator, List, Optional
+import threading
+from typing import Callable, Dict, Any, Generator, List, Optional, Set, Tuple
 from datetime import datetime
 
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-
-
-def _build_session() -> requests.Session:
-    """Crea una sesion HTTP con reintentos para reducir fallos transitorios."""
-    session = requests.Session()
-    retries = Retry(
-        total=3,
-        connect=3,
-        read=3,
-        status=3,
-        backoff_factor=0.5,
-        status_forcelist=(429, 500, 502, 503, 504),
-        allowed_methods=frozenset({"GET"}),
-    )
-    adapter = HTTPAdapter(max_retries=retries)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    return session
 
+from checkpoints import CheckpointStore
+from concurrency import host_slot, merge_http_stats
+from json_decoder import FieldSpec
+from metrics import decode_json, stage
+from records import DatasetRecord
+from transport import build_session, request_timeout, update_http_stats
+
+
+# Campos de cada package que lee `normalize_ckan_result`: `resources`, `extras` y demás se
+# descartan al decodificar la página
+CKAN_ITEM_FIELDS: FieldSpec = {
+    "id": None, "name": None, "title": None, "notes": None, "ckan_url": None,
+    "metadata_created": None, "metadata_modified": None, "num_resources": None,
+    "license_title": None, "license_id": None, "license": None,
+    "organization": {"title": None, "name": None},
+    "groups": {"display_name": None, "title": None, "name": None},
+    "tags": {"display_name": None, "name": None},
+}
+CKAN_ITEMS_PATH = ("result", "results")
+
+# Modo lean: `fl` pide a package_search (CKAN >= 2.9) solo estos campos del índice Solr en
+# vez del package completo con recursos y extras. En el índice `organization` es el
+# nombre, `groups` y `tags` son listas de nombres y `license` es el título de la licencia.
+CKAN_LEAN_FL = ("id,name,title,notes,metadata_created,metadata_modified,num_resources,"
+                "license,license_id,organization,groups,tags")
+# Portales que rechazan `fl` (versiones anteriores validan los parámetros)
+LEAN_REJECT_STATUS = frozenset({400, 409})
+_lean = os.environ.get("DISCOVERY_CKAN_LEAN") == "1"
+_lean_rejected: Set[str] = set()
+_lean_lock = threading.Lock()
+
+
+def set_lean(enabled: bool) -> None:
+    """Activa el modo lean (`fl`) en las consultas package_search."""
+    global _lean
+    _lean = bool(enabled)
 
-def _update_http_stats(stats: Optional[Dict[str, int]], resp: requests.Response) -> None:
-    if stats is None:
-        return
-    stats["requests"] = stats.get("requests", 0) + 1
-    retries_used = 0
-    raw = getattr(resp, "raw", None)
-    retries = getattr(raw, "retries", None)
-    history = getattr(retries, "history", None)
-    if history:
-        retries_used = len(history)
-    stats["retries"] = stats.get("retries", 0) + retries_used
+
+def lean_enabled() -> bool:
+    return _lean
+
+
+def lean_params(endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """`params` sin `fl` si el portal ya lo rechazó."""
+    if "fl" in params and endpoint in _lean_rejected:
+        return {k: v for k, v in params.items() if k != "fl"}
+    return params
+
+
+def lean_rejected(endpoint: str, params: Dict[str, Any], status: int) -> bool:
+    """
+    True si la respuesta es el rechazo de `fl` de un portal sin soporte: desde ahí el
+    portal se consulta con el package completo.
+    """
+    if "fl" not in params or status not in LEAN_REJECT_STATUS:
+        return False
+    with _lean_lock:
+        first = endpoint not in _lean_rejected
+        _lean_rejected.add(endpoint)
+    if first:
+        print(f"ADVERTENCIA: {endpoint} no acepta `fl` (HTTP {status}); se piden packages completos")
+    return True
+
+
+def build_search_params(q: Optional[str] = None,
+                        organization: Optional[str] = None,
+                        groups: Optional[List[str]] = None,
+                        start: int = 0,
+                        rows: int = 100,
+                        modified_since: Optional[str] = None,
+                        created_from: Optional[str] = None,
+                        created_to: Optional[str] = None,
+                        lean: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Arma los parámetros de package_search (compartido por el cliente sync y el async).
+    created_from / created_to (YYYY-MM-DD) se traducen a un rango Solr sobre
+    metadata_created, el mismo campo que se exporta como publication_date.
+    lean (default: `set_lean`) agrega `fl` para pedir solo los campos que se normalizan.
+    """
+    params: Dict[str, Any] = {
+        "start": start,
+        "rows": min(rows, 1000),  # CKAN típicamente limita a 1000
+    }
+    
+    if q:
+        params["q"] = q
+    fq: List[str] = []
+    if organization:
+        fq.append(f"organization:{organization}")
+    if groups:
+        # CKAN usa 'groups' como filtro adicional
+        fq.append("(" + " OR ".join(f"groups:{g}" for g in groups) + ")")
+    if modified_since:
+        fq.append(f"metadata_modified:[{modified_since} TO *]")
+        # Orden ascendente: si el límite corta el delta, la marca avanza sin saltarse cambios
+        params["sort"] = "metadata_modified asc"
+    if created_from or created_to:
+        lower = f"{created_from}T00:00:00Z" if created_from else "*"
+        upper = f"{created_to}T23:59:59.999Z" if created_to else "*"
+        fq.append(f"metadata_created:[{lower} TO {upper}]")
+    if fq:
+        params["fq"] = " AND ".join(fq)
+    if _lean if lean is None else lean:
+        params["fl"] = CKAN_LEAN_FL
+    return params
+
+
+def _get_page(session: requests.Session, endpoint: str, params: Dict[str, Any],
+              stats: Optional[Dict[str, int]] = None) -> requests.Response:
+    """
+    GET de una página. Si el portal rechaza `fl`, la solicitud rechazada se suma a
+    `stats` (salió a la red) y se repite sin `fl`; la respuesta final la cuenta el llamador.
+    """
+    params = lean_params(endpoint, params)
+    with host_slot(endpoint):
+        resp = session.get(endpoint, params=params, timeout=request_timeout())
+    if lean_rejected(endpoint, params, resp.status_code):
+        update_http_stats(stats, resp)
+        return _get_page(session, endpoint, params, stats)
+    return resp
+
+
+def _parse_page(resp: requests.Response, stats: Optional[Dict[str, int]], base_url: str,
+                fields: FieldSpec = CKAN_ITEM_FIELDS) -> Optional[Dict[str, Any]]:
+    """Valida una respuesta package_search y devuelve `result`, o None si la API reporta fallo."""
+    update_http_stats(stats, resp)
+    resp.raise_for_status()
+    data = decode_json(resp, CKAN_ITEMS_PATH, fields)
+    if not data.get("success", False):
+        print(f"ADVERTENCIA: CKAN API retornó success=false para {base_url}")
+        return None
+    return data.get("result", {})
+
+
+def _prefetch_pages(endpoint: str, params: Dict[str, Any], count: int,
+                    max_pages: int, window: int, stats: Optional[Dict[str, int]],
+                    base_url: str, fields: FieldSpec = CKAN_ITEM_FIELDS,
+                    on_page: Optional[Callable[[int, bool], None]] = None) -> Generator[Dict[str, Any], None, None]:
+    """
+    Descarga en paralelo las páginas restantes (conocido `count`) manteniendo hasta
+    `window` solicitudes en vuelo, y entrega los items en el orden original. Cada hilo
+    del pool usa su propia sesión (`build_session`) sobre el adapter compartido.
+    """
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+    from itertools import islice
+
+    offsets = islice(range(params["start"], count, params["rows"]), max_pages)
+    pool = ThreadPoolExecutor(max_workers=window)
+    pending = deque()
+    local = threading.local()
+
+    def fetch(page_params: Dict[str, Any]) -> Tuple[requests.Response, Dict[str, int]]:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = build_session()
+        # Contadores propios del hilo; se suman a `stats` desde el hilo del llamador
+        page_stats: Dict[str, int] = {}
+        return _get_page(session, endpoint, page_params, page_stats), page_stats
+
+    def submit(offset: int) -> None:
+        page_params = dict(params, start=offset)
+        pending.append((offset, pool.submit(fetch, page_params)))
+
+    next_start = params["start"]
+    try:
+        for offset in offsets:
+            submit(offset)
+            if len(pending) >= window:
+                break
+        while pending:
+            page_start, future = pending.popleft()
+            offset = next(offsets, None)
+            if offset is not None:
+                submit(offset)
+            try:
+                resp, page_stats = future.result()
+                merge_http_stats(stats, page_stats)
+                result = _parse_page(resp, stats, base_url, fields)
+            except requests.exceptions.RequestException as e:
+                print(f"ERROR: Fallo al consultar CKAN {base_url}: {e}")
+                return
+            if result is None:
+                return
+            results = result.get("results", [])
+            if not results:
+                break
+            for item in results:
+                yield item
+            next_start = page_start + params["rows"]
+            if on_page is not None:
+                on_page(next_start, False)
+        if on_page is not None:
+            on_page(next_start, True)
+    finally:
+        # Si el consumidor corta antes (p.ej. por límite), no descargar lo pendiente
+        for _, future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
 
 
 def query_ckan_catalog(base_url: str = "https://datos.gob.mx",
@@ -47,7 +215,13 @@ def query_ckan_catalog(base_url: str = "https://datos.gob.mx",
                        rows: int = 100,
                        max_pages: int = 50,
                        session: Optional[requests.Session] = None,
-                       stats: Optional[Dict[str, int]] = None) -> Generator[Dict[str, Any], None, None]:
+                       stats: Optional[Dict[str, int]] = None,
+                       prefetch: int = 0,
+                       modified_since: Optional[str] = None,
+                       created_from: Optional[str] = None,
+                       created_to: Optional[str] = None,
+                       fields: FieldSpec = CKAN_ITEM_FIELDS,
+                       on_page: Optional[Callable[[int, bool], None]] = None) -> Generator[Dict[str, Any], None, None]:
     """
     Generador que recorre la API CKAN package_search devolviendo packages (datasets).
     - base_url: URL base del portal CKAN (ej. "https://datos.gob.mx").
@@ -57,43 +231,39 @@ def query_ckan_catalog(base_url: str = "https://datos.gob.mx",
     - start: índice de inicio (paginación).
     - rows: tamaño de página (<= 1000 típicamente).
     - max_pages: tope de páginas a recorrer.
+    - prefetch: si > 0, tras la primera página (que trae `count`) se piden las
+      páginas restantes en paralelo con esa ventana de solicitudes en vuelo.
+      Los items se entregan en el mismo orden que en modo secuencial. `session` solo
+      se usa desde el hilo del llamador; cada hilo del prefetch arma la suya.
+    - modified_since: marca ISO; solo packages con metadata_modified posterior
+      (modo incremental), ordenados del más antiguo al más reciente.
+    - created_from / created_to: ventana de publicación filtrada en el servidor.
+    - fields: proyección de cada package (default: lo que usa `normalize_ckan_result`;
+      None = package completo).
+    - on_page(next_start, done): se llama cuando el llamador consumió todos los items de
+      una página, con el `start` de la siguiente y si la consulta terminó. No se llama si
+      la consulta se corta por un error (la fuente queda pendiente).
     """
     endpoint = f"{base_url}/api/3/action/package_search"
+    params = build_search_params(q=q, organization=organization, groups=groups, start=start, rows=rows,
+                                 modified_since=modified_since, created_from=created_from, created_to=created_to)
     
-    params: Dict[str, Any] = {
-        "start": start,
-        "rows": min(rows, 1000),  # CKAN típicamente limita a 1000
-    }
-    
-    if q:
-        params["q"] = q
-    if organization:
-        params["fq"] = f"organization:{organization}"
-    if groups:
-        # CKAN usa 'groups' como filtro adicional
-        group_filter = " OR ".join(f"groups:{g}" for g in groups)
-        if "fq" in params:
-            params["fq"] += f" AND ({group_filter})"
-        else:
-            params["fq"] = f"({group_filter})"
-    
-    local_session = session or _build_session()
+    def page_done(done: bool) -> None:
+        if on_page is not None:
+            on_page(params["start"], done)
+
+    local_session = session or build_session()
     for page in range(max_pages):
         try:
-            resp = local_session.get(endpoint, params=params, timeout=30)
-            _update_http_stats(stats, resp)
-            resp.raise_for_status()
-            data = resp.json()
-            
-            if not data.get("success", False):
-                print(f"ADVERTENCIA: CKAN API retornó success=false para {base_url}")
+            result = _parse_page(_get_page(local_session, endpoint, params, stats), stats, base_url, fields)
+            if result is None:
                 break
             
-            result = data.get("result", {})
             results = result.get("results", [])
             count = result.get("count", 0)
             
             if not results:
+                page_done(True)
                 break
                 
             for item in results:
@@ -101,77 +271,135 @@ def query_ckan_catalog(base_url: str = "https://datos.gob.mx",
                 
             # Verificar si hay más páginas
             if params["start"] + params["rows"] >= count:
+                params["start"] += params["rows"]
+                page_done(True)
                 break
                 
             params["start"] += params["rows"]
+            page_done(False)
+
+            if prefetch > 0:
+                yield from _prefetch_pages(endpoint, params, count, max_pages - page - 1,
+                                           prefetch, stats, base_url, fields, on_page)
+                break
             
         except requests.exceptions.RequestException as e:
             print(f"ERROR: Fallo al consultar CKAN {base_url}: {e}")
             break
+    else:
+        page_done(True)
 
 
-def normalize_ckan_result(item: Dict[str, Any], base_url: str = "https://datos.gob.mx") -> Dict[str, Any]:
+def normalize_ckan_result(item: Dict[str, Any], base_url: str = "https://datos.gob.mx") -> DatasetRecord:
     """
-    Extrae campos útiles de un package CKAN en un dict plano compatible con Socrata.
+    Extrae campos útiles de un package CKAN en un registro plano compatible con Socrata.
     """
-    # Obtener tags como lista de strings
-    tags = [tag.get("display_name", tag.get("name", "")) for tag in item.get("tags", [])]
+    # Obtener tags como lista de strings (en modo lean ya vienen como nombres)
+    tags = [tag if isinstance(tag, str) else tag.get("display_name", tag.get("name", ""))
+            for tag in item.get("tags", [])]
     
     # Obtener grupos/categorías
-    groups = [group.get("display_name", group.get("title", group.get("name", ""))) 
+    groups = [group if isinstance(group, str) else group.get("display_name", group.get("title", group.get("name", "")))
               for group in item.get("groups", [])]
     
     # Organización
     org = item.get("organization", {}) or {}
-    org_title = org.get("title", org.get("name", ""))
+    org_title = org if isinstance(org, str) else org.get("title", org.get("name", ""))
     
-    return {
-        "name": item.get("title", item.get("name", "")),
-        "id": item.get("id", ""),
-        "type": "dataset",  # CKAN packages son típicamente datasets
-        "description": item.get("notes", ""),
-        "domain": None,  # CKAN no tiene concepto de dominio como Socrata
-        "permalink": f"{item.get('ckan_url', base_url)}/dataset/{item.get('name', '')}",
-        "link": f"{item.get('ckan_url', base_url)}/dataset/{item.get('name', '')}",
-        "domain_category": org_title,
-        "categories": ",".join(groups),
-        "tags": ",".join(tags),
-        "download_count": None,  # CKAN no siempre expone download count en package_search
-        "publication_date": item.get("metadata_created", ""),
-        "num_resources": item.get("num_resources", 0),
-        "license": item.get("license_title", item.get("license_id", "")),
-        "organization": org_title,
-    }
+    return DatasetRecord(
+        name=item.get("title", item.get("name", "")),
+        id=item.get("id", ""),
+        type="dataset",  # CKAN packages son típicamente datasets
+        description=item.get("notes", ""),
+        domain=None,  # CKAN no tiene concepto de dominio como Socrata
+        permalink=f"{item.get('ckan_url', base_url)}/dataset/{item.get('name', '')}",
+        link=f"{item.get('ckan_url', base_url)}/dataset/{item.get('name', '')}",
+        domain_category=org_title,
+        categories=",".join(groups),
+        tags=",".join(tags),
+        download_count=None,  # CKAN no siempre expone download count en package_search
+        publication_date=item.get("metadata_created", ""),
+        updated_at=item.get("metadata_modified", ""),
+        num_resources=item.get("num_resources", 0),
+        license=item.get("license_title", item.get("license", item.get("license_id", ""))),
+        organization=org_title,
+    )
 
 
-def fetch_ckan_by_config(base_url: str = "https://datos.gob.mx",
-                         q: Optional[str] = None,
-                         groups: Optional[List[str]] = None,
-                         per_query_limit: int = 1000,
-                         stats: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+def iter_ckan_by_config(base_url: str = "https://datos.gob.mx",
+                        q: Optional[str] = None,
+                        groups: Optional[List[str]] = None,
+                        per_query_limit: int = 1000,
+                        stats: Optional[Dict[str, int]] = None,
+                        prefetch: int = 0,
+                        modified_since: Optional[str] = None,
+                        created_from: Optional[str] = None,
+                        created_to: Optional[str] = None,
+                        checkpoint: Optional[CheckpointStore] = None) -> Generator[Dict[str, Any], None, None]:
     """
-    Consulta CKAN y devuelve una lista de resultados normalizados.
-    Limita el total por consulta para evitar respuestas enormes.
+    Versión en streaming de `fetch_ckan_by_config`: entrega filas normalizadas una a una.
+    Con `checkpoint` guarda el avance por página y, al reanudar, sigue desde donde quedó.
     """
-    all_rows: List[Dict[str, Any]] = []
     count = 0
-    session = _build_session()
+    start = 0
+    cursor = checkpoint.cursor(base_url) if checkpoint is not None else None
+    if cursor is not None:
+        for row in cursor.replay():
+            yield row
+            count += 1
+        if count >= per_query_limit and not cursor.done:
+            cursor.finish()
+        if cursor.done:
+            return
+        start = cursor.offset
+    session = build_session()
     
     for item in query_ckan_catalog(
         base_url=base_url,
         q=q,
         groups=groups,
+        start=start,
         rows=100,
-        max_pages=100,
+        max_pages=max(0, 100 - start // 100),
         session=session,
         stats=stats,
+        prefetch=prefetch,
+        modified_since=modified_since,
+        created_from=created_from,
+        created_to=created_to,
+        on_page=cursor.page_done if cursor is not None else None,
     ):
-        all_rows.append(normalize_ckan_result(item, base_url))
+        with stage("normalize"):
+            row = normalize_ckan_result(item, base_url)
+        if cursor is not None:
+            cursor.write(row)
+        yield row
         count += 1
         if count >= per_query_limit:
+            if cursor is not None:
+                cursor.finish()
             break
-    
-    return all_rows
+
+
+def fetch_ckan_by_config(base_url: str = "https://datos.gob.mx",
+                         q: Optional[str] = None,
+                         groups: Optional[List[str]] = None,
+                         per_query_limit: int = 1000,
+                         stats: Optional[Dict[str, int]] = None,
+                         prefetch: int = 0,
+                         modified_since: Optional[str] = None,
+                         created_from: Optional[str] = None,
+                         created_to: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Consulta CKAN y devuelve una lista de resultados normalizados.
+    Limita el total por consulta para evitar respuestas enormes.
+    - prefetch: ventana de páginas descargadas en paralelo (0 = secuencial).
+    - modified_since: solo packages modificados desde esa marca (modo incremental).
+    - created_from / created_to: ventana de publicación (YYYY-MM-DD) aplicada en el servidor.
+    """
+    return list(iter_ckan_by_config(base_url=base_url, q=q, groups=groups, per_query_limit=per_query_limit,
+                                    stats=stats, prefetch=prefetch, modified_since=modified_since,
+                                    created_from=created_from, created_to=created_to))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,59 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+
+DEFAULT_PER_HOST = int(os.environ.get("DISCOVERY_PER_HOST", "4"))
+
+_per_host_limit = DEFAULT_PER_HOST
+_host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+_registry_lock = threading.Lock()
+
+
+def set_per_host_limit(limit: int) -> None:
+    """
+    Fija el máximo de solicitudes simultáneas por host.
+    Se aplica a los semáforos creados a partir de este momento.
+    """
+    global _per_host_limit
+    with _registry_lock:
+        _per_host_limit = max(1, int(limit))
+        _host_semaphores.clear()
+
+
+def get_per_host_limit() -> int:
+    return _per_host_limit
+
+
+def _host_of(url: str) -> str:
+    return urlparse(url).netloc.lower() or url
+
+
+def _semaphore_for(host: str) -> threading.BoundedSemaphore:
+    with _registry_lock:
+        sem = _host_semaphores.get(host)
+        if sem is None:
+            sem = threading.BoundedSemaphore(_per_host_limit)
+            _host_semaphores[host] = sem
+        return sem
+
+
+@contextmanager
+def host_slot(url: str) -> Iterator[None]:
+    """Reserva un cupo de concurrencia para el host de `url` mientras dura el bloque."""
+    sem = _semaphore_for(_host_of(url))
+    sem.acquire()
+    try:
+        yield
+    finally:
+        sem.release()
+
+
+def merge_http_stats(target: Optional[Dict[str, int]], source: Dict[str, int]) -> None:
+    """Suma contadores HTTP de `source` sobre `target` (ambos dicts planos de enteros)."""
+    if target is None:
+        return
+    for k, v in source.items():
+        target[k] = target.get(k, 0) + v
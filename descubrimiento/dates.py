@@ -0,0 +1,58 @@
+"""
+Parseo de fechas de publicación de los portales.
+
+Socrata y CKAN devuelven casi siempre ISO 8601 (`2023-05-10T00:00:00.000Z`,
+`2023-05-10T14:03:22.123456`, `2023-05-10`): para esas formas basta leer los 10
+primeros caracteres. Las demás pasan por `fromisoformat`/`strptime`. Los resultados se
+memorizan porque un catálogo repite mucho las mismas marcas de tiempo.
+"""
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Optional
+
+
+_FALLBACK_FORMATS = ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d")
+
+
+def _parse_slow(s: str) -> Optional[date]:
+    # Manejar sufijo Z (UTC) convirtiéndolo a offset ISO compatible
+    if s.endswith("Z"):
+        s = s[:-1] + "+00:00"
+    try:
+        return datetime.fromisoformat(s).date()
+    except ValueError:
+        pass
+    for fmt in _FALLBACK_FORMATS:
+        try:
+            return datetime.strptime(s[:26], fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=65536)
+def _parse_day_str(s: str) -> Optional[date]:
+    s = s.strip()
+    # Camino rápido: YYYY-MM-DD al inicio, seguido de nada, 'T' o ' '
+    if len(s) >= 10 and s[4] == "-" and s[7] == "-" and (len(s) == 10 or s[10] in "T "):
+        head = s[:4] + s[5:7] + s[8:10]
+        if head.isdigit():
+            try:
+                return date(int(s[:4]), int(s[5:7]), int(s[8:10]))
+            except ValueError:
+                return None
+    return _parse_slow(s)
+
+
+def parse_day(value: Any) -> Optional[date]:
+    """
+    Día calendario de una fecha de portal (el que figura en el texto, sin convertir
+    de zona horaria). None si está vacía o no se reconoce.
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not value or not isinstance(value, str):
+        return None
+    return _parse_day_str(value)
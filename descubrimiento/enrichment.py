@@ -0,0 +1,265 @@
+"""
+Enriquecimiento opcional por recurso: formatos, tamaño en bytes y cantidad de filas.
+
+La búsqueda de catálogo (Discovery API / package_search) solo trae metadatos del
+dataset; esta etapa consulta, para cada fila ya normalizada:
+
+- Socrata: los metadatos de la vista (`/api/views/<id>.json`). Los archivos (blobby)
+  traen tipo MIME y tamaño; las vistas tabulares traen `cachedContents` por columna,
+  de donde sale la cantidad de filas sin contarlas. Si no lo traen, se pide
+  `$select=count(*)` a la SODA API. Los formatos de un dataset tabular o geográfico son
+  los de exportación del portal; Socrata no informa bytes para datos tabulares. Los
+  gráficos, filtros, historias y medidas no se cuentan y salen sin formatos.
+- CKAN: `package_show` (formatos y `size` de cada recurso) y, para los recursos
+  cargados en el DataStore, `datastore_search` con `limit=0` (devuelve `total`).
+
+Las consultas corren en un pool de hilos acotado con ventana deslizante: las filas
+salen en el mismo orden en que entran y en memoria quedan solo las que están en vuelo.
+Cada solicitud respeta el cupo por host (`concurrency.host_slot`) y pasa por el pool,
+los reintentos, el rate limit y la caché HTTP compartidos (`transport`), así que una
+segunda corrida con `--cache-dir` no vuelve a pedir lo que no cambió.
+
+Una falla en una fila no detiene la corrida: la fila sale sin enriquecer y se cuenta
+en `errors`.
+"""
+import mimetypes
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import requests
+
+from concurrency import host_slot, merge_http_stats
+from metrics import decode_json
+from socrata_discovery import load_app_token
+from transport import build_session, request_timeout, update_http_stats
+
+
+ENRICH_FIELDS = ("formats", "size_bytes", "row_count")
+DEFAULT_WORKERS = 8
+# Filas en vuelo por hilo: suficiente para no dejar hilos ociosos esperando el orden
+WINDOW_PER_WORKER = 4
+# Recursos del DataStore consultados por package (row_count suma solo esos)
+MAX_DATASTORE_LOOKUPS = 5
+
+SOCRATA_VIEWS_URL = "https://{domain}/api/views/{id}.json"
+SODA_RESOURCE_URL = "https://{domain}/resource/{id}.json"
+# Formatos de exportación que ofrece Socrata para cada clase de vista
+SODA_EXPORT_FORMATS = "CSV,JSON,XML"
+GEO_EXPORT_FORMATS = "GeoJSON,KML,KMZ,Shapefile"
+# Respuestas que significan "no hay metadatos" y no un error de la corrida
+_MISSING_STATUS = frozenset({401, 403, 404, 410})
+
+
+def _to_int(value: Any) -> Optional[int]:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _format_of_mime(mime: Optional[str]) -> Optional[str]:
+    if not mime:
+        return None
+    ext = mimetypes.guess_extension(mime.split(";")[0].strip())
+    return ext[1:].upper() if ext else None
+
+
+def _join_formats(formats: Iterable[Optional[str]]) -> str:
+    seen: Dict[str, None] = {}
+    for f in formats:
+        f = (f or "").strip().lstrip(".").upper()
+        if f:
+            seen.setdefault(f, None)
+    return ",".join(seen)
+
+
+def is_tabular_dataset(view: Dict[str, Any], asset_type: Optional[str] = None) -> bool:
+    """
+    True si la vista es un dataset tabular: solo esos se exportan como tabla y se cuentan.
+    Gráficos, filtros, historias, medidas, etc. también son vistas (muchas con
+    `viewType=tabular`); se distinguen por `displayType` y por el tipo de asset del
+    catálogo (`asset_type`, el `type` de la fila) o de la vista (`assetType`).
+    """
+    kind = asset_type or view.get("assetType") or "dataset"
+    return ((view.get("viewType") or "tabular") == "tabular"
+            and (view.get("displayType") or "table") == "table" and kind == "dataset")
+
+
+def socrata_fields(view: Dict[str, Any], asset_type: Optional[str] = None) -> Dict[str, Any]:
+    """Formatos, bytes y filas a partir de los metadatos de una vista Socrata."""
+    view_type = view.get("viewType") or ""
+    size = None
+    rows = None
+    if view_type == "blobby" or view.get("blobMimeType"):
+        formats = _join_formats([_format_of_mime(view.get("blobMimeType"))])
+        size = _to_int(view.get("blobFileSize"))
+    elif view_type == "geo" or view.get("displayType") == "map":
+        formats = _join_formats(GEO_EXPORT_FORMATS.split(","))
+    elif view_type == "href":
+        access = (view.get("metadata") or {}).get("accessPoints") or {}
+        formats = _join_formats(access.keys())
+    elif is_tabular_dataset(view, asset_type):
+        formats = SODA_EXPORT_FORMATS
+        for col in view.get("columns") or []:
+            cached = col.get("cachedContents") or {}
+            non_null, null = _to_int(cached.get("non_null")), _to_int(cached.get("null"))
+            if non_null is not None:
+                # Todas las columnas cuentan las mismas filas; se toma la mayor por si alguna viene incompleta
+                rows = max(rows or 0, non_null + (null or 0))
+    else:
+        # Gráficos, historias, filtros, medidas...: no tienen exportación propia
+        formats = ""
+    return {"formats": formats, "size_bytes": size, "row_count": rows}
+
+
+def ckan_fields(package: Dict[str, Any]) -> Dict[str, Any]:
+    """Formatos y bytes a partir de un package CKAN (row_count se completa aparte)."""
+    resources = package.get("resources") or []
+    sizes = [_to_int(r.get("size")) for r in resources]
+    known = [s for s in sizes if s is not None]
+    return {
+        "formats": _join_formats(r.get("format") for r in resources),
+        "size_bytes": sum(known) if known else None,
+        "row_count": None,
+    }
+
+
+def _ckan_base(row: Any) -> Optional[str]:
+    link = row.get("link") or row.get("permalink") or ""
+    base, sep, _ = link.partition("/dataset/")
+    return base if sep else None
+
+
+class Enricher:
+    """
+    Enriquece filas de a una (thread-safe). Cada hilo usa su propia sesión sobre el
+    adapter compartido; los contadores HTTP se suman bajo lock.
+    """
+
+    def __init__(self, app_token: Optional[str] = None):
+        token = app_token or load_app_token()
+        self._socrata_headers = {"X-App-Token": token} if token else {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {"enriched": 0, "skipped": 0, "errors": 0}
+        self.http: Dict[str, int] = {}
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = build_session()
+        return session
+
+    def _get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+                  headers: Optional[Dict[str, str]] = None) -> Any:
+        """JSON de `url`, o None si el recurso no existe o no es público."""
+        stats: Dict[str, int] = {}
+        with host_slot(url):
+            resp = self._session().get(url, params=params, headers=headers, timeout=request_timeout())
+        update_http_stats(stats, resp)
+        with self._lock:
+            merge_http_stats(self.http, stats)
+        if resp.status_code in _MISSING_STATUS:
+            return None
+        resp.raise_for_status()
+        return decode_json(resp)
+
+    def _socrata(self, row: Any) -> Optional[Dict[str, Any]]:
+        domain, dataset_id = row.get("domain"), row.get("id")
+        view = self._get_json(SOCRATA_VIEWS_URL.format(domain=domain, id=dataset_id),
+                              headers=self._socrata_headers)
+        if not isinstance(view, dict):
+            return None
+        fields = socrata_fields(view, row.get("type"))
+        if fields["row_count"] is None and is_tabular_dataset(view, row.get("type")):
+            # Sin el conteo la fila igual conserva los formatos de la vista
+            try:
+                counted = self._get_json(SODA_RESOURCE_URL.format(domain=domain, id=dataset_id),
+                                         params={"$select": "count(*)"}, headers=self._socrata_headers)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"ADVERTENCIA: no se pudo contar las filas de {dataset_id}: {e}")
+                counted = None
+            if isinstance(counted, list) and counted and isinstance(counted[0], dict):
+                fields["row_count"] = _to_int(next(iter(counted[0].values()), None))
+        return fields
+
+    def _ckan(self, row: Any) -> Optional[Dict[str, Any]]:
+        base = _ckan_base(row)
+        if not base:
+            return None
+        payload = self._get_json(f"{base}/api/3/action/package_show", params={"id": row.get("id")})
+        package = (payload or {}).get("result") if isinstance(payload, dict) else None
+        if not isinstance(package, dict):
+            return None
+        fields = ckan_fields(package)
+        active = [r for r in package.get("resources") or [] if r.get("datastore_active")]
+        totals = []
+        for resource in active[:MAX_DATASTORE_LOOKUPS]:
+            result = self._get_json(f"{base}/api/3/action/datastore_search",
+                                    params={"resource_id": resource.get("id"), "limit": 0})
+            total = _to_int(((result or {}).get("result") or {}).get("total"))
+            if total is not None:
+                totals.append(total)
+        if totals:
+            fields["row_count"] = sum(totals)
+        return fields
+
+    def enrich(self, row: Any) -> Any:
+        """Agrega ENRICH_FIELDS a `row` (en el lugar) y la devuelve."""
+        if row.get("formats") not in (None, ""):
+            # Ya enriquecida en una corrida anterior (p.ej. filas conservadas por --incremental)
+            with self._lock:
+                self.counts["skipped"] += 1
+            return row
+        try:
+            fields = self._socrata(row) if row.get("domain") else self._ckan(row)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"ADVERTENCIA: no se pudo enriquecer {row.get('id')}: {e}")
+            fields, outcome = None, "errors"
+        else:
+            outcome = "enriched" if fields else "skipped"
+        for name in ENRICH_FIELDS:
+            row[name] = (fields or {}).get(name)
+        with self._lock:
+            self.counts[outcome] += 1
+        return row
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "enriched_rows": self.counts["enriched"],
+                "enrich_skipped": self.counts["skipped"],
+                "enrich_errors": self.counts["errors"],
+                "enrich_requests": self.http.get("requests", 0),
+                "enrich_cache_hits": self.http.get("cache_hits", 0),
+            }
+
+
+def enrich_rows(rows: Iterable[Any], workers: int = DEFAULT_WORKERS, stats: Optional[Dict[str, int]] = None,
+                app_token: Optional[str] = None) -> Iterator[Any]:
+    """
+    Enriquece `rows` con `workers` hilos y las devuelve en el mismo orden. Hay a lo sumo
+    `workers * WINDOW_PER_WORKER` filas en vuelo. `stats` recibe los contadores al terminar.
+    """
+    enricher = Enricher(app_token)
+    workers = max(1, int(workers))
+    window = workers * WINDOW_PER_WORKER
+    pending: deque = deque()
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enrich") as pool:
+            try:
+                for row in rows:
+                    pending.append(pool.submit(enricher.enrich, row))
+                    if len(pending) >= window:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                # Si el consumidor corta antes, no se piden las filas que no van a usarse
+                for future in pending:
+                    future.cancel()
+    finally:
+        if stats is not None:
+            stats.update(enricher.stats())
@@ -0,0 +1,186 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from rate_limit import ThrottledAdapter
+
+
+DEFAULT_TTL = 12 * 3600
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Cabeceras que se guardan junto al cuerpo (las demás no aportan al reutilizar la respuesta)
+_STORED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+class ResponseCache:
+    """
+    Caché HTTP persistente en disco.
+    - Clave: método + URL completa (incluye los query params).
+    - Cada entrada es un archivo gzip: una línea JSON de metadatos seguida del cuerpo.
+    - Entradas con edad < ttl se sirven sin red; las vencidas se revalidan con
+      If-None-Match / If-Modified-Since cuando el servidor entregó ETag / Last-Modified.
+    - Eviction LRU por tamaño total: el mtime de cada archivo marca su último uso.
+    """
+
+    def __init__(self, directory: str, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(e.stat().st_size for e in os.scandir(directory) if e.name.endswith(".gz"))
+
+    @staticmethod
+    def key_for(method: str, url: str) -> str:
+        return hashlib.sha256(f"{method.upper()} {url}".encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".gz")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rb") as f:
+                meta = json.loads(f.readline().decode("utf-8"))
+                meta["body"] = f.read()
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+        return meta
+
+    def is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry.get("stored_at", 0) < self.ttl
+
+    def touch(self, key: str) -> None:
+        """Marca uso reciente de la entrada (LRU)."""
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def refresh(self, key: str, entry: Dict[str, Any]) -> None:
+        """Reinicia el TTL de una entrada revalidada por el servidor (304)."""
+        self.put(key, entry["url"], entry["status"], entry["headers"], entry["body"])
+
+    def put(self, key: str, url: str, status: int, headers: Dict[str, str], body: bytes) -> None:
+        meta = {"url": url, "status": status, "headers": headers, "stored_at": time.time()}
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, "wb", compresslevel=6) as f:
+            f.write(json.dumps(meta).encode("utf-8") + b"\n")
+            f.write(body)
+        with self._lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp, path)
+            self._size += os.path.getsize(path) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Borra las entradas menos usadas hasta quedar en 90% del tope
+        entries = sorted(
+            (e for e in os.scandir(self.directory) if e.name.endswith(".gz")),
+            key=lambda e: e.stat().st_mtime,
+        )
+        target = int(self.max_bytes * 0.9)
+        for entry in entries:
+            if self._size <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._size -= size
+            except OSError:
+                continue
+
+
+class CachingAdapter(ThrottledAdapter):
+    """
+    HTTPAdapter que consulta `ResponseCache` antes de ir a la red (solo lo que sale a la
+    red pasa por el limitador de tasa).
+    Marca cada respuesta con `cache_status` ("hit", "revalidated" o "miss") para
+    que `transport.update_http_stats` lo sume a las métricas.
+    """
+
+    def __init__(self, cache: ResponseCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def _from_entry(self, request: requests.PreparedRequest, entry: Dict[str, Any], status: str) -> requests.Response:
+        resp = requests.Response()
+        resp.status_code = entry["status"]
+        resp.reason = "OK"
+        resp.headers = CaseInsensitiveDict(entry["headers"])
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp._content = entry["body"]
+        resp.url = request.url
+        resp.request = request
+        resp.connection = self
+        resp.cache_status = status
+        return resp
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+        key = ResponseCache.key_for(request.method, request.url)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if self.cache.is_fresh(entry):
+                self.cache.touch(key)
+                return self._from_entry(request, entry, "hit")
+            headers = entry["headers"]
+            if headers.get("ETag"):
+                request.headers["If-None-Match"] = headers["ETag"]
+            if headers.get("Last-Modified"):
+                request.headers["If-Modified-Since"] = headers["Last-Modified"]
+
+        resp = super().send(request, **kwargs)
+        if resp.status_code == 304 and entry is not None:
+            resp.content  # libera la conexión al pool (304 no trae cuerpo)
+            self.cache.refresh(key, entry)
+            cached = self._from_entry(request, entry, "revalidated")
+            cached.raw = resp.raw
+            cached.latency = resp.latency
+            return cached
+        if resp.status_code == 200:
+            stored = {k: resp.headers[k] for k in _STORED_HEADERS if k in resp.headers}
+            self.cache.put(key, request.url, resp.status_code, stored, resp.content)
+        resp.cache_status = "miss"
+        return resp
+
+
+_default_cache: Optional[ResponseCache] = None
+
+
+def configure_cache(directory: Optional[str], ttl: float = DEFAULT_TTL,
+                    max_bytes: int = DEFAULT_MAX_BYTES) -> Optional[ResponseCache]:
+    """Activa (o desactiva con directory=None) la caché usada por las sesiones nuevas."""
+    global _default_cache
+    _default_cache = ResponseCache(directory, ttl=ttl, max_bytes=max_bytes) if directory else None
+    return _default_cache
+
+
+def get_default_cache() -> Optional[ResponseCache]:
+    return _default_cache
+
+
+def make_adapter(max_retries: Any, **pool_kwargs: Any) -> HTTPAdapter:
+    """
+    Adapter para `transport`: con caché si está configurada; siempre con limitador de tasa.
+    `pool_kwargs` (pool_connections, pool_maxsize, pool_block) pasa a HTTPAdapter.
+    """
+    cache = get_default_cache()
+    if cache is None:
+        return ThrottledAdapter(max_retries=max_retries, **pool_kwargs)
+    return CachingAdapter(cache, max_retries=max_retries, **pool_kwargs)
+
+
+if os.environ.get("DISCOVERY_CACHE_DIR"):
+    configure_cache(os.environ["DISCOVERY_CACHE_DIR"], ttl=float(os.environ.get("DISCOVERY_CACHE_TTL", DEFAULT_TTL)))
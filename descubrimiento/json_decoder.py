@@ -0,0 +1,254 @@
+"""
+Decodificación de páginas JSON de los portales.
+
+- Backend: usa orjson si está instalado (varias veces más rápido que `json`), o el
+  módulo estándar. Se puede forzar con `configure(backend=...)` o con la variable
+  DISCOVERY_JSON_BACKEND (auto, orjson, json).
+- Proyección: los items de la página (`results` en Socrata, `result.results` en CKAN)
+  se recortan a los campos que leen los normalizadores. Así los `resources`, `extras`,
+  `owner` y demás estructuras anidadas no quedan retenidos mientras la página espera en
+  la cola de prefetch o en el generador.
+- Modo incremental (`configure(stream=True)` o DISCOVERY_JSON_STREAM=1): el cuerpo se
+  recorre por bloques y los items se decodifican y proyectan de a uno. Nunca se
+  construye el árbol completo de la página, que en CKAN con `rows=1000` puede ocupar
+  cientos de MB en objetos Python. Usa el decodificador estándar por item, así que
+  gana en memoria pico y no en CPU.
+
+Los cuerpos se asumen en UTF-8 (RFC 8259), como los que entregan Socrata y CKAN.
+"""
+import codecs
+import json
+import os
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple, Union
+
+# Proyección de campos: {clave: subproyección o None para conservar el valor completo}.
+# Sobre una lista se aplica a cada elemento.
+FieldSpec = Optional[Dict[str, Any]]
+
+BACKENDS = ("auto", "orjson", "json")
+STREAM_CHUNK_SIZE = 1 << 16
+
+_WS = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+
+def _load_backend(name: str) -> Tuple[str, Callable[[Any], Any]]:
+    if name not in BACKENDS:
+        raise ValueError(f"Backend JSON no soportado: {name}")
+    if name in ("auto", "orjson"):
+        try:
+            import orjson
+            return "orjson", orjson.loads
+        except ImportError:
+            if name == "orjson":
+                raise RuntimeError("El backend orjson requiere orjson (pip install orjson)")
+    return "json", json.loads
+
+
+_backend, _loads = _load_backend(os.environ.get("DISCOVERY_JSON_BACKEND", "auto"))
+_stream = os.environ.get("DISCOVERY_JSON_STREAM", "").lower() in ("1", "true", "yes")
+
+
+def configure(backend: Optional[str] = None, stream: Optional[bool] = None) -> None:
+    """Elige backend (auto, orjson, json) y/o activa el modo incremental; None = sin cambios."""
+    global _backend, _loads, _stream
+    if backend is not None:
+        _backend, _loads = _load_backend(backend)
+    if stream is not None:
+        _stream = bool(stream)
+
+
+def backend_name() -> str:
+    return _backend
+
+
+def streaming() -> bool:
+    return _stream
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Decodifica un documento JSON completo con el backend activo."""
+    return _loads(data)
+
+
+def project(value: Any, spec: FieldSpec) -> Any:
+    """Recorta `value` a los campos de `spec` (los ausentes no se agregan)."""
+    if spec is None:
+        return value
+    if isinstance(value, dict):
+        return {k: project(value[k], sub) for k, sub in spec.items() if k in value}
+    if isinstance(value, list):
+        return [project(v, spec) for v in value]
+    return value
+
+
+def _text_chunks(data: Union[bytes, str], chunk_size: int) -> Iterator[str]:
+    if isinstance(data, str):
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    view = memoryview(data)
+    for i in range(0, len(view), chunk_size):
+        yield decoder.decode(view[i:i + chunk_size])
+    yield decoder.decode(b"", final=True)
+
+
+class _StreamParser:
+    """
+    Recorre un documento JSON por bloques de texto. Los valores se decodifican con
+    `raw_decode` del módulo estándar; si uno queda cortado al final del bloque se leen
+    más bloques y se reintenta.
+    """
+
+    def __init__(self, chunks: Iterable[str]):
+        self._chunks = iter(chunks)
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        for chunk in self._chunks:
+            if chunk:
+                # Descarta lo ya consumido antes de crecer el buffer
+                self.buf = self.buf[self.pos:] + chunk
+                self.pos = 0
+                return True
+        self.eof = True
+        return False
+
+    def _peek(self) -> str:
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise json.JSONDecodeError(f"Se esperaba {char!r}", self.buf, self.pos)
+        self.pos += 1
+
+    def _value(self) -> Any:
+        self._peek()
+        while True:
+            pending = len(self.buf) - self.pos
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                end = None
+            # Un número al final del bloque puede seguir en el siguiente
+            if end is not None and (end < len(self.buf) or self.eof):
+                self.pos = end
+                return value
+            # Crecer al menos al doble para que un valor grande no se reintente por cada bloque
+            while len(self.buf) - self.pos < 2 * pending and self._fill():
+                pass
+            if self.eof and end is not None:
+                self.pos = end
+                return value
+
+    def _members(self) -> Iterator[str]:
+        """Entrega cada clave de un objeto dejando `pos` al inicio de su valor (que consume el llamador)."""
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            if self._peek() != '"':
+                raise json.JSONDecodeError("Se esperaba una clave", self.buf, self.pos)
+            key = self._value()
+            self._expect(":")
+            yield key
+            sep = self._peek()
+            self.pos += 1
+            if sep == "}":
+                return
+            if sep != ",":
+                raise json.JSONDecodeError("Se esperaba ',' o '}'", self.buf, self.pos - 1)
+
+    def _array(self) -> Iterator[Any]:
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self._value()
+            sep = self._peek()
+            self.pos += 1
+            if sep == "]":
+                return
+            if sep != ",":
+                raise json.JSONDecodeError("Se esperaba ',' o ']'", self.buf, self.pos - 1)
+
+    def walk(self, path: Sequence[str], doc: Dict[str, Any]) -> Iterator[Any]:
+        """
+        Entrega los items del arreglo en `path` a medida que se leen; el resto de los
+        valores del camino (p.ej. `count`, `resultSetSize`) se guardan en `doc`.
+        """
+        for key in self._members():
+            if key != path[0]:
+                doc[key] = self._value()
+            elif len(path) > 1 and self._peek() == "{":
+                doc[key] = {}
+                yield from self.walk(path[1:], doc[key])
+            elif len(path) == 1 and self._peek() == "[":
+                doc[key] = []
+                yield from self._array()
+            else:
+                doc[key] = self._value()
+
+    def finish(self) -> None:
+        if self._peek():
+            raise json.JSONDecodeError("Datos extra al final del documento", self.buf, self.pos)
+
+
+def iter_items(data: Union[bytes, str], path: Sequence[str], doc: Optional[Dict[str, Any]] = None,
+               chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Any]:
+    """
+    Entrega uno a uno los items del arreglo en `path` (p.ej. ("result", "results"))
+    sin decodificar el documento completo. Si se pasa `doc`, al terminar contiene los
+    demás valores del camino.
+    """
+    parser = _StreamParser(_text_chunks(data, chunk_size))
+    yield from parser.walk(path, {} if doc is None else doc)
+    parser.finish()
+
+
+def _items_parent(doc: Any, path: Sequence[str]) -> Optional[Dict[str, Any]]:
+    for key in path[:-1]:
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(key)
+    return doc if isinstance(doc, dict) else None
+
+
+def project_page(doc: Any, items_path: Sequence[str], fields: FieldSpec) -> Any:
+    """Proyecta en su lugar los items de una página ya decodificada."""
+    parent = _items_parent(doc, items_path)
+    if fields is not None and parent is not None and isinstance(parent.get(items_path[-1]), list):
+        parent[items_path[-1]] = [project(item, fields) for item in parent[items_path[-1]]]
+    return doc
+
+
+def decode_page(data: Union[bytes, str], items_path: Optional[Sequence[str]] = None,
+                fields: FieldSpec = None) -> Any:
+    """
+    Decodifica una página de resultados. Con `items_path`, los items de ese arreglo se
+    proyectan a `fields`. En modo incremental se decodifican de a uno, sin construir
+    la página completa.
+    """
+    if not items_path:
+        return _loads(data)
+    if not _stream:
+        return project_page(_loads(data), items_path, fields)
+    doc: Dict[str, Any] = {}
+    items = [project(item, fields) for item in iter_items(data, items_path, doc)]
+    parent = _items_parent(doc, items_path)
+    if parent is not None and isinstance(parent.get(items_path[-1]), list):
+        parent[items_path[-1]] = items
+    return doc
@@ -0,0 +1,370 @@
+"""
+Instrumentación de una corrida de descubrimiento.
+
+- `HTTP` (HttpMetrics): por host, histogramas de latencia total (incluye reintentos),
+  time-to-first-byte y decodificación JSON; bytes de respuesta (decodificados y por la
+  red, es decir comprimidos), conteo por código de estado y causas de reintento (código
+  HTTP o tipo de error de conexión).
+- `StageTimer`: tiempo exclusivo por etapa del pipeline (fetch, normalize, dedupe,
+  filter, enrich, near_dupes, export). Las etapas se anidan porque cada generador consume al anterior; al
+  entrar a una etapa se pausa la que estaba activa en el hilo, así que los tiempos no
+  se solapan. El timer activo es por hilo: lo fija cada etapa en curso y los hilos de
+  trabajo adoptan el del país con `use_timer(current_timer())`.
+- Exportación a dict (run_report.json) y a texto Prometheus (`to_prometheus`).
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from json_decoder import FieldSpec, decode_page, project_page
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DECODE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+STAGES = ("fetch", "normalize", "dedupe", "filter", "enrich", "near_dupes", "export")
+
+
+class Histogram:
+    """Histograma de buckets fijos (conteos no acumulados; la exportación los acumula)."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # el último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Cota superior del bucket que contiene el cuantil q (None si está vacío)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": {str(b): n for b, n in zip(self.buckets + ("+Inf",), self.counts)},
+        }
+
+
+class _HostMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.ttfb = Histogram(LATENCY_BUCKETS)
+        self.decode = Histogram(DECODE_BUCKETS)
+        self.bytes = 0
+        self.wire_bytes = 0
+        self.status: Dict[str, int] = {}
+        self.retry_causes: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency_seconds": self.latency.to_dict(),
+            "ttfb_seconds": self.ttfb.to_dict(),
+            "json_decode_seconds": self.decode.to_dict(),
+            "response_bytes": self.bytes,
+            "wire_bytes": self.wire_bytes,
+            "status": dict(sorted(self.status.items())),
+            "retry_causes": dict(sorted(self.retry_causes.items())),
+        }
+
+
+class HttpMetrics:
+    """Métricas HTTP por host, compartidas por todos los hilos de la corrida."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, _HostMetrics] = {}
+
+    def _host(self, host: str) -> _HostMetrics:
+        m = self._hosts.get(host)
+        if m is None:
+            m = self._hosts[host] = _HostMetrics()
+        return m
+
+    def observe(self, host: str, status: Any, latency: Optional[float] = None, ttfb: Optional[float] = None,
+                nbytes: int = 0, retry_causes: Iterable[str] = (), wire_bytes: Optional[int] = None) -> None:
+        with self._lock:
+            m = self._host(host)
+            key = str(status)
+            m.status[key] = m.status.get(key, 0) + 1
+            if latency is not None:
+                m.latency.observe(latency)
+            if ttfb is not None:
+                m.ttfb.observe(ttfb)
+            m.bytes += nbytes
+            m.wire_bytes += nbytes if wire_bytes is None else wire_bytes
+            for cause in retry_causes:
+                m.retry_causes[cause] = m.retry_causes.get(cause, 0) + 1
+
+    def observe_decode(self, host: str, seconds: float) -> None:
+        with self._lock:
+            self._host(host).decode.observe(seconds)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._hosts.clear()
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {host: m.to_dict() for host, m in sorted(self._hosts.items())}
+
+
+HTTP = HttpMetrics()
+
+
+def host_of(url: str) -> str:
+    return urlparse(url).netloc.lower() or url
+
+
+def retry_causes(resp: Any) -> List[str]:
+    """Causa de cada reintento de urllib3: el código HTTP o el tipo de error de conexión."""
+    history = getattr(getattr(getattr(resp, "raw", None), "retries", None), "history", None) or ()
+    return [str(h.status) if h.status else type(h.error).__name__ for h in history]
+
+
+def wire_bytes(resp: Any) -> int:
+    """
+    Bytes del cuerpo recibidos por la red (antes de descomprimir gzip/br). urllib3 los
+    cuenta en `raw.tell()`; una revalidación 304 servida desde la caché no trae cuerpo.
+    """
+    tell = getattr(getattr(resp, "raw", None), "tell", None)
+    if callable(tell):
+        try:
+            return int(tell())
+        except (TypeError, ValueError, OSError):
+            pass
+    return len(getattr(resp, "content", None) or b"")
+
+
+def observe_response(resp: Any) -> None:
+    """Registra una respuesta de requests (los hits de caché no llegan a la red y se omiten)."""
+    if getattr(resp, "cache_status", None) == "hit":
+        return
+    elapsed = getattr(resp, "elapsed", None)
+    HTTP.observe(
+        host_of(getattr(resp, "url", None) or ""),
+        getattr(resp, "status_code", None),
+        latency=getattr(resp, "latency", None),
+        ttfb=elapsed.total_seconds() if elapsed is not None else None,
+        nbytes=len(getattr(resp, "content", None) or b""),
+        retry_causes=retry_causes(resp),
+        wire_bytes=wire_bytes(resp),
+    )
+
+
+def decode_json(resp: Any, items_path: Optional[Sequence[str]] = None, fields: FieldSpec = None) -> Any:
+    """
+    Equivalente a `resp.json()` con el decodificador de `json_decoder` (backend rápido,
+    proyección de los items en `items_path` y modo incremental), midiendo el tiempo de
+    decodificación. Los errores se levantan como `requests.exceptions.JSONDecodeError`,
+    igual que `resp.json()`.
+    """
+    t0 = time.perf_counter()
+    body = getattr(resp, "content", None)
+    if isinstance(body, (bytes, bytearray)):
+        try:
+            data = decode_page(body, items_path, fields)
+        except ValueError as e:
+            raise requests.exceptions.JSONDecodeError(str(e), "", 0) from e
+    else:
+        data = resp.json()
+        if items_path:
+            data = project_page(data, items_path, fields)
+    HTTP.observe_decode(host_of(getattr(resp, "url", None) or ""), time.perf_counter() - t0)
+    return data
+
+
+class StageTimer:
+    """Tiempos exclusivos por etapa de un país (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+
+    def stage(self, name: str) -> "_StageScope":
+        return _StageScope(self, name)
+
+    def timed(self, name: str, rows: Iterable[Any]) -> Iterator[Any]:
+        """Envuelve un iterador: el tiempo dentro de cada next() cuenta para `name`."""
+        it = iter(rows)
+        scope = _StageScope(self, name)
+        while True:
+            scope.__enter__()
+            try:
+                row = next(it)
+            except StopIteration:
+                return
+            finally:
+                scope.__exit__(None, None, None)
+            yield row
+
+    def totals(self) -> Dict[str, float]:
+        with self._lock:
+            return {k: round(self.seconds[k], 4) for k in STAGES if k in self.seconds}
+
+
+_local = threading.local()
+
+
+class _StageScope:
+    """
+    Entra/sale de una etapa pausando la que estaba activa en el hilo. Mientras dura,
+    su timer queda activo en el hilo, así que `stage()` dentro de un generador envuelto
+    con `timed` (p.ej. la normalización dentro de fetch) mide contra el mismo país.
+    """
+
+    __slots__ = ("timer", "name", "_prev", "_prev_timer", "_start")
+
+    def __init__(self, timer: StageTimer, name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self) -> "_StageScope":
+        now = time.perf_counter()
+        prev = getattr(_local, "scope", None)
+        if prev is not None:
+            prev.timer.add(prev.name, now - prev._start)
+        self._prev = prev
+        self._prev_timer = getattr(_local, "timer", None)
+        self._start = now
+        _local.scope = self
+        _local.timer = self.timer
+        return self
+
+    def __exit__(self, *exc) -> None:
+        now = time.perf_counter()
+        self.timer.add(self.name, now - self._start)
+        prev = self._prev
+        if prev is not None:
+            prev._start = now
+        _local.scope = prev
+        _local.timer = self._prev_timer
+
+
+class _NoScope:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+
+_NO_SCOPE = _NoScope()
+
+
+def current_timer() -> Optional[StageTimer]:
+    return getattr(_local, "timer", None)
+
+
+class use_timer:
+    """Activa `timer` en el hilo actual mientras dura el bloque (None = sin medición)."""
+
+    def __init__(self, timer: Optional[StageTimer]):
+        self.timer = timer
+
+    def __enter__(self) -> Optional[StageTimer]:
+        self._prev = current_timer()
+        _local.timer = self.timer
+        return self.timer
+
+    def __exit__(self, *exc) -> None:
+        _local.timer = self._prev
+
+
+def stage(name: str):
+    """Etapa del timer activo en el hilo; sin timer activo no mide nada."""
+    timer = getattr(_local, "timer", None)
+    return _StageScope(timer, name) if timer is not None else _NO_SCOPE
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: Any) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, help_text: str, series: List[Tuple[Dict[str, str], Histogram]]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, h in series:
+        cumulative = 0
+        for bound, n in zip(h.buckets + ("+Inf",), h.counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(**labels)} {h.sum:.6f}")
+        lines.append(f"{name}_count{_labels(**labels)} {h.count}")
+    return lines
+
+
+def to_prometheus(http: HttpMetrics, countries: Iterable[Dict[str, Any]] = ()) -> str:
+    """Formato de exposición de texto de Prometheus (para node_exporter textfile o pushgateway)."""
+    with http._lock:
+        hosts = sorted(http._hosts.items())
+        lines: List[str] = []
+        lines += _histogram_lines("discovery_http_request_seconds", "Latencia total por solicitud, con reintentos",
+                                  [({"host": h}, m.latency) for h, m in hosts])
+        lines += _histogram_lines("discovery_http_ttfb_seconds", "Tiempo hasta el primer byte del último intento",
+                                  [({"host": h}, m.ttfb) for h, m in hosts])
+        lines += _histogram_lines("discovery_json_decode_seconds", "Tiempo de decodificación JSON por página",
+                                  [({"host": h}, m.decode) for h, m in hosts])
+        lines += ["# HELP discovery_http_response_bytes_total Bytes de cuerpo recibidos",
+                  "# TYPE discovery_http_response_bytes_total counter"]
+        lines += [f"discovery_http_response_bytes_total{_labels(host=h)} {m.bytes}" for h, m in hosts]
+        lines += ["# HELP discovery_http_wire_bytes_total Bytes de cuerpo recibidos por la red (comprimidos)",
+                  "# TYPE discovery_http_wire_bytes_total counter"]
+        lines += [f"discovery_http_wire_bytes_total{_labels(host=h)} {m.wire_bytes}" for h, m in hosts]
+        lines += ["# HELP discovery_http_responses_total Respuestas por código de estado",
+                  "# TYPE discovery_http_responses_total counter"]
+        lines += [f"discovery_http_responses_total{_labels(host=h, status=s)} {n}"
+                  for h, m in hosts for s, n in sorted(m.status.items())]
+        lines += ["# HELP discovery_http_retries_total Reintentos por causa",
+                  "# TYPE discovery_http_retries_total counter"]
+        lines += [f"discovery_http_retries_total{_labels(host=h, cause=c)} {n}"
+                  for h, m in hosts for c, n in sorted(m.retry_causes.items())]
+    countries = list(countries)
+    lines += ["# HELP discovery_stage_seconds_total Tiempo exclusivo por etapa del pipeline",
+              "# TYPE discovery_stage_seconds_total counter"]
+    for c in countries:
+        for name, secs in (c.get("stage_seconds") or {}).items():
+            lines.append(f"discovery_stage_seconds_total{_labels(country=c['country'], stage=name)} {secs}")
+    lines += ["# HELP discovery_country_seconds Duración de la corrida por país",
+              "# TYPE discovery_country_seconds gauge"]
+    lines += [f"discovery_country_seconds{_labels(country=c['country'])} {c.get('elapsed_seconds', 0)}"
+              for c in countries]
+    lines += ["# HELP discovery_exported_rows Filas exportadas por país",
+              "# TYPE discovery_exported_rows gauge"]
+    lines += [f"discovery_exported_rows{_labels(country=c['country'])} "
+              f"{c.get('raw_rows', 0) - c.get('total_filtered', 0)}" for c in countries]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str, http: HttpMetrics, countries: Iterable[Dict[str, Any]] = ()) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".part"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(to_prometheus(http, countries))
+    os.replace(tmp, path)
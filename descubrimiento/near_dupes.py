@@ -0,0 +1,257 @@
+"""
+Detección de casi-duplicados: el mismo dataset republicado con otro id (subdominios
+Socrata de un país, organizaciones federales y estatales de un mismo CKAN).
+
+- Texto: name + description + tags, en minúsculas, sin tildes y sin palabras vacías.
+  Los shingles son pares de palabras consecutivas.
+- Firma MinHash de una sola permutación (one-permutation hashing con densificación):
+  un hash por shingle reparte los valores en `NUM_BINS` casilleros y cada uno guarda su
+  mínimo. El costo es O(shingles) por fila, en vez de O(shingles x permutaciones).
+  Cada casillero se guarda con 16 bits, así que la firma ocupa 128 bytes por fila.
+- LSH por bandas: por cada banda se ordenan las filas por el valor de su banda y solo
+  se comparan filas con la banda idéntica, cada una contra unos pocos representantes
+  del grupo. No hay comparaciones entre todos los pares y el costo crece como
+  n log n. Un candidato se confirma si la similitud de Jaccard estimada con la firma
+  completa alcanza el umbral; los confirmados se unen con union-find.
+- Salida: `cluster_id` (estable entre corridas mientras no cambie el canónico) y
+  `canonical_id`, el id del representante del grupo: el de más descargas y, a igualdad,
+  el publicado primero. Las filas sin casi-duplicados son su propio grupo.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import unicodedata
+import zlib
+from array import array
+from datetime import date
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from records import as_dict, publication_day
+
+
+NEAR_DUPE_FIELDS = ("cluster_id", "canonical_id")
+NUM_BINS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_BINS // BANDS
+DEFAULT_THRESHOLD = 0.7
+# Tope de representantes por grupo de banda: acota el trabajo en bandas muy pobladas
+MAX_BUCKET_REPS = 4
+# La descripción aporta las primeras palabras: suficiente para reconocer una copia
+MAX_TOKENS = 80
+
+_MASK64 = (1 << 64) - 1
+_GOLDEN = 0x9E3779B97F4A7C15
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Secuencia de sondeo por casillero para la densificación
+_PROBES = tuple(
+    tuple((zlib.crc32(f"{i}:{a}".encode("ascii")) * _GOLDEN & _MASK64) >> 58 for a in range(4 * NUM_BINS))
+    for i in range(NUM_BINS)
+)
+_STOPWORDS = frozenset(
+    "a al con de del el en es la las los o para por se su sus un una y the of and".split()
+)
+
+
+def normalize_text(row: Dict[str, Any]) -> List[str]:
+    """Palabras de name + description + tags, normalizadas."""
+    parts = [row.get("name"), row.get("description"), row.get("tags")]
+    text = " ".join(str(p) for p in parts if p)
+    text = unicodedata.normalize("NFKD", text.lower()).encode("ascii", "ignore").decode("ascii")
+    tokens = [t for t in _TOKEN.findall(text) if t not in _STOPWORDS]
+    return tokens[:MAX_TOKENS]
+
+
+def shingles(tokens: List[str]) -> Iterable[str]:
+    if len(tokens) < 2:
+        return tokens
+    return {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+
+
+def signature(tokens: List[str]) -> Optional[array]:
+    """Firma de `NUM_BINS` casilleros de 16 bits; None si la fila no tiene texto."""
+    bins = [_MASK64] * NUM_BINS
+    empty = True
+    for s in shingles(tokens):
+        # crc32 es rápido y estable entre procesos; la multiplicación reparte sus bits
+        h = (zlib.crc32(s.encode("utf-8")) * _GOLDEN) & _MASK64
+        b = h >> 58
+        v = h & 0x3FFFFFFFFFFFFFF
+        if v < bins[b]:
+            bins[b] = v
+            empty = False
+    if empty:
+        return None
+    # Densificación: un casillero vacío copia el de otro casillero no vacío elegido con
+    # una secuencia de sondeo fija (igual para todas las filas). A diferencia de copiar
+    # el vecino, cada casillero vacío toma una muestra distinta y la estimación conserva
+    # la precisión de `NUM_BINS` casilleros aunque el texto tenga pocos shingles.
+    out = array("H", bytes(2 * NUM_BINS))
+    for i in range(NUM_BINS):
+        v = bins[i]
+        if v == _MASK64:
+            for j in _PROBES[i]:
+                if bins[j] != _MASK64:
+                    v = bins[j]
+                    break
+            else:
+                j = i
+                while bins[j] == _MASK64:
+                    j = (j + 1) % NUM_BINS
+                v = bins[j]
+        out[i] = v >> 42
+    return out
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = array("i")
+
+    def add(self) -> None:
+        self.parent.append(len(self.parent))
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> None:
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # La raíz es siempre la fila más antigua: el orden de unión no importa
+            if rb < ra:
+                ra, rb = rb, ra
+            self.parent[rb] = ra
+
+
+class NearDupeIndex:
+    """Acumula firmas fila a fila y agrupa los casi-duplicados con `cluster()`."""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._min_equal = int(threshold * NUM_BINS + 0.999)
+        self._sigs = array("H")
+        self._has_text = bytearray()
+        self._downloads = array("q")
+        self._days = array("i")
+        self._ids: List[str] = []
+        self._keys = array("Q")
+        self._uf = _UnionFind()
+        self._labels: Optional[List[int]] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, row: Dict[str, Any]) -> int:
+        """Registra una fila y devuelve su índice."""
+        sig = signature(normalize_text(row))
+        self._has_text.append(sig is not None)
+        self._sigs.extend(sig if sig is not None else array("H", bytes(2 * NUM_BINS)))
+        try:
+            downloads = int(row.get("download_count") or -1)
+        except (TypeError, ValueError):
+            downloads = -1
+        self._downloads.append(downloads)
+        day = publication_day(row)
+        self._days.append(day.toordinal() if isinstance(day, date) else 0x7FFFFFFF)
+        row_id = str(row.get("id") or "")
+        self._ids.append(row_id)
+        digest = hashlib.blake2b(f"{row_id}|{row.get('permalink') or ''}".encode("utf-8"), digest_size=8)
+        self._keys.append(int.from_bytes(digest.digest(), "big"))
+        self._uf.add()
+        return len(self._ids) - 1
+
+    def _equal_slots(self, i: int, j: int) -> int:
+        a = self._sigs[i * NUM_BINS:(i + 1) * NUM_BINS]
+        b = self._sigs[j * NUM_BINS:(j + 1) * NUM_BINS]
+        return sum(x == y for x, y in zip(a, b))
+
+    def similarity(self, i: int, j: int) -> float:
+        """Jaccard estimado entre las filas `i` y `j`."""
+        return self._equal_slots(i, j) / NUM_BINS
+
+    def cluster(self) -> None:
+        """Une los casi-duplicados (LSH por bandas) y elige el canónico de cada grupo."""
+        n = len(self._ids)
+        uf = self._uf
+        raw = memoryview(self._sigs).cast("B")
+        row_bytes = 2 * NUM_BINS
+        band_bytes = 2 * ROWS_PER_BAND
+        with_text = [i for i in range(n) if self._has_text[i]]
+        for band in range(BANDS):
+            off = band * band_bytes
+            keys = {i: raw[i * row_bytes + off:i * row_bytes + off + band_bytes].tobytes() for i in with_text}
+            order = sorted(with_text, key=keys.__getitem__)
+            reps: List[int] = []
+            prev = None
+            for i in order:
+                key = keys[i]
+                if key != prev:
+                    reps = [i]
+                    prev = key
+                    continue
+                root = uf.find(i)
+                for rep in reps:
+                    if uf.find(rep) == root:
+                        break
+                    if self._equal_slots(i, rep) >= self._min_equal:
+                        uf.union(i, rep)
+                        break
+                else:
+                    if len(reps) < MAX_BUCKET_REPS:
+                        reps.append(i)
+        # Canónico por grupo: más descargas, luego publicado primero, luego visto primero
+        best: Dict[int, int] = {}
+        for i in range(n):
+            root = uf.find(i)
+            cur = best.get(root)
+            if cur is None or (-self._downloads[i], self._days[i], i) < (-self._downloads[cur], self._days[cur], cur):
+                best[root] = i
+        self._labels = [best[uf.find(i)] for i in range(n)]
+
+    def labels(self, i: int) -> Tuple[str, str]:
+        """(cluster_id, canonical_id) de la fila `i` (requiere `cluster()`)."""
+        canonical = self._labels[i]
+        return f"{self._keys[canonical]:016x}", self._ids[canonical]
+
+    def stats(self) -> Dict[str, int]:
+        """Grupos con más de una fila y filas que no son el canónico de su grupo."""
+        sizes: Dict[int, int] = {}
+        for c in self._labels or ():
+            sizes[c] = sizes.get(c, 0) + 1
+        groups = sum(1 for s in sizes.values() if s > 1)
+        return {"near_dupe_clusters": groups,
+                "near_dupe_rows": sum(s - 1 for s in sizes.values() if s > 1)}
+
+
+def annotate_near_dupes(rows: Iterable[Any], spool_dir: str, threshold: float = DEFAULT_THRESHOLD,
+                        stats: Optional[Dict[str, int]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Agrega `cluster_id` y `canonical_id` a cada fila. Los grupos se conocen recién al ver
+    todas las filas, así que se hacen dos pasadas: la primera indexa y vuelca las filas a
+    un NDJSON temporal en `spool_dir`, y la segunda las relee con sus etiquetas. En
+    memoria solo quedan las firmas.
+    """
+    os.makedirs(spool_dir, exist_ok=True)
+    index = NearDupeIndex(threshold)
+    fd, spool = tempfile.mkstemp(prefix=".near_dupes_", suffix=".ndjson", dir=spool_dir)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for row in rows:
+                index.add(row)
+                f.write(json.dumps(as_dict(row), ensure_ascii=False))
+                f.write("\n")
+        index.cluster()
+        if stats is not None:
+            stats.update(index.stats())
+        with open(spool, "r", encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                row = json.loads(line)
+                row["cluster_id"], row["canonical_id"] = index.labels(i)
+                yield row
+    finally:
+        if os.path.exists(spool):
+            os.remove(spool)
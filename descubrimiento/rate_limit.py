@@ -0,0 +1,237 @@
+"""
+Limitador de tasa por host compartido por todas las sesiones, hilos y el cliente asyncio.
+
+- Un token bucket por host (`limiter_for`): cada solicitud que sale a la red toma un
+  token; los hits de la caché HTTP no consumen cuota.
+- Cuotas conocidas por host (`register_quota`), distintas con y sin X-App-Token
+  (Socrata mide aparte las solicitudes con token).
+- Retry-After bloquea el host completo, no solo el hilo que recibió el 429/503.
+- Adaptación AIMD: cada 429/503 reduce la tasa a la mitad (una vez por ráfaga) y cada
+  intervalo sin rechazos la sube un paso, sin superar la cuota configurada. Los hosts
+  sin cuota no se limitan hasta el primer rechazo.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+THROTTLE_STATUS = frozenset({429, 503})
+# Tasa inicial (req/s) de un host sin cuota tras su primer rechazo
+ADAPTIVE_START_RATE = 5.0
+MIN_RATE = 0.05
+DECREASE_FACTOR = 0.5
+# Un solo recorte por ráfaga de rechazos concurrentes
+DECREASE_COOLDOWN = 1.0
+INCREASE_INTERVAL = 1.0
+INCREASE_FRACTION = 0.1
+
+Quota = Tuple[float, float]  # (solicitudes por segundo, ráfaga)
+
+
+class TokenBucket:
+    """Token bucket con bloqueo por Retry-After y tasa adaptativa (thread-safe)."""
+
+    def __init__(self, rate: Optional[float] = None, burst: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.ceiling = rate
+        self.rate = rate
+        self.capacity = max(1.0, burst)
+        self.tokens = self.capacity
+        self._lock = threading.Lock()
+        now = clock()
+        self._updated = now
+        self._blocked_until = 0.0
+        self._last_decrease = float("-inf")
+        self._last_increase = now
+        self.throttled = 0
+
+    def set_quota(self, rate: Optional[float], burst: float) -> None:
+        with self._lock:
+            self.ceiling = rate
+            self.rate = rate if self.rate is None or rate is None else min(self.rate, rate)
+            self.capacity = max(1.0, burst)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self, now: float) -> None:
+        if self.rate is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Toma un token y devuelve cuántos segundos hay que esperar antes de usarlo."""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            wait = max(0.0, self._blocked_until - now)
+            if self.rate is None:
+                return wait
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    def acquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        """Registra un 429/503: respeta Retry-After y reduce la tasa (AIMD)."""
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self.throttled += 1
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+            if now - self._last_decrease < DECREASE_COOLDOWN:
+                return
+            self._last_decrease = now
+            self._last_increase = now
+            if self.rate is None:
+                self.rate = ADAPTIVE_START_RATE
+            else:
+                self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
+            # Sin ráfaga acumulada: la nueva tasa aplica de inmediato
+            self.tokens = min(self.tokens, 0.0)
+
+    def on_success(self) -> None:
+        with self._lock:
+            if self.rate is None:
+                return
+            now = self.clock()
+            if now - self._last_increase < INCREASE_INTERVAL:
+                return
+            self._last_increase = now
+            step = INCREASE_FRACTION * (self.ceiling or max(self.rate, ADAPTIVE_START_RATE))
+            self.rate += step
+            if self.ceiling is not None:
+                self.rate = min(self.rate, self.ceiling)
+
+
+_quotas: Dict[str, Tuple[Optional[Quota], Optional[Quota]]] = {}
+_default_rate: Optional[float] = float(os.environ["DISCOVERY_RATE"]) if os.environ.get("DISCOVERY_RATE") else None
+_limiters: Dict[str, TokenBucket] = {}
+_with_token: Dict[str, bool] = {}
+_registry_lock = threading.Lock()
+
+
+def _host_of(url: str) -> str:
+    return urlparse(url).netloc.lower() or url
+
+
+def register_quota(url: str, with_token: Optional[Quota] = None, without_token: Optional[Quota] = None) -> None:
+    """Declara la cuota conocida del host de `url` (req/s, ráfaga) con y sin app token."""
+    with _registry_lock:
+        _quotas[_host_of(url)] = (with_token, without_token)
+
+
+def set_default_rate(rate: Optional[float]) -> None:
+    """Tope (req/s) para hosts sin cuota registrada; None o 0 = solo adaptativo."""
+    global _default_rate
+    with _registry_lock:
+        _default_rate = rate or None
+        _limiters.clear()
+        _with_token.clear()
+
+
+def _quota_for(host: str, has_token: bool) -> Quota:
+    with_token, without_token = _quotas.get(host, (None, None))
+    quota = with_token if has_token else without_token
+    if quota:
+        return quota
+    return (_default_rate, _default_rate or 1.0) if _default_rate else (None, 1.0)
+
+
+def limiter_for(url: str, has_token: bool = False) -> TokenBucket:
+    """Limitador compartido del host de `url`; la cuota con token reemplaza a la anónima."""
+    host = _host_of(url)
+    with _registry_lock:
+        bucket = _limiters.get(host)
+        if bucket is None:
+            bucket = TokenBucket(*_quota_for(host, has_token))
+            _limiters[host] = bucket
+            _with_token[host] = has_token
+        elif has_token and not _with_token[host]:
+            bucket.set_quota(*_quota_for(host, True))
+            _with_token[host] = True
+        return bucket
+
+
+def reset_limiters() -> None:
+    with _registry_lock:
+        _limiters.clear()
+        _with_token.clear()
+
+
+def _pool_url(pool) -> str:
+    port = getattr(pool, "port", None)
+    default = {"http": 80, "https": 443}.get(getattr(pool, "scheme", ""), None)
+    netloc = pool.host if port in (None, default) else f"{pool.host}:{port}"
+    return f"{pool.scheme}://{netloc}"
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class AdaptiveRetry(Retry):
+    """
+    Retry de urllib3 que, en vez de dormir solo al hilo que recibió el 429/503,
+    informa al limitador del host (Retry-After bloquea a todos los hilos) y toma un
+    token antes de cada reintento.
+    """
+
+    _limiter_url: Optional[str] = None
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        new_retry = super().increment(method=method, url=url, response=response, error=error,
+                                      _pool=_pool, _stacktrace=_stacktrace)
+        if _pool is not None:
+            new_retry._limiter_url = _pool_url(_pool)
+        return new_retry
+
+    def sleep(self, response=None) -> None:
+        if self._limiter_url is None:
+            return super().sleep(response)
+        limiter = limiter_for(self._limiter_url)
+        retry_after = None
+        if response is not None and response.status in THROTTLE_STATUS:
+            if self.respect_retry_after_header:
+                retry_after = self.get_retry_after(response)
+            limiter.on_throttle(retry_after)
+        if retry_after is None:
+            self._sleep_backoff()
+        limiter.acquire()
+
+
+class ThrottledAdapter(HTTPAdapter):
+    """
+    HTTPAdapter que toma un token del host antes de cada envío a la red. Deja en
+    `resp.latency` el tiempo de red (reintentos incluidos, sin la espera por cuota).
+    """
+
+    def send(self, request, **kwargs):
+        limiter = limiter_for(request.url, has_token="X-App-Token" in request.headers)
+        limiter.acquire()
+        t0 = time.perf_counter()
+        resp = super().send(request, **kwargs)
+        if not kwargs.get("stream"):
+            resp.content  # el cuerpo se lee aquí para que la latencia lo incluya
+        resp.latency = time.perf_counter() - t0
+        if resp.status_code in THROTTLE_STATUS:
+            limiter.on_throttle(_parse_retry_after(resp.headers.get("Retry-After")))
+        else:
+            limiter.on_success()
+        return resp
@@ -0,0 +1,133 @@
+"""
+Representación compacta de un dataset normalizado.
+
+`DatasetRecord` reemplaza al dict por fila de `normalize_result` / `normalize_ckan_result`:
+usa __slots__ (sin diccionario por instancia) e interna los campos de baja cardinalidad
+(dominio, tipo, licencia, organización, categorías), que se repiten en miles de filas.
+Expone la misma interfaz de lectura que un dict (`get`, `[]`, `keys`, `items`, `in`)
+para que deduplicación, filtros, resumen y sinks no dependan del tipo concreto.
+
+`publication_date` se parsea una sola vez al construir el registro: el día queda en el
+atributo tipado `published_on` (no forma parte de las columnas exportadas).
+"""
+import sys
+from datetime import date
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dates import parse_day
+
+
+RECORD_FIELDS: Tuple[str, ...] = (
+    "name",
+    "id",
+    "type",
+    "description",
+    "domain",
+    "permalink",
+    "link",
+    "domain_category",
+    "categories",
+    "tags",
+    "download_count",
+    "publication_date",
+    "updated_at",
+    "num_resources",
+    "license",
+    "organization",
+)
+_FIELD_SET = frozenset(RECORD_FIELDS)
+
+# Valores que se repiten entre filas: se internan para compartir una sola copia
+INTERNED_FIELDS = frozenset({"type", "domain", "domain_category", "categories", "license", "organization"})
+
+
+def intern_value(value: Any) -> Any:
+    return sys.intern(value) if type(value) is str else value
+
+
+class DatasetRecord:
+    __slots__ = RECORD_FIELDS + ("published_on", "_extra")
+
+    def __init__(self, **fields: Any):
+        for name in RECORD_FIELDS:
+            value = fields.pop(name, None)
+            if name in INTERNED_FIELDS:
+                value = intern_value(value)
+            setattr(self, name, value)
+        self.published_on: Optional[date] = parse_day(self.publication_date)
+        # Campos agregados por etapas posteriores (p.ej. enriquecimiento)
+        self._extra = fields or None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in _FIELD_SET:
+            return getattr(self, key)
+        extra = self._extra
+        return extra.get(key, default) if extra else default
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELD_SET:
+            return getattr(self, key)
+        extra = self._extra
+        if extra and key in extra:
+            return extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in _FIELD_SET:
+            setattr(self, key, intern_value(value) if key in INTERNED_FIELDS else value)
+            if key == "publication_date":
+                self.published_on = parse_day(value)
+            return
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __contains__(self, key: object) -> bool:
+        return key in _FIELD_SET or bool(self._extra and key in self._extra)
+
+    def keys(self) -> List[str]:
+        return list(RECORD_FIELDS) + (list(self._extra) if self._extra else [])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(RECORD_FIELDS) + (len(self._extra) if self._extra else 0)
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(k, self[k]) for k in self.keys()]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, DatasetRecord):
+            return self.items() == other.items()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None  # mutable, como un dict
+
+    def __repr__(self) -> str:
+        return f"DatasetRecord(id={self.id!r}, name={self.name!r})"
+
+
+def as_dict(row: Any) -> Dict[str, Any]:
+    """Convierte una fila (dict o DatasetRecord) a dict plano, p.ej. para json.dump."""
+    if isinstance(row, DatasetRecord):
+        return row.to_dict()
+    if isinstance(row, dict):
+        return row
+    raise TypeError(f"Objeto no serializable: {type(row).__name__}")
+
+
+def publication_day(row: Any) -> Optional[date]:
+    """Día de publicación ya parseado; para dicts planos (p.ej. catálogo previo) se parsea aquí."""
+    if isinstance(row, DatasetRecord):
+        return row.published_on
+    return parse_day(row.get("publication_date"))
+
+
+def record_from_dict(data: Optional[Dict[str, Any]]) -> DatasetRecord:
+    return DatasetRecord(**(data or {}))
@@ -1,17 +1,33 @@
 import os
 import json
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 import unicodedata
 import time
 
-from socrata_discovery import fetch_by_domains, save_json, save_csv, load_app_token
-from ckan_client import fetch_ckan_by_config
+from socrata_discovery import DOMAIN_BATCH_SIZE, PAGINATION_MODES, iter_by_domains, save_json, save_csv, load_app_token, set_pagination
+from ckan_client import iter_ckan_by_config, set_lean
+from concurrency import set_per_host_limit
+from catalog_index import DEFAULT_INDEX_DB, IndexSink
+from checkpoints import CheckpointStore
+from enrichment import DEFAULT_WORKERS as ENRICH_WORKERS, ENRICH_FIELDS, enrich_rows
+from near_dupes import NEAR_DUPE_FIELDS, annotate_near_dupes
+from http_cache import DEFAULT_TTL, configure_cache
+import json_decoder
+import transport
+from metrics import HTTP, StageTimer, write_prometheus
+from rate_limit import set_default_rate
+from sinks import (CATALOG_FIELDS, COLUMNAR_FORMATS, ROLLUP_COUNTRY, SINKS, SummarySink, iter_catalog, open_sinks,
+                   save_summary_columnar, save_summary_cube)
+from records import publication_day
+from watermarks import load_watermarks, max_timestamp, save_watermarks, state_path
 
 
 HERE = os.path.dirname(__file__)
 DOMAINS_FILE = os.path.join(HERE, "latam_domains.json")
 CONFIG_FILE = os.path.join(HERE, "config.json")
 OUTPUT_DIR = os.path.join(HERE, "output")
+STATE_DIR = os.path.join(OUTPUT_DIR, "state")
+DEFAULT_FORMATS = ("json", "csv")
 
 
 def load_domains(path: str = DOMAINS_FILE) -> Dict[str, Dict]:
@@ -21,22 +37,34 @@ def load_domains(path: str = DOMAINS_FILE) -> Dict[str, Dict]:
         return data
 
 
-def _aggregate_summary(rows: List[dict]) -> List[dict]:
-    from collections import Counter
-    by_type = Counter(r.get("type") or "unknown" for r in rows)
-    by_category = Counter()
+def _aggregate_summary(rows: Iterable[dict]) -> List[dict]:
+    summary = SummarySink()
     for r in rows:
-        cats = (r.get("categories") or "").split(",") if r.get("categories") else []
-        for c in cats:
-            c = c.strip()
-            if c:
-                by_category[c] += 1
-    summary_rows = []
-    for k, v in sorted(by_type.items(), key=lambda x: (-x[1], x[0] or "")):
-        summary_rows.append({"metric": "type", "key": k, "count": v})
-    for k, v in sorted(by_category.items(), key=lambda x: (-x[1], x[0])):
-        summary_rows.append({"metric": "category", "key": k, "count": v})
-    return summary_rows
+        summary.write(r)
+    return summary.rows()
+
+
+def _save_summary(prefix: str, summary: SummarySink, formats: Sequence[str], rollup: Optional[str] = None) -> None:
+    """Escribe <prefix>_summary.csv (conteos planos), sus variantes columnares y <prefix>_summary_cube.csv."""
+    summary_rows = summary.rows()
+    save_csv(os.path.join(OUTPUT_DIR, f"{prefix}_summary.csv"), summary_rows)
+    for fmt in COLUMNAR_FORMATS:
+        if fmt in formats:
+            ext = SINKS[fmt][0]
+            save_summary_columnar(os.path.join(OUTPUT_DIR, f"{prefix}_summary{ext}"), summary_rows, fmt)
+    save_summary_cube(os.path.join(OUTPUT_DIR, f"{prefix}_summary_cube.csv"), summary.cube_rows(rollup))
+
+
+def save_rollup(summaries: Iterable[SummarySink], formats: Sequence[str] = DEFAULT_FORMATS) -> SummarySink:
+    """
+    Consolida los resúmenes ya acumulados de cada país en latam_summary*.csv, sin releer
+    los catálogos exportados. El cubo incluye las filas de cada país y las del total.
+    """
+    total = SummarySink(ROLLUP_COUNTRY)
+    for summary in summaries:
+        total.merge(summary)
+    _save_summary(_safe_slug(ROLLUP_COUNTRY), total, formats, rollup=ROLLUP_COUNTRY)
+    return total
 
 
 def _parse_date(s: Optional[str]):
@@ -52,6 +80,12 @@ def _parse_date(s: Optional[str]):
     return None
 
 
+def _iso_day(s: Optional[str]) -> Optional[str]:
+    """Normaliza una fecha de CLI/config a YYYY-MM-DD para empujarla a la consulta del portal."""
+    d = _parse_date(s)
+    return d.isoformat() if d else None
+
+
 def _safe_slug(text: str) -> str:
     """Normaliza texto para usarlo de forma portable en nombres de archivo."""
     normalized = unicodedata.normalize("NFKD", text)
@@ -60,110 +94,341 @@ def _safe_slug(text: str) -> str:
     return slug or "pais"
 
 
-def _dedupe_rows(rows: List[dict]) -> List[dict]:
-    """Elimina duplicados por (id, permalink) preservando orden."""
+def _iter_dedupe(rows: Iterable[dict]) -> Iterator[dict]:
+    """Elimina duplicados por (id, permalink) preservando orden, fila a fila."""
     seen = set()
-    out: List[dict] = []
     for row in rows:
         key = (row.get("id"), row.get("permalink"))
         if key in seen:
             continue
         seen.add(key)
-        out.append(row)
-    return out
+        yield row
 
 
-def _filter_by_publication_date(rows: List[dict], dfrom: Optional[str], dto: Optional[str]) -> List[dict]:
+def _dedupe_rows(rows: List[dict]) -> List[dict]:
+    """Elimina duplicados por (id, permalink) preservando orden."""
+    return list(_iter_dedupe(rows))
+
+
+def _iter_filter_by_publication_date(rows: Iterable[dict], dfrom: Optional[str],
+                                     dto: Optional[str]) -> Iterator[dict]:
     if not dfrom and not dto:
-        return rows
-    from datetime import datetime
+        yield from rows
+        return
     dfrom_d = _parse_date(dfrom)
     dto_d = _parse_date(dto)
-
-    def parse_item_date(item_date: Optional[str]):
-        if not item_date:
-            return None
-        s = item_date.strip()
-        # Manejar sufijo Z (UTC) convirtiéndolo a offset ISO compatible
-        if s.endswith("Z"):
-            s = s[:-1] + "+00:00"
-        # Intentar ISO nativo
-        try:
-            return datetime.fromisoformat(s).date()
-        except Exception:
-            pass
-        # Intentar patrones comunes sin zona
-        for fmt in ("%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
-            try:
-                return datetime.strptime(s[:26], fmt).date()
-            except ValueError:
-                continue
-        return None
-
-    out = []
+    # El día ya viene parseado en cada DatasetRecord: el filtro es una comparación
     for r in rows:
-        pd = r.get("publication_date")
-        dt = parse_item_date(pd) if isinstance(pd, str) else None
+        dt = publication_day(r)
         if dfrom_d and (not dt or dt < dfrom_d):
             continue
         if dto_d and (not dt or dt > dto_d):
             continue
-        out.append(r)
-    return out
+        yield r
+
+
+def _filter_by_publication_date(rows: List[dict], dfrom: Optional[str], dto: Optional[str]) -> List[dict]:
+    if not dfrom and not dto:
+        return rows
+    return list(_iter_filter_by_publication_date(rows, dfrom, dto))
+
+
+def _counted(rows: Iterable[dict], counts: Dict[str, int], key: str) -> Iterator[dict]:
+    for row in rows:
+        counts[key] += 1
+        yield row
+
+
+def _catalog_source(base: str, formats: Sequence[str]) -> str:
+    """Archivo del catálogo previo sobre el que se aplica un delta (prefiere JSON)."""
+    for fmt in ("json", "ndjson", "parquet", "arrow", "csv"):
+        if fmt in formats:
+            return base + SINKS[fmt][0]
+    return base + ".json"
+
+
+def _load_catalog(path: str) -> List[dict]:
+    try:
+        return list(iter_catalog(path))
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+def _iter_merge_delta(existing: Iterable[dict], delta: List[dict]) -> Iterator[dict]:
+    """
+    Aplica un delta sobre el catálogo previo en streaming: reemplaza por (id, permalink)
+    y agrega lo nuevo al final. Solo el delta se mantiene en memoria.
+    """
+    pending = {(r.get("id"), r.get("permalink")): r for r in delta}
+    for row in existing:
+        key = (row.get("id"), row.get("permalink"))
+        yield pending.pop(key, row)
+    yield from pending.values()
+
+
+def _advance_watermarks(platform: str, config: Dict, rows: List[dict], marks: Dict[str, str],
+                        per_domain_limit: int) -> Dict[str, str]:
+    """Calcula las nuevas marcas por dominio (Socrata) o base_url (CKAN) a partir del delta."""
+    new_marks = dict(marks)
+    if platform == "socrata":
+        for domain in config.get("domains", []):
+            domain_rows = [r for r in rows if r.get("domain") == domain]
+            if len(domain_rows) >= per_domain_limit:
+                # Orden descendente: un delta truncado dejaría huecos si la marca avanzara
+                print(f"ADVERTENCIA: el delta de '{domain}' alcanzó el límite ({per_domain_limit}); "
+                      f"la marca no avanza. Aumente --limit.")
+                continue
+            mark = max_timestamp((r.get("updated_at") for r in domain_rows), marks.get(domain))
+            if mark:
+                new_marks[domain] = mark
+    elif platform == "ckan":
+        base_url = config.get("base_url", "https://datos.gob.mx")
+        mark = max_timestamp((r.get("updated_at") for r in rows), marks.get(base_url))
+        if mark:
+            new_marks[base_url] = mark
+    return new_marks
 
 
 def run_for_country(country: str, config: Dict, q: Optional[str] = None, categories: Optional[List[str]] = None,
                     per_domain_limit: int = 1000, published_from: Optional[str] = None, published_to: Optional[str] = None,
-                    with_metrics: bool = False):
+                    with_metrics: bool = False, workers: int = 1, prefetch: int = 0, incremental: bool = False,
+                    formats: Sequence[str] = DEFAULT_FORMATS, index_db: Optional[str] = None,
+                    checkpoints: bool = False, resume: bool = False, near_dupes: bool = False,
+                    batch_domains: int = 1, summary: Optional[SummarySink] = None, enrich: bool = False,
+                    enrich_workers: int = ENRICH_WORKERS):
+    """
+    Consulta, deduplica, filtra y exporta el catálogo de un país.
+    Con `checkpoints` el avance de cada dominio/portal se guarda por página en
+    STATE_DIR; con `resume` una corrida interrumpida sigue desde el último checkpoint
+    en vez de volver a pedir las páginas ya obtenidas. Con batch_domains > 1 los dominios
+    Socrata chicos se consultan de a lotes de ese tamaño. `summary` recibe los conteos
+    del país (p.ej. para el consolidado de `run_all`). Con `enrich` cada fila se completa
+    con formatos, bytes y filas (`enrichment`) usando `enrich_workers` hilos.
+    """
     platform = config.get("platform", "socrata")
     start_t = time.perf_counter()
-    http_stats = {"requests": 0, "retries": 0}
+    timer = StageTimer()
+    http_stats = {"requests": 0, "retries": 0, "throttled": 0, "cache_hits": 0, "cache_misses": 0}
+    country_slug = _safe_slug(country)
+    catalog_path = _catalog_source(os.path.join(OUTPUT_DIR, f"{country_slug}_catalog"), formats)
+    marks_path = state_path(STATE_DIR, country_slug)
+    marks: Dict[str, str] = {}
+    if incremental and os.path.exists(catalog_path):
+        # Sin catálogo previo no hay sobre qué aplicar un delta: se hace corrida completa
+        marks = load_watermarks(marks_path)
+    # Ventana de fechas empujada al portal; el filtro local queda como red de seguridad
+    day_from, day_to = _iso_day(published_from), _iso_day(published_to)
+    checkpoint = None
+    if checkpoints or resume:
+        # Un checkpoint solo vale para la misma consulta
+        signature = {"config": config, "q": q, "categories": categories, "limit": per_domain_limit,
+                     "published_from": published_from, "published_to": published_to, "marks": marks}
+        checkpoint = CheckpointStore(STATE_DIR, country_slug, signature, resume=resume)
     
     if platform == "socrata":
         domains = config.get("domains", [])
-        rows = fetch_by_domains(domains, q=q, categories=categories, per_domain_limit=per_domain_limit, stats=http_stats)
+        rows = iter_by_domains(domains, q=q, categories=categories, per_domain_limit=per_domain_limit, stats=http_stats,
+                               workers=workers, updated_since=marks or None,
+                               published_from=day_from, published_to=day_to, checkpoint=checkpoint,
+                               prefetch=prefetch, batch_size=batch_domains)
     elif platform == "ckan":
         base_url = config.get("base_url", "https://datos.gob.mx")
         # Convertir categories a groups para CKAN
         groups = categories if categories else None
-        rows = fetch_ckan_by_config(base_url=base_url, q=q, groups=groups, per_query_limit=per_domain_limit, stats=http_stats)
+        rows = iter_ckan_by_config(base_url=base_url, q=q, groups=groups, per_query_limit=per_domain_limit, stats=http_stats,
+                                   prefetch=prefetch, modified_since=marks.get(base_url),
+                                   created_from=day_from, created_to=day_to, checkpoint=checkpoint)
     else:
         print(f"ADVERTENCIA: Plataforma '{platform}' no soportada para {country}")
-        rows = []
+        rows = iter(())
+    rows = timer.timed("fetch", rows)
+
+    if incremental:
+        # El delta es pequeño: se materializa para calcular la nueva marca
+        delta = list(rows)
+        new_marks = _advance_watermarks(platform, config, delta, marks, per_domain_limit)
+        rows = _iter_merge_delta(iter_catalog(catalog_path), delta) if marks else delta
+
+    try:
+        final_count, metrics = _finalize_country(country, platform, rows, http_stats, start_t, published_from,
+                                                 published_to, with_metrics=True, formats=formats, timer=timer,
+                                                 index_db=index_db, near_dupes=near_dupes, summary=summary,
+                                                 enrich=enrich, enrich_workers=enrich_workers)
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+    if checkpoint is not None:
+        metrics["resumed_rows"] = checkpoint.replayed_rows
+        pending = checkpoint.pending_sources()
+        if pending:
+            # Fuentes cortadas por un error: el catálogo exportado está incompleto
+            print(f"ADVERTENCIA: {country}: quedaron incompletos {', '.join(pending)}; "
+                  f"ejecutar de nuevo con --resume para continuar")
+            metrics["pending_sources"] = pending
+        else:
+            checkpoint.clear()
+    if incremental:
+        # La marca se guarda solo después de exportar: si algo falla, el delta se repite
+        if not metrics.get("pending_sources"):
+            save_watermarks(marks_path, new_marks)
+        metrics["incremental"] = bool(marks)
+        metrics["delta_rows"] = len(delta)
+    if with_metrics:
+        return final_count, metrics
+    return final_count
+
+
+def _finalize_country(country: str, platform: str, rows: Iterable[dict], http_stats: Dict[str, int], start_t: float,
+                      published_from: Optional[str], published_to: Optional[str], with_metrics: bool = False,
+                      formats: Sequence[str] = DEFAULT_FORMATS, timer: Optional[StageTimer] = None,
+                      index_db: Optional[str] = None, near_dupes: bool = False,
+                      summary: Optional[SummarySink] = None, enrich: bool = False,
+                      enrich_workers: int = ENRICH_WORKERS):
+    """
+    Deduplica, filtra y exporta las filas de un país (común a modo sync y async).
+    Las filas fluyen una a una desde el generador de consulta hasta los sinks, así que
+    la memoria no crece con el catálogo y las primeras filas llegan a disco mientras
+    se descargan las páginas siguientes. `timer` acumula el tiempo de cada etapa.
+    Con `index_db` las filas exportadas también se indexan en SQLite (`catalog_index`).
+    Con `near_dupes` se agregan las columnas `cluster_id` y `canonical_id` (`near_dupes`);
+    esa etapa necesita ver todas las filas antes de exportar la primera.
+    Con `enrich` las filas que pasan el filtro se enriquecen (`enrichment`) antes de
+    exportarlas, sin cortar el flujo: solo quedan en memoria las que están en vuelo.
+    El resumen se acumula en la misma pasada de exportación; si se pasa `summary`, queda
+    cargado para que el llamador lo consolide con otros países.
+    """
+    timer = timer or StageTimer()
+    counts = {"raw": 0, "deduped": 0}
+    stream = _counted(rows, counts, "raw")
+    stream = _counted(timer.timed("dedupe", _iter_dedupe(stream)), counts, "deduped")
+    stream = timer.timed("filter", _iter_filter_by_publication_date(stream, published_from, published_to))
+    fields = list(CATALOG_FIELDS)
+    enrich_stats: Dict[str, int] = {}
+    if enrich:
+        stream = timer.timed("enrich", enrich_rows(stream, workers=enrich_workers, stats=enrich_stats))
+        fields += ENRICH_FIELDS
+    near_dupe_stats: Dict[str, int] = {}
+    if near_dupes:
+        stream = timer.timed("near_dupes", annotate_near_dupes(stream, OUTPUT_DIR, stats=near_dupe_stats))
+        fields += NEAR_DUPE_FIELDS
 
-    raw_count = len(rows)
-    
-    rows = _dedupe_rows(rows)
-    deduped_count = len(rows)
-    rows = _filter_by_publication_date(rows, published_from, published_to)
-    final_count = len(rows)
     country_slug = _safe_slug(country)
     base = os.path.join(OUTPUT_DIR, f"{country_slug}_catalog")
-    save_json(base + ".json", rows)
-    save_csv(base + ".csv", rows)
-    # summary
-    summary = _aggregate_summary(rows)
-    summary_path = os.path.join(OUTPUT_DIR, f"{country_slug}_summary.csv")
-    save_csv(summary_path, summary)
+    if summary is None:
+        summary = SummarySink(country, platform)
+    sinks = open_sinks(base, formats, fields)
+    if index_db:
+        sinks.append(IndexSink(index_db, country))
+    final_count = 0
+    # Las etapas anteriores corren dentro de cada next(): el timer las descuenta de export
+    with timer.stage("export"):
+        try:
+            for row in stream:
+                for sink in sinks:
+                    sink.write(row)
+                summary.write(row)
+                final_count += 1
+        except BaseException:
+            for sink in sinks:
+                sink.abort()
+            raise
+        for sink in sinks:
+            sink.close()
+        _save_summary(country_slug, summary, formats)
     elapsed_s = time.perf_counter() - start_t
 
+    raw_count, deduped_count = counts["raw"], counts["deduped"]
     metrics = {
         "country": country,
         "platform": platform,
         "elapsed_seconds": round(elapsed_s, 3),
         "http_requests": int(http_stats.get("requests", 0)),
         "http_retries": int(http_stats.get("retries", 0)),
+        "http_throttled": int(http_stats.get("throttled", 0)),
+        "http_cache_hits": int(http_stats.get("cache_hits", 0)),
+        "http_cache_misses": int(http_stats.get("cache_misses", 0)),
+        # Cuerpos por la red (comprimidos) y ya descomprimidos: la diferencia es lo que ahorra gzip/br
+        "http_bytes_wire": int(http_stats.get("bytes_wire", 0)),
+        "http_bytes_decoded": int(http_stats.get("bytes_decoded", 0)),
         "raw_rows": raw_count,
         "dedup_removed": raw_count - deduped_count,
         "date_filtered": deduped_count - final_count,
         "total_filtered": raw_count - final_count,
         "filtered_rate_pct": round(((raw_count - final_count) / raw_count * 100.0), 2) if raw_count else 0.0,
+        "stage_seconds": timer.totals(),
     }
+    metrics.update(near_dupe_stats)
+    metrics.update(enrich_stats)
     if with_metrics:
         return final_count, metrics
     return final_count
 
 
+def _merge_metrics(metrics_list: List[Dict], elapsed_s: float, workers: int) -> Dict:
+    """Combina las métricas por país en un único reporte de ejecución."""
+    totals = {
+        "http_requests": 0,
+        "http_retries": 0,
+        "http_throttled": 0,
+        "http_cache_hits": 0,
+        "http_cache_misses": 0,
+        "http_bytes_wire": 0,
+        "http_bytes_decoded": 0,
+        "raw_rows": 0,
+        "dedup_removed": 0,
+        "date_filtered": 0,
+        "total_filtered": 0,
+        "exported_rows": 0,
+    }
+    for m in metrics_list:
+        for k in totals:
+            if k == "exported_rows":
+                totals[k] += m.get("raw_rows", 0) - m.get("total_filtered", 0)
+            else:
+                totals[k] += m.get(k, 0)
+    country_seconds = sum(m.get("elapsed_seconds", 0.0) for m in metrics_list)
+    return {
+        "workers": workers,
+        "elapsed_seconds": round(elapsed_s, 3),
+        "sum_country_seconds": round(country_seconds, 3),
+        "speedup": round(country_seconds / elapsed_s, 2) if elapsed_s else 0.0,
+        "totals": totals,
+        "countries": metrics_list,
+        "http": HTTP.to_dict(),
+    }
+
+
+def run_all(countries: Dict[str, Dict], workers: int = 1, **kwargs) -> Tuple[List[Tuple[str, int, Dict]], Dict]:
+    """
+    Ejecuta `run_for_country` para varios países.
+    Con workers > 1 los países (y los dominios de cada país) se procesan en un pool
+    acotado; el tiempo total queda marcado por el portal más lento.
+    Con más de un país se escribe además el resumen consolidado (`save_rollup`).
+    Devuelve [(pais, registros, metricas)] en el orden de entrada y el reporte combinado.
+    """
+    start_t = time.perf_counter()
+    summaries = {c: SummarySink(c, cfg.get("platform", "socrata")) for c, cfg in countries.items()}
+
+    def run_one(item):
+        country, config = item
+        count, metrics = run_for_country(country, config, with_metrics=True, workers=workers,
+                                         summary=summaries[country], **kwargs)
+        return country, count, metrics
+
+    items = list(countries.items())
+    if workers <= 1 or len(items) <= 1:
+        results = [run_one(item) for item in items]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+            results = list(pool.map(run_one, items))
+    if len(items) > 1:
+        save_rollup(summaries.values(), kwargs.get("formats", DEFAULT_FORMATS))
+
+    report = _merge_metrics([m for _, _, m in results], time.perf_counter() - start_t, workers)
+    return results, report
+
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Inventario de datasets LATAM usando Socrata Discovery API")
@@ -173,7 +438,68 @@ if __name__ == "__main__":
     parser.add_argument("--limit", type=int, default=1000, help="Límite de items por dominio")
     parser.add_argument("--published-from", dest="published_from", help="Fecha mínima de publicación (YYYY-MM-DD)")
     parser.add_argument("--published-to", dest="published_to", help="Fecha máxima de publicación (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Países/dominios procesados en paralelo (default: 1, secuencial)")
+    parser.add_argument("--per-host", dest="per_host", type=int, default=None,
+                        help="Máximo de solicitudes simultáneas por host (default: 4)")
+    parser.add_argument("--prefetch", type=int, default=0,
+                        help="Páginas descargadas en paralelo una vez conocido el total (CKAN, y Socrata "
+                             "paginado por offset) (default: 0)")
+    parser.add_argument("--pagination", choices=PAGINATION_MODES, default=None,
+                        help="Paginación de la Discovery API de Socrata: offset (hasta 10000 resultados por "
+                             "dominio), scroll (por id, sin tope) o auto (default)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Usar el cliente asyncio (requiere aiohttp) con un pool de conexiones compartido")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Traer solo lo modificado desde la última corrida y fusionarlo en el catálogo")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continuar una corrida interrumpida desde su último checkpoint de paginación")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="Guardar checkpoints de paginación para poder continuar con --resume "
+                             "(--resume los activa)")
+    parser.add_argument("--formats", nargs="+", default=list(DEFAULT_FORMATS), choices=sorted(SINKS),
+                        help="Formatos del catálogo exportado (default: json csv; parquet/arrow requieren pyarrow)")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="Tope de solicitudes/segundo por host sin cuota conocida (default: solo adaptativo)")
+    parser.add_argument("--metrics-out", dest="metrics_out", default=None,
+                        help="Guardar métricas en formato de texto Prometheus (además de run_report.json)")
+    parser.add_argument("--index-db", dest="index_db", nargs="?", const=DEFAULT_INDEX_DB, default=None,
+                        help="Indexar el catálogo en SQLite con búsqueda de texto (default: output/catalog.db); "
+                             "consultar con catalog_index.py")
+    parser.add_argument("--batch-domains", dest="batch_domains", type=int, nargs="?", const=DOMAIN_BATCH_SIZE,
+                        default=None, help="Socrata: consultar los dominios chicos de a lotes de N en una sola "
+                                           "solicitud (default del lote: 20)")
+    parser.add_argument("--lean", action="store_true",
+                        help="CKAN: pedir solo los campos que se exportan (parámetro fl, CKAN >= 2.9)")
+    parser.add_argument("--near-dupes", dest="near_dupes", action="store_true",
+                        help="Agrupar casi-duplicados (MinHash/LSH): agrega cluster_id y canonical_id al catálogo")
+    parser.add_argument("--enrich", action="store_true",
+                        help="Agregar formatos, tamaño en bytes y cantidad de filas de cada dataset "
+                             "(una o más solicitudes extra por dataset)")
+    parser.add_argument("--enrich-workers", dest="enrich_workers", type=int, default=ENRICH_WORKERS,
+                        help=f"Hilos de la etapa de enriquecimiento (default: {ENRICH_WORKERS}; "
+                             f"el cupo por host de --per-host sigue rigiendo)")
+    parser.add_argument("--json-backend", dest="json_backend", choices=json_decoder.BACKENDS, default=None,
+                        help="Decodificador JSON de las páginas (default: orjson si está instalado)")
+    parser.add_argument("--json-stream", dest="json_stream", action="store_true",
+                        help="Decodificar los items de cada página de a uno (menos memoria pico)")
+    parser.add_argument("--cache-dir", dest="cache_dir", default=os.environ.get("DISCOVERY_CACHE_DIR"),
+                        help="Directorio de caché HTTP persistente (default: desactivada)")
+    parser.add_argument("--cache-ttl", dest="cache_ttl", type=float, default=DEFAULT_TTL,
+                        help="Segundos que una respuesta se sirve sin revalidar (default: 43200)")
+    parser.add_argument("--cache-max-mb", dest="cache_max_mb", type=int, default=512,
+                        help="Tamaño máximo de la caché en MB, con eviction LRU (default: 512)")
+    transport.add_arguments(parser)
     args = parser.parse_args()
+    if args.use_async and args.incremental:
+        parser.error("--incremental aún no está disponible con --async")
+    if args.use_async and args.batch_domains:
+        parser.error("--batch-domains aún no está disponible con --async")
+    if args.use_async and (args.resume or args.checkpoint):
+        parser.error("--resume/--checkpoint aún no están disponibles con --async")
+    if args.use_async and args.cache_dir:
+        # La caché es un adapter de requests; aiohttp no pasa por ella
+        parser.error("--cache-dir (o DISCOVERY_CACHE_DIR) aún no está disponible con --async")
 
     # Feedback sobre token
     token = load_app_token()
@@ -195,8 +521,21 @@ if __name__ == "__main__":
     published_from = args.published_from or cfg.get("published_from")
     published_to = args.published_to or cfg.get("published_to")
 
+    if args.per_host:
+        set_per_host_limit(args.per_host)
+    transport.configure_from_args(args)
+    if args.rate:
+        set_default_rate(args.rate)
+    if args.pagination:
+        set_pagination(args.pagination)
+    if args.lean:
+        set_lean(True)
+    if args.json_backend or args.json_stream:
+        json_decoder.configure(backend=args.json_backend, stream=args.json_stream or None)
+    if args.cache_dir:
+        configure_cache(args.cache_dir, ttl=args.cache_ttl, max_bytes=args.cache_max_mb * 1024 * 1024)
+
     domains_map = load_domains()
-    total = 0
     if args.country:
         country_key = None
         # Búsqueda flexible por nombre (case-insensitive)
@@ -206,40 +545,55 @@ if __name__ == "__main__":
                 break
         if not country_key:
             raise SystemExit(f"País no encontrado en latam_domains.json: {args.country}")
-        count, metrics = run_for_country(
-            country_key,
-            domains_map[country_key],
-            q=args.q,
-            categories=args.categories,
-            per_domain_limit=args.limit,
-            published_from=published_from,
-            published_to=published_to,
-            with_metrics=True,
-        )
-        print(f"{country_key}: {count} registros")
+        selected = {country_key: domains_map[country_key]}
+    else:
+        selected = domains_map
+
+    run_kwargs = dict(
+        q=args.q,
+        categories=args.categories,
+        per_domain_limit=args.limit,
+        published_from=published_from,
+        published_to=published_to,
+        prefetch=args.prefetch,
+        formats=args.formats,
+    )
+    if args.incremental:
+        run_kwargs["incremental"] = True
+    if args.index_db:
+        run_kwargs["index_db"] = args.index_db
+    if args.near_dupes:
+        run_kwargs["near_dupes"] = True
+    if args.enrich:
+        run_kwargs["enrich"] = True
+        run_kwargs["enrich_workers"] = args.enrich_workers
+    if args.batch_domains:
+        run_kwargs["batch_domains"] = args.batch_domains
+    if args.checkpoint or args.resume:
+        run_kwargs["checkpoints"] = True
+        run_kwargs["resume"] = args.resume
+    if args.use_async:
+        import asyncio
+        from async_discovery import arun_all
+        run_start = time.perf_counter()
+        results = asyncio.run(arun_all(selected, **run_kwargs))
+        report = _merge_metrics([m for _, _, m in results], time.perf_counter() - run_start, args.workers)
+    else:
+        results, report = run_all(selected, workers=args.workers, **run_kwargs)
+    total = 0
+    for country, count, metrics in results:
+        print(f"{country}: {count} registros")
         print(
             f"  metricas -> tiempo={metrics['elapsed_seconds']}s, "
             f"requests={metrics['http_requests']}, retries={metrics['http_retries']}, "
+            f"429/503={metrics['http_throttled']}, "
+            f"cache={metrics['http_cache_hits']}/{metrics['http_cache_hits'] + metrics['http_cache_misses']}, "
+            f"red={metrics['http_bytes_wire'] / 2**20:.1f}/{metrics['http_bytes_decoded'] / 2**20:.1f} MB, "
             f"filtrados={metrics['total_filtered']} ({metrics['filtered_rate_pct']}%)"
         )
         total += count
-    else:
-        for country, config in domains_map.items():
-            count, metrics = run_for_country(
-                country,
-                config,
-                q=args.q,
-                categories=args.categories,
-                per_domain_limit=args.limit,
-                published_from=published_from,
-                published_to=published_to,
-                with_metrics=True,
-            )
-            print(f"{country}: {count} registros")
-            print(
-                f"  metricas -> tiempo={metrics['elapsed_seconds']}s, "
-                f"requests={metrics['http_requests']}, retries={metrics['http_retries']}, "
-                f"filtrados={metrics['total_filtered']} ({metrics['filtered_rate_pct']}%)"
-            )
-            total += count
+    save_json(os.path.join(OUTPUT_DIR, "run_report.json"), report)
+    if args.metrics_out:
+        write_prometheus(args.metrics_out, HTTP, report["countries"])
+    print(f"Tiempo total: {report['elapsed_seconds']}s (suma por país: {report['sum_country_seconds']}s)")
     print(f"Total registros exportados: {total}")
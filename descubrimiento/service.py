@@ -0,0 +1,474 @@
+"""
+Modo servicio: un proceso de larga duración con los catálogos en memoria y una API
+HTTP/JSON local para consultarlos y pedir actualizaciones.
+
+Cada corrida de `run_discovery.py` vuelve a pagar el arranque del intérprete, los
+imports, la lectura de `latam_domains.json` y del token, y los handshakes TLS de sesiones
+nuevas. El servicio hace todo eso una vez: las conexiones del pool compartido de
+`transport` siguen abiertas entre actualizaciones, al arrancar carga los catálogos ya
+exportados y responde desde memoria mientras las actualizaciones corren en segundo plano.
+
+Endpoints (solo GET salvo /refresh):
+    GET  /health                    estado, países cargados y trabajos en cola
+    GET  /countries                 filas, fecha de carga y métricas de la última corrida
+    GET  /datasets?country=&domain=&type=&category=&year=&offset=&limit=
+    GET  /search?q=&country=&domain=&category=&from=&to=&limit=   (índice SQLite, FTS5)
+    GET  /summary?country=&cube=1   resumen de un país o consolidado de todos
+    POST /refresh                   cuerpo opcional {"countries": [...]}; responde 202 y el trabajo
+    GET  /jobs/<id>                 estado de un trabajo de actualización
+
+Uso:
+    python service.py --port 8765 --refresh-on-start --refresh-every 21600
+"""
+import argparse
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import catalog_index
+import run_discovery
+import transport
+from concurrency import set_per_host_limit
+from http_cache import DEFAULT_TTL, configure_cache
+from records import as_dict, publication_day, record_from_dict
+from sinks import ROLLUP_COUNTRY, SummarySink, iter_catalog
+from socrata_discovery import load_app_token
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_PAGE = 1000
+# Trabajos terminados que se conservan para /jobs/<id>
+MAX_JOBS = 200
+
+
+class CountryCatalog:
+    """Catálogo de un país cargado en memoria con su resumen ya acumulado."""
+
+    __slots__ = ("country", "platform", "rows", "summary", "metrics", "loaded_at")
+
+    def __init__(self, country: str, platform: str, rows: List[Any], summary: SummarySink,
+                 metrics: Optional[Dict[str, Any]] = None):
+        self.country = country
+        self.platform = platform
+        self.rows = rows
+        self.summary = summary
+        self.metrics = metrics
+        self.loaded_at = time.time()
+
+    def info(self) -> Dict[str, Any]:
+        return {"country": self.country, "platform": self.platform, "rows": len(self.rows),
+                "loaded_at": _iso(self.loaded_at), "last_run": self.metrics}
+
+
+class UnknownCountry(ValueError):
+    """País que no está en la configuración del servicio."""
+
+
+class IndexUnavailable(RuntimeError):
+    """Todavía no hay índice SQLite para /search."""
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts)) if ts else None
+
+
+class DiscoveryService:
+    """
+    Mantiene los catálogos en memoria y ejecuta las actualizaciones de a una en un hilo
+    propio (dos corridas del mismo país no se pisan). Las consultas leen la última
+    versión cargada de cada país; el reemplazo es atómico, por país.
+    """
+
+    def __init__(self, countries: Dict[str, Dict], run_kwargs: Optional[Dict[str, Any]] = None,
+                 index_db: Optional[str] = catalog_index.DEFAULT_INDEX_DB):
+        self.countries = countries
+        self.run_kwargs = dict(run_kwargs or {})
+        self.formats: Sequence[str] = self.run_kwargs.get("formats", run_discovery.DEFAULT_FORMATS)
+        self.index_db = index_db
+        self.started_at = time.time()
+        self._catalogs: Dict[str, CountryCatalog] = {}
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._run_jobs, name="discovery-refresh", daemon=True)
+        self._scheduler: Optional[threading.Thread] = None
+
+    def start(self, refresh_every: Optional[float] = None) -> None:
+        self._worker.start()
+        if refresh_every:
+            self._scheduler = threading.Thread(target=self._schedule, args=(refresh_every,),
+                                               name="discovery-schedule", daemon=True)
+            self._scheduler.start()
+
+    def close(self, wait: bool = True) -> None:
+        """Detiene el hilo de actualizaciones; con `wait` espera a que termine el trabajo en curso."""
+        self._stop.set()
+        self._queue.put(None)
+        if wait and self._worker.is_alive():
+            self._worker.join()
+
+    def _schedule(self, every: float) -> None:
+        while not self._stop.wait(every):
+            with self._lock:
+                busy = any(j["status"] in ("queued", "running") and j["scheduled"] for j in self._jobs.values())
+            if not busy:
+                self.submit_refresh(scheduled=True)
+
+    def _catalog_path(self, country: str) -> str:
+        base = os.path.join(run_discovery.OUTPUT_DIR, f"{run_discovery._safe_slug(country)}_catalog")
+        return run_discovery._catalog_source(base, self.formats)
+
+    def load(self, country: str, metrics: Optional[Dict[str, Any]] = None,
+             summary: Optional[SummarySink] = None) -> Optional[CountryCatalog]:
+        """Carga en memoria el catálogo exportado de un país (None si todavía no existe)."""
+        path = self._catalog_path(country)
+        if not os.path.exists(path):
+            return None
+        platform = self.countries[country].get("platform", "socrata")
+        fill = summary is None
+        if fill:
+            summary = SummarySink(country, platform)
+        rows = []
+        for data in iter_catalog(path):
+            row = record_from_dict(data)
+            rows.append(row)
+            if fill:
+                summary.write(row)
+        catalog = CountryCatalog(country, platform, rows, summary, metrics)
+        with self._lock:
+            previous = self._catalogs.get(country)
+            if metrics is None and previous is not None:
+                catalog.metrics = previous.metrics
+            self._catalogs[country] = catalog
+        return catalog
+
+    def load_all(self) -> int:
+        loaded = 0
+        for country in self.countries:
+            try:
+                loaded += self.load(country) is not None
+            except (OSError, ValueError) as e:
+                print(f"ADVERTENCIA: no se pudo cargar el catálogo de {country}: {e}")
+        return loaded
+
+    def submit_refresh(self, countries: Optional[List[str]] = None, scheduled: bool = False) -> Dict[str, Any]:
+        """Encola una actualización (todos los países si `countries` es None) y devuelve el trabajo."""
+        selected = list(self.countries) if not countries else [self._country_key(c) for c in countries]
+        job = {"id": str(next(self._job_ids)), "countries": selected, "status": "queued", "scheduled": scheduled,
+               "submitted_at": _iso(time.time()), "started_at": None, "finished_at": None, "results": {}}
+        with self._lock:
+            self._jobs[job["id"]] = job
+            finished = [k for k, j in self._jobs.items() if j["status"] in ("done", "error")]
+            for k in finished[:max(0, len(self._jobs) - MAX_JOBS)]:
+                del self._jobs[k]
+        self._queue.put(job)
+        return self.job(job["id"])
+
+    def _run_jobs(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None or self._stop.is_set():
+                return
+            with self._lock:
+                job["status"] = "running"
+                job["started_at"] = _iso(time.time())
+            failed = False
+            for country in job["countries"]:
+                try:
+                    result = self.refresh_country(country)
+                except Exception as e:
+                    # Un portal caído no detiene al resto del trabajo
+                    print(f"ERROR: actualización de {country}: {e}")
+                    result = {"error": str(e)}
+                    failed = True
+                with self._lock:
+                    job["results"][country] = result
+            with self._lock:
+                job["finished_at"] = _iso(time.time())
+                job["status"] = "error" if failed else "done"
+
+    def refresh_country(self, country: str) -> Dict[str, Any]:
+        """Consulta el portal de un país, exporta y reemplaza su catálogo en memoria."""
+        config = self.countries[country]
+        summary = SummarySink(country, config.get("platform", "socrata"))
+        kwargs = dict(self.run_kwargs)
+        if self.index_db:
+            kwargs["index_db"] = self.index_db
+        count, metrics = run_discovery.run_for_country(country, config, with_metrics=True, summary=summary, **kwargs)
+        self.load(country, metrics=metrics, summary=summary)
+        return {"rows": count, "elapsed_seconds": metrics["elapsed_seconds"],
+                "http_requests": metrics["http_requests"]}
+
+    def job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job is not None else None  # copia independiente
+
+    def _country_key(self, name: str) -> str:
+        for k in self.countries:
+            if k.lower() == name.lower():
+                return k
+        raise UnknownCountry(name)
+
+    def catalogs(self) -> List[CountryCatalog]:
+        with self._lock:
+            return [self._catalogs[c] for c in self.countries if c in self._catalogs]
+
+    def catalog(self, country: str) -> Optional[CountryCatalog]:
+        key = self._country_key(country)
+        with self._lock:
+            return self._catalogs.get(key)
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if j["status"] in ("queued", "running"))
+        return {"status": "ok", "uptime_seconds": round(time.time() - self.started_at, 1),
+                "countries": [c.country for c in self.catalogs()], "pending_jobs": pending}
+
+    def datasets(self, country: Optional[str] = None, domain: Optional[str] = None, type_: Optional[str] = None,
+                 category: Optional[str] = None, year: Optional[int] = None, offset: int = 0,
+                 limit: int = 100) -> Tuple[int, List[Dict[str, Any]]]:
+        """Filtra los catálogos en memoria; devuelve (total que cumple, página pedida)."""
+        catalogs = [self.catalog(country)] if country else self.catalogs()
+        category = category.lower() if category else None
+        total = 0
+        page: List[Dict[str, Any]] = []
+        for catalog in catalogs:
+            if catalog is None:
+                continue
+            for row in catalog.rows:
+                if domain and row.get("domain") != domain:
+                    continue
+                if type_ and row.get("type") != type_:
+                    continue
+                if category and category not in _categories(row):
+                    continue
+                if year is not None:
+                    day = publication_day(row)
+                    if day is None or day.year != year:
+                        continue
+                if offset <= total < offset + limit:
+                    item = as_dict(row)
+                    item.setdefault("country", catalog.country)
+                    page.append(item)
+                total += 1
+        return total, page
+
+    def search(self, text: Optional[str], **filters: Any) -> List[Dict[str, Any]]:
+        """Búsqueda de texto en el índice SQLite que llenan las actualizaciones (`catalog_index`)."""
+        if not self.index_db or not os.path.exists(self.index_db):
+            raise IndexUnavailable("índice no disponible: pedir POST /refresh primero")
+        conn = catalog_index.connect(self.index_db)
+        try:
+            return catalog_index.search(conn, text, **filters)
+        finally:
+            conn.close()
+
+    def summary(self, country: Optional[str] = None, cube: bool = False) -> List[Dict[str, Any]]:
+        if country:
+            catalog = self.catalog(country)
+            if catalog is None:
+                return []
+            return catalog.summary.cube_rows() if cube else catalog.summary.rows()
+        total = SummarySink(ROLLUP_COUNTRY)
+        for catalog in self.catalogs():
+            total.merge(catalog.summary)
+        return total.cube_rows(rollup=ROLLUP_COUNTRY) if cube else total.rows()
+
+
+def _categories(row: Any) -> List[str]:
+    cats = row.get("categories")
+    if not cats:
+        return []
+    if isinstance(cats, (list, tuple)):
+        return [str(c).strip().lower() for c in cats]
+    return [c.strip().lower() for c in str(cats).split(",")]
+
+
+class _BadRequest(ValueError):
+    pass
+
+
+def _int_param(params: Dict[str, List[str]], name: str, default: Optional[int] = None,
+               maximum: Optional[int] = None) -> Optional[int]:
+    values = params.get(name)
+    if not values or values[0] == "":
+        return default
+    try:
+        value = int(values[0])
+    except ValueError:
+        raise _BadRequest(f"{name} debe ser entero")
+    if value < 0:
+        raise _BadRequest(f"{name} no puede ser negativo")
+    return min(value, maximum) if maximum is not None else value
+
+
+def _param(params: Dict[str, List[str]], name: str) -> Optional[str]:
+    values = params.get(name)
+    return values[0] if values and values[0] != "" else None
+
+
+def _list_param(params: Dict[str, List[str]], name: str) -> Optional[List[str]]:
+    values = [v for raw in params.get(name, []) for v in raw.split(",") if v]
+    return values or None
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = "DiscoveryService/1.0"
+    # El servidor asigna el servicio en `make_server`
+    service: DiscoveryService
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Sin una línea por consulta en la consola; los errores se imprimen aparte
+        pass
+
+    def _send(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method: str) -> None:
+        url = urlsplit(self.path)
+        params = parse_qs(url.query, keep_blank_values=True)
+        route = url.path.rstrip("/") or "/"
+        try:
+            if method == "POST" and route == "/refresh":
+                self._send(202, self._refresh())
+            elif method != "GET":
+                self._send(405, {"error": f"método no soportado en {route}"})
+            elif route == "/health":
+                self._send(200, self.service.health())
+            elif route == "/countries":
+                self._send(200, [c.info() for c in self.service.catalogs()])
+            elif route == "/datasets":
+                total, items = self.service.datasets(
+                    country=_param(params, "country"), domain=_param(params, "domain"),
+                    type_=_param(params, "type"), category=_param(params, "category"),
+                    year=_int_param(params, "year"), offset=_int_param(params, "offset", 0),
+                    limit=_int_param(params, "limit", 100, MAX_PAGE))
+                self._send(200, {"total": total, "items": items})
+            elif route == "/search":
+                self._send(200, self.service.search(
+                    _param(params, "q"), countries=_list_param(params, "country"),
+                    domains=_list_param(params, "domain"), categories=_list_param(params, "category"),
+                    published_from=_param(params, "from"), published_to=_param(params, "to"),
+                    limit=_int_param(params, "limit", 50, MAX_PAGE)))
+            elif route == "/summary":
+                cube = _param(params, "cube") in ("1", "true")
+                self._send(200, self.service.summary(_param(params, "country"), cube=cube))
+            elif route.startswith("/jobs/"):
+                job = self.service.job(route[len("/jobs/"):])
+                if job is None:
+                    self._send(404, {"error": "trabajo no encontrado"})
+                else:
+                    self._send(200, job)
+            else:
+                self._send(404, {"error": f"ruta desconocida: {route}"})
+        except UnknownCountry as e:
+            self._send(404, {"error": f"país no configurado: {e.args[0]}"})
+        except _BadRequest as e:
+            self._send(400, {"error": str(e)})
+        except IndexUnavailable as e:
+            self._send(503, {"error": str(e)})
+        except Exception as e:
+            print(f"ERROR: {method} {self.path}: {e}")
+            self._send(500, {"error": str(e)})
+
+    def _refresh(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            data = json.loads(body) if body.strip() else {}
+        except json.JSONDecodeError:
+            raise _BadRequest("el cuerpo debe ser JSON")
+        countries = data.get("countries") if isinstance(data, dict) else None
+        if countries is not None and not isinstance(countries, list):
+            raise _BadRequest("countries debe ser una lista")
+        return self.service.submit_refresh(countries)
+
+    def do_GET(self) -> None:
+        self._dispatch("GET")
+
+    def do_POST(self) -> None:
+        self._dispatch("POST")
+
+
+def make_server(service: DiscoveryService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """Servidor HTTP (un hilo por conexión) que atiende la API de `service`."""
+    handler = type("BoundServiceHandler", (ServiceHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Servicio de descubrimiento con API HTTP/JSON local")
+    ap.add_argument("--host", default=DEFAULT_HOST, help="Interfaz de escucha (default: 127.0.0.1)")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--country", nargs="+", default=None, help="Países a servir (default: todos)")
+    ap.add_argument("--refresh-on-start", dest="refresh_on_start", action="store_true",
+                    help="Actualizar todos los países al arrancar")
+    ap.add_argument("--refresh-every", dest="refresh_every", type=float, default=None,
+                    help="Segundos entre actualizaciones automáticas (default: solo por POST /refresh)")
+    ap.add_argument("--limit", type=int, default=1000, help="Límite de items por dominio")
+    ap.add_argument("--workers", type=int, default=1, help="Dominios consultados en paralelo por país")
+    ap.add_argument("--prefetch", type=int, default=0, help="Páginas pedidas en paralelo")
+    ap.add_argument("--per-host", dest="per_host", type=int, default=None,
+                    help="Máximo de solicitudes simultáneas por host")
+    ap.add_argument("--batch-domains", dest="batch_domains", type=int, default=1,
+                    help="Socrata: dominios por consulta")
+    ap.add_argument("--index-db", dest="index_db", default=catalog_index.DEFAULT_INDEX_DB,
+                    help="Índice SQLite para /search (default: output/catalog.db)")
+    ap.add_argument("--cache-dir", dest="cache_dir", default=None, help="Directorio de caché HTTP persistente")
+    ap.add_argument("--cache-ttl", dest="cache_ttl", type=float, default=DEFAULT_TTL)
+    transport.add_arguments(ap)
+    args = ap.parse_args(argv)
+
+    if not load_app_token():
+        print("ADVERTENCIA: No se encontró App Token. La API puede rate-limitar o fallar.")
+    if args.per_host:
+        set_per_host_limit(args.per_host)
+    if args.cache_dir:
+        configure_cache(args.cache_dir, ttl=args.cache_ttl)
+    transport.configure_from_args(args)
+
+    countries = run_discovery.load_domains()
+    if args.country:
+        wanted = {c.lower() for c in args.country}
+        countries = {k: v for k, v in countries.items() if k.lower() in wanted}
+        if not countries:
+            raise SystemExit(f"Ningún país de latam_domains.json coincide con {', '.join(args.country)}")
+    run_kwargs = {"per_domain_limit": args.limit, "workers": args.workers, "prefetch": args.prefetch,
+                  "batch_domains": args.batch_domains}
+    service = DiscoveryService(countries, run_kwargs, index_db=args.index_db)
+    loaded = service.load_all()
+    print(f"Catálogos cargados: {loaded}/{len(countries)}")
+    service.start(refresh_every=args.refresh_every)
+    if args.refresh_on_start:
+        service.submit_refresh()
+    server = make_server(service, args.host, args.port)
+    print(f"Escuchando en http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close(wait=False)
+        transport.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+"""
+Escritores incrementales para el catálogo normalizado.
+
+Cada sink recibe filas una a una (`write`) y las vuelca a disco a medida que llegan,
+con un esquema fijo, para que la memoria no dependa del tamaño del catálogo. Se
+escribe sobre un archivo temporal que reemplaza al definitivo al cerrar, de modo
+que una corrida interrumpida no deja el catálogo anterior a medio sobrescribir.
+"""
+import csv
+import json
+import os
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import json_decoder
+from records import publication_day
+from watermarks import parse_timestamp
+
+
+# Esquema fijo del catálogo: unión de los campos de normalize_result y normalize_ckan_result
+CATALOG_FIELDS: List[str] = [
+    "categories",
+    "description",
+    "domain",
+    "domain_category",
+    "download_count",
+    "id",
+    "license",
+    "link",
+    "name",
+    "num_resources",
+    "organization",
+    "permalink",
+    "publication_date",
+    "tags",
+    "type",
+    "updated_at",
+]
+
+
+class _FileSink:
+    def __init__(self, path: str, newline: Optional[str] = None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._tmp = path + ".part"
+        self._f = open(self._tmp, "w", encoding="utf-8", newline=newline)
+        self.count = 0
+
+    def write(self, row: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def _finish(self) -> None:
+        pass
+
+    def close(self) -> None:
+        if self._f.closed:
+            return
+        self._finish()
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        """Descarta lo escrito y conserva el archivo anterior."""
+        if not self._f.closed:
+            self._f.close()
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class JsonArraySink(_FileSink):
+    """Arreglo JSON válido con una fila compacta por línea (legible también línea a línea)."""
+
+    def __init__(self, path: str, fields: Sequence[str] = CATALOG_FIELDS):
+        super().__init__(path)
+        self.fields = list(fields)
+        self._f.write("[")
+
+    def write(self, row: Dict[str, Any]) -> None:
+        record = {k: row.get(k) for k in self.fields}
+        self._f.write(",\n" if self.count else "\n")
+        self._f.write(json.dumps(record, ensure_ascii=False))
+        self.count += 1
+
+    def _finish(self) -> None:
+        self._f.write("\n]\n")
+
+
+class NdjsonSink(_FileSink):
+    """Una fila JSON por línea (NDJSON / JSON Lines)."""
+
+    def __init__(self, path: str, fields: Sequence[str] = CATALOG_FIELDS):
+        super().__init__(path)
+        self.fields = list(fields)
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self._f.write(json.dumps({k: row.get(k) for k in self.fields}, ensure_ascii=False))
+        self._f.write("\n")
+        self.count += 1
+
+
+class CsvSink(_FileSink):
+    """CSV con cabecera fija: no requiere recorrer las filas antes de escribir."""
+
+    def __init__(self, path: str, fields: Sequence[str] = CATALOG_FIELDS):
+        super().__init__(path, newline="")
+        self.fields = list(fields)
+        self._writer = csv.DictWriter(self._f, fieldnames=self.fields, extrasaction="ignore")
+        self._writer.writeheader()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        self._writer.writerow({k: row.get(k) for k in self.fields})
+        self.count += 1
+
+
+# Columnas del resumen multidimensional (una fila por celda con conteo > 0)
+SUMMARY_CUBE_FIELDS: List[str] = ["country", "platform", "type", "category", "year", "count"]
+# Etiqueta del consolidado de todos los países
+ROLLUP_COUNTRY = "LATAM"
+_SPLIT_CACHE_MAX = 4096
+
+
+class SummarySink:
+    """
+    Acumula el resumen mientras pasan las filas, sin una segunda pasada por el catálogo.
+
+    Cada fila suma 1 a una sola celda (país, plataforma, tipo, categorías, año de
+    publicación). La cadena de categorías llega internada y se separa una vez por valor
+    distinto, no una vez por fila. De esas celdas salen tanto los conteos planos por tipo
+    y categoría (`rows`) como el cubo país × plataforma × tipo × categoría × año
+    (`cube_rows`); `merge` suma resúmenes de varios países para el consolidado.
+    """
+
+    def __init__(self, country: str = "", platform: str = ""):
+        self.country = country
+        self.platform = platform
+        self.cells: Counter = Counter()
+        self._split: Dict[str, tuple] = {}
+
+    def _categories(self, cats: Any) -> tuple:
+        if isinstance(cats, (list, tuple)):
+            return tuple(str(c).strip() for c in cats if str(c).strip())
+        parts = self._split.get(cats)
+        if parts is None:
+            parts = tuple(c.strip() for c in str(cats).split(",") if c.strip())
+            if len(self._split) >= _SPLIT_CACHE_MAX:
+                self._split.clear()
+            self._split[cats] = parts
+        return parts
+
+    def write(self, row: Dict[str, Any]) -> None:
+        cats = row.get("categories")
+        day = publication_day(row)
+        self.cells[(self.country, self.platform, row.get("type") or "unknown",
+                    self._categories(cats) if cats else (), day.year if day else None)] += 1
+
+    def merge(self, other: "SummarySink") -> "SummarySink":
+        self.cells.update(other.cells)
+        return self
+
+    @property
+    def by_type(self) -> Counter:
+        counts: Counter = Counter()
+        for (_, _, typ, _, _), n in self.cells.items():
+            counts[typ] += n
+        return counts
+
+    @property
+    def by_category(self) -> Counter:
+        counts: Counter = Counter()
+        for (_, _, _, cats, _), n in self.cells.items():
+            for c in cats:
+                counts[c] += n
+        return counts
+
+    def rows(self) -> List[Dict[str, Any]]:
+        summary_rows = []
+        for k, v in sorted(self.by_type.items(), key=lambda x: (-x[1], x[0] or "")):
+            summary_rows.append({"metric": "type", "key": k, "count": v})
+        for k, v in sorted(self.by_category.items(), key=lambda x: (-x[1], x[0])):
+            summary_rows.append({"metric": "category", "key": k, "count": v})
+        return summary_rows
+
+    def cube_rows(self, rollup: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Filas del cubo; una fila con varias categorías cuenta en cada una (category vacía =
+        sin categoría). Con `rollup` se agrega además una fila por (tipo, categoría, año)
+        sumando todos los países, con country=`rollup` y platform vacío.
+        """
+        cube: Counter = Counter()
+        for (country, platform, typ, cats, year), n in self.cells.items():
+            for c in cats or ("",):
+                cube[(country, platform, typ, c, year)] += n
+                if rollup is not None:
+                    cube[(rollup, "", typ, c, year)] += n
+        ordered = sorted(cube.items(), key=lambda x: (x[0][0] == rollup, x[0][0], x[0][1], -x[1],
+                                                      x[0][2], x[0][3], x[0][4] or 0))
+        return [dict(zip(SUMMARY_CUBE_FIELDS, key + (n,))) for key, n in ordered]
+
+
+def save_summary_cube(path: str, rows: List[Dict[str, Any]]) -> None:
+    """Guarda el cubo del resumen en CSV con las columnas en orden fijo (`SUMMARY_CUBE_FIELDS`)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_CUBE_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("Los formatos parquet/arrow requieren pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+def _split_list(value: Any) -> Optional[List[str]]:
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return [v.strip() for v in str(value).split(",") if v.strip()]
+
+
+def _to_int(value: Any) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Tipo de cada columna en la salida columnar: los campos de baja cardinalidad van
+# como diccionario, tags/categories como listas y las fechas como timestamps UTC.
+_COLUMN_KINDS: Dict[str, str] = {
+    "categories": "list",
+    "description": "string",
+    "domain": "dictionary",
+    "domain_category": "dictionary",
+    "download_count": "int",
+    "formats": "list",
+    "id": "string",
+    "license": "dictionary",
+    "link": "string",
+    "name": "string",
+    "num_resources": "int",
+    "organization": "dictionary",
+    "permalink": "string",
+    "publication_date": "timestamp",
+    "row_count": "int",
+    "size_bytes": "int",
+    "tags": "list",
+    "type": "dictionary",
+    "updated_at": "timestamp",
+}
+
+_CONVERTERS = {
+    "list": _split_list,
+    "int": _to_int,
+    "timestamp": parse_timestamp,
+    "string": lambda v: None if v is None else str(v),
+    "dictionary": lambda v: None if v in (None, "") else str(v),
+}
+
+
+def arrow_schema(fields: Sequence[str] = CATALOG_FIELDS):
+    pa = _import_pyarrow()
+    types = {
+        "list": pa.list_(pa.string()),
+        "int": pa.int64(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "string": pa.string(),
+        "dictionary": pa.dictionary(pa.int32(), pa.string()),
+    }
+    return pa.schema([pa.field(name, types[_COLUMN_KINDS.get(name, "string")]) for name in fields])
+
+
+class _ArrowBatchSink:
+    """
+    Base de los sinks columnares: acumula columnas tipadas por lotes de `batch_size`
+    filas y los vuelca como RecordBatch, así la memoria queda acotada al lote.
+    """
+
+    def __init__(self, path: str, fields: Sequence[str] = CATALOG_FIELDS, batch_size: int = 10000):
+        self._pa = _import_pyarrow()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._tmp = path + ".part"
+        self.fields = list(fields)
+        self.schema = arrow_schema(self.fields)
+        self.batch_size = batch_size
+        self._kinds = [_COLUMN_KINDS.get(name, "string") for name in self.fields]
+        self._columns: List[List[Any]] = [[] for _ in self.fields]
+        # Vocabulario persistente por columna diccionario: solo crece, así cada lote
+        # nuevo es una extensión del anterior (delta) y no un reemplazo
+        self._vocab: Dict[str, Dict[str, int]] = {
+            name: {} for name, kind in zip(self.fields, self._kinds) if kind == "dictionary"
+        }
+        self._writer = self._open_writer()
+        self._closed = False
+        self.count = 0
+
+    def _open_writer(self):
+        raise NotImplementedError
+
+    def write(self, row: Dict[str, Any]) -> None:
+        for name, kind, column in zip(self.fields, self._kinds, self._columns):
+            value = _CONVERTERS[kind](row.get(name))
+            if kind == "dictionary" and value is not None:
+                vocab = self._vocab[name]
+                value = vocab.setdefault(value, len(vocab))
+            column.append(value)
+        self.count += 1
+        if len(self._columns[0]) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._columns[0]:
+            return
+        pa = self._pa
+        arrays = []
+        for field, kind, column in zip(self.schema, self._kinds, self._columns):
+            if kind == "dictionary":
+                arrays.append(pa.DictionaryArray.from_arrays(
+                    pa.array(column, type=pa.int32()),
+                    pa.array(list(self._vocab[field.name]), type=pa.string()),
+                ))
+            else:
+                arrays.append(pa.array(column, type=field.type))
+        self._writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        self._columns = [[] for _ in self.fields]
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._flush()
+        self._writer.close()
+        self._closed = True
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        if not self._closed:
+            self._writer.close()
+            self._closed = True
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ParquetSink(_ArrowBatchSink):
+    """Parquet comprimido con zstd; un row group por lote."""
+
+    def _open_writer(self):
+        return self._pa.parquet.ParquetWriter(self._tmp, self.schema, compression="zstd")
+
+
+class ArrowSink(_ArrowBatchSink):
+    """
+    Stream Arrow IPC (.arrows). Se usa el formato stream porque admite deltas de
+    diccionario entre lotes; el formato file exigiría conocer todo el vocabulario.
+    """
+
+    def _open_writer(self):
+        options = self._pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+        return self._pa.ipc.new_stream(self._tmp, self.schema, options=options)
+
+
+SINKS = {
+    "json": (".json", JsonArraySink),
+    "ndjson": (".ndjson", NdjsonSink),
+    "csv": (".csv", CsvSink),
+    "parquet": (".parquet", ParquetSink),
+    "arrow": (".arrows", ArrowSink),
+}
+
+COLUMNAR_FORMATS = ("parquet", "arrow")
+
+
+def save_summary_columnar(path: str, rows: List[Dict[str, Any]], fmt: str = "parquet") -> None:
+    """Guarda el resumen (metric, key, count) con tipos: metric como diccionario y count entero."""
+    pa = _import_pyarrow()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    table = pa.table({
+        "metric": pa.array([r["metric"] for r in rows], type=pa.string()).dictionary_encode(),
+        "key": pa.array([None if r["key"] is None else str(r["key"]) for r in rows], type=pa.string()),
+        "count": pa.array([r["count"] for r in rows], type=pa.int64()),
+    })
+    if fmt == "arrow":
+        with pa.ipc.new_stream(path, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pa.parquet.write_table(table, path, compression="zstd")
+
+
+def open_sinks(base: str, formats: Iterable[str], fields: Sequence[str] = CATALOG_FIELDS) -> List[Any]:
+    """Abre un sink por formato sobre `base` + extensión (p.ej. output/colombia_catalog.json)."""
+    sinks = []
+    for fmt in formats:
+        if fmt not in SINKS:
+            raise ValueError(f"Formato de salida no soportado: {fmt}")
+        ext, cls = SINKS[fmt]
+        sinks.append(cls(base + ext, fields))
+    return sinks
+
+
+def iter_json_array(path: str, chunk_size: int = 1 << 16) -> Iterator[Any]:
+    """
+    Lee un arreglo JSON elemento a elemento sin cargarlo completo.
+    Sirve tanto para el formato de JsonArraySink como para JSON indentado. Con el formato
+    de JsonArraySink (un elemento por línea) cada línea se decodifica entera con el
+    backend de `json_decoder` (orjson si está instalado), unas tres veces más rápido.
+    """
+    with open(path, "rb") as f:
+        first, second = f.readline(), f.readline()
+        head = None
+        if first.strip() == b"[" and second.lstrip().startswith(b"{"):
+            try:
+                head = json_decoder.loads(second.strip().rstrip(b","))
+            except ValueError:
+                pass  # elementos indentados en varias líneas: se usa el lector general
+        if head is not None:
+            yield head
+            for line in f:
+                line = line.strip()
+                if line and line != b"]":
+                    yield json_decoder.loads(line.rstrip(b","))
+            return
+    yield from _iter_json_array_stream(path, chunk_size)
+
+
+def _iter_json_array_stream(path: str, chunk_size: int) -> Iterator[Any]:
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(chunk_size)
+        pos = 0
+        eof = False
+
+        def skip(chars: str) -> None:
+            nonlocal buf, pos, eof
+            while True:
+                while pos < len(buf) and buf[pos] in chars:
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                more = f.read(chunk_size)
+                if not more:
+                    eof = True
+                buf, pos = more, 0
+
+        skip(" \t\r\n")
+        if pos >= len(buf) or buf[pos] != "[":
+            raise ValueError(f"{path} no contiene un arreglo JSON")
+        pos += 1
+        while True:
+            skip(" \t\r\n,")
+            if pos >= len(buf):
+                raise ValueError(f"{path}: arreglo JSON incompleto")
+            if buf[pos] == "]":
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                more = f.read(chunk_size)
+                if not more:
+                    raise
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield obj
+            pos = end
+
+
+def iter_ndjson(path: str) -> Iterator[Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_catalog(path: str) -> Iterator[Dict[str, Any]]:
+    """Recorre un catálogo exportado (.json, .ndjson, .csv, .parquet o .arrows) fila a fila."""
+    if path.endswith(".parquet") or path.endswith(".arrows"):
+        def columnar_rows():
+            pa = _import_pyarrow()
+            if path.endswith(".parquet"):
+                batches = pa.parquet.ParquetFile(path).iter_batches()
+            else:
+                batches = pa.ipc.open_stream(pa.OSFile(path))
+            for batch in batches:
+                for row in batch.to_pylist():
+                    for name in ("tags", "categories", "formats"):
+                        if isinstance(row.get(name), list):
+                            row[name] = ",".join(row[name])
+                    for name in ("publication_date", "updated_at"):
+                        if row.get(name) is not None:
+                            row[name] = row[name].isoformat()
+                    yield row
+        return columnar_rows()
+    if path.endswith(".ndjson") or path.endswith(".jsonl"):
+        return iter_ndjson(path)
+    if path.endswith(".csv"):
+        def rows():
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                yield from csv.DictReader(f)
+        return rows()
+    return iter_json_array(path)
@@ -1,83 +1,218 @@
 import os
 import json
-from typing import Dict, Any, Generator, List, Optional
+import threading
+from datetime import date
+from typing import Callable, Dict, Any, Generator, List, Optional
 
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+
+from checkpoints import CheckpointStore
+from concurrency import host_slot, merge_http_stats
+from dates import parse_day
+from records import DatasetRecord, as_dict
+from json_decoder import FieldSpec
+from metrics import current_timer, decode_json, stage, use_timer
+from rate_limit import register_quota
+from transport import build_session, request_timeout, update_http_stats
+from watermarks import parse_timestamp
 
 
 DISCOVERY_BASE = os.environ.get("SOCRATA_DISCOVERY_BASE", "https://api.us.socrata.com/api/catalog/v1")
 
+# Cuotas (req/s, ráfaga): ~1000 consultas/hora con app token. Sin token Socrata limita
+# por IP en un pool compartido y no publica un número, así que no se registra cuota:
+# el host solo se frena tras un 429 real (AIMD de `rate_limit`)
+SOCRATA_TOKEN_QUOTA = (1000 / 3600, 1000)
+SOCRATA_ANON_QUOTA = None
+register_quota(DISCOVERY_BASE, with_token=SOCRATA_TOKEN_QUOTA, without_token=SOCRATA_ANON_QUOTA)
 
-def _build_session() -> requests.Session:
-    """Crea una sesion HTTP con reintentos para llamadas mas estables."""
-    session = requests.Session()
-    retries = Retry(
-        total=3,
-        connect=3,
-        read=3,
-        status=3,
-        backoff_factor=0.5,
-        status_forcelist=(429, 500, 502, 503, 504),
-        allowed_methods=frozenset({"GET"}),
-    )
-    adapter = HTTPAdapter(max_retries=retries)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
-    return session
+# Campos de cada item que leen `query_catalog` y `normalize_result`; el resto se descarta al decodificar
+SOCRATA_ITEM_FIELDS: FieldSpec = {
+    "resource": {"name": None, "id": None, "type": None, "description": None, "createdAt": None,
+                 "updatedAt": None, "publication_date": None},
+    "classification": {"domain_category": None, "categories": None, "tags": None},
+    "metadata": {"domain": None},
+    "permalink": None,
+    "link": None,
+    "view": {"download_count": None, "publication_date": None},
+    "download_count": None,
+}
 
+# Dominios por consulta en modo batch (`domains=a,b,c`): acota el largo de la URL
+DOMAIN_BATCH_SIZE = 20
 
-def _update_http_stats(stats: Optional[Dict[str, int]], resp: requests.Response) -> None:
-    if stats is None:
-        return
-    stats["requests"] = stats.get("requests", 0) + 1
-    retries_used = 0
-    raw = getattr(resp, "raw", None)
-    retries = getattr(raw, "retries", None)
-    history = getattr(retries, "history", None)
-    if history:
-        retries_used = len(history)
-    stats["retries"] = stats.get("retries", 0) + retries_used
+# La API no entrega resultados más allá de offset + limit = 10000 (ventana de resultados)
+OFFSET_WINDOW = 10000
+# Paginación: offset (orden libre, páginas independientes que se pueden pedir en paralelo),
+# scroll (cursor por id de recurso, sin ventana) o auto (scroll salvo que el corte por
+# fecha necesite ordenar, o que el dominio quepa en la ventana y haya prefetch)
+PAGINATION_MODES = ("auto", "offset", "scroll")
+_pagination = os.environ.get("DISCOVERY_SOCRATA_PAGINATION", "auto")
+
+
+def set_pagination(mode: str) -> None:
+    """Modo de paginación por defecto de `query_catalog`."""
+    global _pagination
+    if mode not in PAGINATION_MODES:
+        raise ValueError(f"Paginación no soportada: {mode} (opciones: {', '.join(PAGINATION_MODES)})")
+    _pagination = mode
+
+
+def pagination_mode() -> str:
+    return _pagination
+
+
+# Token leído de cada archivo de secretos, por (mtime, tamaño): no se relee en cada consulta
+_token_cache: Dict[str, tuple] = {}
+
+
+def _read_token_file(path: str) -> Optional[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        # El archivo podría ser JSON o estilo .env antiguo; intentamos JSON primero
+        text = f.read().strip()
+    try:
+        data = json.loads(text)
+        for k in (
+            "socrata_app_token",
+            "AppToken",
+            "APIKeyID",
+            "APIKeyId",
+            "api_key",
+            "token",
+        ):
+            if isinstance(data, dict) and k in data and data[k]:
+                return str(data[k])
+    except json.JSONDecodeError:
+        # Formato clave=valor
+        for line in text.splitlines():
+            if not line or line.strip().startswith("#"):
+                continue
+            if "=" in line:
+                k, v = line.split("=", 1)
+                if k.strip() in ("AppToken", "APIKeyID"):
+                    return v.strip()
+    return None
 
 
 def load_app_token(secret_file: str = os.path.join(os.path.dirname(__file__), "..", "secretos.json")) -> Optional[str]:
     """
     Carga el App Token desde variables de entorno o un archivo secretos.json.
     Precedencia: env(SOCRATA_APP_TOKEN) > secretos.json[AppToken|APIKeyID].
+    El archivo se vuelve a leer solo si cambió desde la última lectura.
     """
     token = os.environ.get("SOCRATA_APP_TOKEN")
     if token:
         return token
 
+    path = os.path.abspath(secret_file)
     try:
-        with open(os.path.abspath(secret_file), "r", encoding="utf-8") as f:
-            # El archivo podría ser JSON o estilo .env antiguo; intentamos JSON primero
-            text = f.read().strip()
-            try:
-                data = json.loads(text)
-                for k in (
-                    "socrata_app_token",
-                    "AppToken",
-                    "APIKeyID",
-                    "APIKeyId",
-                    "api_key",
-                    "token",
-                ):
-                    if isinstance(data, dict) and k in data and data[k]:
-                        return str(data[k])
-            except json.JSONDecodeError:
-                # Formato clave=valor
-                for line in text.splitlines():
-                    if not line or line.strip().startswith("#"):
-                        continue
-                    if "=" in line:
-                        k, v = line.split("=", 1)
-                        if k.strip() in ("AppToken", "APIKeyID"):
-                            return v.strip()
+        st = os.stat(path)
     except FileNotFoundError:
-        pass
-    return None
+        return None
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _token_cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    try:
+        token = _read_token_file(path)
+    except FileNotFoundError:
+        return None
+    _token_cache[path] = (key, token)
+    return token
+
+
+def _item_publication_date(item: Dict[str, Any]) -> Optional[str]:
+    """
+    Fecha de publicación de un item: la de la vista o el recurso y, si no la trae, la de
+    creación. Es la misma regla para la ventana de la consulta y para `normalize_result`.
+    """
+    resource = item.get("resource", {})
+    return (item.get("view", {}).get("publication_date") or resource.get("publication_date")
+            or resource.get("createdAt"))
+
+
+def _item_publication_day(item: Dict[str, Any]) -> Optional[date]:
+    return parse_day(_item_publication_date(item))
+
+
+def _in_window(day: Optional[date], date_from: Optional[date], date_to: Optional[date]) -> bool:
+    if day is None:
+        return False
+    if date_from and day < date_from:
+        return False
+    if date_to and day > date_to:
+        return False
+    return True
+
+
+def _get_page(session: requests.Session, params: Dict[str, Any], headers: Dict[str, str]) -> requests.Response:
+    with host_slot(DISCOVERY_BASE):
+        return session.get(DISCOVERY_BASE, params=params, headers=headers, timeout=request_timeout())
+
+
+def _parse_page(resp: requests.Response, stats: Optional[Dict[str, int]], fields: FieldSpec) -> Dict[str, Any]:
+    update_http_stats(stats, resp)
+    resp.raise_for_status()
+    return decode_json(resp, ("results",), fields)
+
+
+def _prefetch_pages(params: Dict[str, Any], headers: Dict[str, str], total: int,
+                    window: int, stats: Optional[Dict[str, int]], fields: FieldSpec, domain: Optional[str],
+                    on_page: Optional[Callable[..., None]] = None) -> Generator[Dict[str, Any], None, None]:
+    """
+    Pide en paralelo las páginas restantes por offset (conocido `resultSetSize`),
+    con hasta `window` solicitudes en vuelo, y entrega los items en orden. Cada hilo
+    del pool usa su propia sesión (`build_session`) sobre el adapter compartido.
+    """
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    limit = params["limit"]
+    offsets = iter(range(params["offset"], min(total, OFFSET_WINDOW - limit + 1), limit))
+    pool = ThreadPoolExecutor(max_workers=window)
+    pending = deque()
+    local = threading.local()
+
+    def fetch(page_params: Dict[str, Any]) -> requests.Response:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = build_session()
+        return _get_page(session, page_params, headers)
+
+    def submit(offset: int) -> None:
+        pending.append((offset, pool.submit(fetch, dict(params, offset=offset))))
+
+    next_offset = params["offset"]
+    try:
+        for offset in offsets:
+            submit(offset)
+            if len(pending) >= window:
+                break
+        while pending:
+            page_offset, future = pending.popleft()
+            offset = next(offsets, None)
+            if offset is not None:
+                submit(offset)
+            try:
+                data = _parse_page(future.result(), stats, fields)
+            except requests.exceptions.RequestException as e:
+                print(f"ERROR: Fallo al consultar dominio '{domain}': {e}")
+                return
+            results = data.get("results", [])
+            if not results:
+                break
+            for item in results:
+                yield item
+            next_offset = page_offset + limit
+            if on_page is not None:
+                on_page(next_offset, False)
+        if on_page is not None:
+            on_page(next_offset, True)
+    finally:
+        # Si el consumidor corta antes (p.ej. por límite), no descargar lo pendiente
+        for _, future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
 
 
 def query_catalog(domain: Optional[str] = None,
@@ -87,15 +222,50 @@ def query_catalog(domain: Optional[str] = None,
                   max_pages: int = 50,
                   app_token: Optional[str] = None,
                   session: Optional[requests.Session] = None,
-                  stats: Optional[Dict[str, int]] = None) -> Generator[Dict[str, Any], None, None]:
+                  stats: Optional[Dict[str, int]] = None,
+                  updated_since: Optional[str] = None,
+                  published_from: Optional[str] = None,
+                  published_to: Optional[str] = None,
+                  fields: FieldSpec = SOCRATA_ITEM_FIELDS,
+                  offset: int = 0,
+                  on_page: Optional[Callable[..., None]] = None,
+                  pagination: Optional[str] = None,
+                  scroll_id: Optional[str] = None,
+                  prefetch: int = 0,
+                  meta: Optional[Dict[str, Any]] = None) -> Generator[Dict[str, Any], None, None]:
     """
     Generador que recorre la Discovery API devolviendo items del catálogo.
-    - domain: restringe por dominio (e.g. "www.datos.gov.co").
+    - domain: restringe por dominio (e.g. "www.datos.gov.co"), o varios separados por coma.
     - q: término de búsqueda.
     - categories: lista de categorías para filtrar.
     - limit: tamaño de página (<= 100 recomendado por la API).
-    - max_pages: tope de páginas a recorrer para evitar loops infinitos.
+    - max_pages: tope de páginas a recorrer (None = hasta el final de la consulta).
     - app_token: token opcional para cabecera X-App-Token.
+    - updated_since: marca ISO (modo incremental). La API no filtra por fecha de
+      actualización, así que se ordena por updatedAt descendente y se corta al
+      llegar al primer asset anterior a la marca.
+    - published_from / published_to: ventana de publicación (YYYY-MM-DD). La API no
+      filtra por fecha; los items fuera de la ventana no se entregan (ni consumen el
+      límite del llamador). Con published_to se ordena por createdAt ascendente y se
+      corta al pasarla; published_from no tiene corte (ver el comentario en `order`).
+    - fields: proyección de cada item (default: lo que usa `normalize_result`; None = completo).
+    - offset: offset de la primera página (para reanudar una corrida).
+    - on_page(next_offset, done[, scroll_id]): se llama cuando el llamador consumió todos
+      los items de una página, con el offset de la siguiente y si la consulta terminó; en
+      modo scroll `next_offset` son las filas recorridas y se agrega el scroll_id de la
+      siguiente página. No se llama si la consulta se corta por un error (la fuente
+      queda pendiente).
+    - pagination: "offset", "scroll" o "auto" (default: `set_pagination`). Con offset la
+      API no pasa de `OFFSET_WINDOW` resultados; scroll pide las páginas por id de
+      recurso (`scroll_id` = último id de la página anterior) y no tiene ese tope, pero
+      ignora `order`, así que los cortes por fecha pasan a ser filtros locales.
+    - scroll_id: cursor desde el que seguir (para reanudar una corrida en modo scroll).
+    - prefetch: en modo offset, páginas en vuelo tras la primera; `resultSetSize` dice
+      cuántas quedan y se piden en paralelo (sin cortes por fecha), cada hilo con su
+      propia sesión (`session` solo se usa desde el hilo del llamador).
+    - meta: si se pasa, recibe `resultSetSize` de cada página antes de entregar sus items.
+    La consulta termina sin pedir una página vacía cuando la página viene incompleta o
+    ya se recorrieron `resultSetSize` resultados.
     """
     headers = {}
     token = app_token or load_app_token()
@@ -104,7 +274,7 @@ def query_catalog(domain: Optional[str] = None,
 
     params: Dict[str, Any] = {
         "limit": max(1, min(limit, 100)),
-        "offset": 0,
+        "offset": offset,
     }
     if domain:
         params["domains"] = domain
@@ -113,90 +283,398 @@ def query_catalog(domain: Optional[str] = None,
     if categories:
         # La API acepta categories como lista repetida o CSV; probamos CSV
         params["categories"] = ",".join(categories)
+    since_dt = parse_timestamp(updated_since)
+    date_from = date.fromisoformat(published_from) if published_from else None
+    date_to = date.fromisoformat(published_to) if published_to else None
+    if since_dt:
+        params["order"] = "updatedAt DESC"
+    elif date_to:
+        # Más antiguos primero: se corta al pasar por encima de date_to. La publicación
+        # nunca es anterior a la creación, así que createdAt > date_to descarta el resto.
+        # date_from no tiene corte: un dataset creado antes puede publicarse dentro de la
+        # ventana, y ningún campo ordenable acota la publicación por arriba.
+        params["order"] = "createdAt"
 
-    local_session = session or _build_session()
-    for page in range(max_pages):
+    mode = pagination or _pagination
+    if mode not in PAGINATION_MODES:
+        raise ValueError(f"Paginación no soportada: {mode}")
+    # En auto, la primera página por offset sirve de sondeo cuando se podría prefetchear:
+    # si el dominio no cabe en la ventana se pasa a scroll
+    probe = False
+    if scroll_id is not None:
+        mode = "scroll"
+    elif mode == "auto":
+        if "order" in params or offset:
+            mode = "offset"
+        elif prefetch > 1:
+            mode, probe = "offset", True
+        else:
+            mode = "scroll"
+    if mode == "scroll":
+        # Cursor vacío = primera página; la API ordena por id y no admite offset
+        del params["offset"]
+        params.pop("order", None)
+        params["scroll_id"] = scroll_id or ""
+    ordered = "order" in params
+    position = offset
+    warned = False
+
+    def page_done(done: bool) -> None:
+        if on_page is None:
+            return
+        if mode == "scroll":
+            on_page(position, done, params["scroll_id"])
+        else:
+            on_page(params["offset"], done)
+
+    local_session = session or build_session()
+    page = 0
+    while max_pages is None or page < max_pages:
+        page += 1
         try:
-            resp = local_session.get(DISCOVERY_BASE, params=params, headers=headers, timeout=30)
-            _update_http_stats(stats, resp)
-            resp.raise_for_status()
-            data = resp.json()
+            data = _parse_page(_get_page(local_session, params, headers), stats, fields)
         except requests.exceptions.HTTPError as e:
-            if resp.status_code == 404:
+            if e.response is not None and e.response.status_code == 404:
                 # Dominio no encontrado en Discovery API, omitir silenciosamente
                 print(f"ADVERTENCIA: Dominio '{domain}' no encontrado en Discovery API (404)")
-                break
-            else:
-                raise e
+                page_done(True)
+                return
+            raise
         except requests.exceptions.RequestException as e:
             print(f"ERROR: Fallo al consultar dominio '{domain}': {e}")
-            break
+            return
 
         results = data.get("results", [])
+        total = data.get("resultSetSize")
+        if meta is not None and isinstance(total, int):
+            meta["resultSetSize"] = total
+        if probe:
+            probe = False
+            if isinstance(total, int) and total > OFFSET_WINDOW:
+                # Dominio grande: se descarta el sondeo y se recorre entero por scroll
+                mode = "scroll"
+                del params["offset"]
+                params["scroll_id"] = ""
+                continue
         if not results:
-            break
+            page_done(True)
+            return
+        if mode == "offset" and isinstance(total, int) and total > OFFSET_WINDOW and not warned:
+            print(f"ADVERTENCIA: Dominio '{domain}': la paginación por offset llega hasta {OFFSET_WINDOW} "
+                  f"de {total} resultados; usar --pagination scroll para el resto")
+            warned = True
         for item in results:
+            resource = item.get("resource", {})
+            if since_dt:
+                updated = parse_timestamp(resource.get("updatedAt"))
+                if updated and updated < since_dt:
+                    if ordered:
+                        page_done(True)
+                        return
+                    continue
+            elif date_to:
+                created = parse_day(resource.get("createdAt"))
+                if ordered and created and created > date_to:
+                    page_done(True)
+                    return
+            if (date_from or date_to) and not _in_window(_item_publication_day(item), date_from, date_to):
+                continue
             yield item
-        params["offset"] += params["limit"]
+        position += len(results)
+        done = len(results) < params["limit"] or (isinstance(total, int) and position >= total)
+        if mode == "scroll":
+            last_id = results[-1].get("resource", {}).get("id")
+            if not last_id or last_id == params["scroll_id"]:
+                print(f"ADVERTENCIA: Dominio '{domain}': scroll sin avance, se corta la consulta")
+                done = True
+            else:
+                params["scroll_id"] = last_id
+        else:
+            params["offset"] += params["limit"]
+            # Ventana agotada: lo que falta solo se alcanza por scroll (ya se advirtió)
+            done = done or params["offset"] + params["limit"] > OFFSET_WINDOW
+        page_done(done)
+        if done:
+            return
+        if mode == "offset" and prefetch > 1 and not ordered and isinstance(total, int):
+            yield from _prefetch_pages(params, headers, total, prefetch, stats, fields,
+                                       domain, on_page)
+            return
+    page_done(True)
 
 
-def normalize_result(item: Dict[str, Any]) -> Dict[str, Any]:
+def normalize_result(item: Dict[str, Any]) -> DatasetRecord:
     """
-    Extrae campos útiles en un dict plano.
+    Extrae campos útiles en un registro plano (DatasetRecord, interfaz de dict).
     """
     resource = item.get("resource", {})
     classification = item.get("classification", {})
     metadata = item.get("metadata", {})
 
-    return {
-        "name": resource.get("name"),
-        "id": resource.get("id"),
-        "type": resource.get("type"),
-        "description": resource.get("description"),
-        "domain": metadata.get("domain"),
-        "permalink": item.get("permalink"),
-        "link": item.get("link"),
-        "domain_category": classification.get("domain_category"),
-        "categories": ",".join(classification.get("categories", []) or []),
-        "tags": ",".join(classification.get("tags", []) or []),
-        "download_count": item.get("view",
-                                     {}).get("download_count") or item.get("download_count"),
-        "publication_date": item.get("view", {}).get("publication_date") or resource.get("publication_date"),
-    }
+    return DatasetRecord(
+        name=resource.get("name"),
+        id=resource.get("id"),
+        type=resource.get("type"),
+        description=resource.get("description"),
+        domain=metadata.get("domain"),
+        permalink=item.get("permalink"),
+        link=item.get("link"),
+        domain_category=classification.get("domain_category"),
+        categories=",".join(classification.get("categories", []) or []),
+        tags=",".join(classification.get("tags", []) or []),
+        download_count=item.get("view",
+                                {}).get("download_count") or item.get("download_count"),
+        publication_date=_item_publication_date(item),
+        updated_at=resource.get("updatedAt"),
+    )
+
+
+def _iter_domain(domain: str, q: Optional[str], categories: Optional[List[str]], per_domain_limit: int,
+                 app_token: Optional[str], session: requests.Session,
+                 stats: Optional[Dict[str, int]], updated_since: Optional[str] = None,
+                 published_from: Optional[str] = None,
+                 published_to: Optional[str] = None,
+                 checkpoint: Optional[CheckpointStore] = None,
+                 prefetch: int = 0) -> Generator[Dict[str, Any], None, None]:
+    count = 0
+    offset = 0
+    scroll_id = None
+    cursor = checkpoint.cursor(domain) if checkpoint is not None else None
+    if cursor is not None:
+        # Reanudación: primero las filas ya obtenidas, luego desde el offset (o scroll_id) guardado
+        for row in cursor.replay():
+            yield row
+            count += 1
+        if count >= per_domain_limit and not cursor.done:
+            cursor.finish()
+        if cursor.done:
+            return
+        offset = cursor.offset
+        scroll_id = cursor.scroll_id
+    for item in query_catalog(
+        domain=domain,
+        q=q,
+        categories=categories,
+        limit=100,
+        max_pages=None,
+        app_token=app_token,
+        session=session,
+        stats=stats,
+        updated_since=updated_since,
+        published_from=published_from,
+        published_to=published_to,
+        offset=offset,
+        on_page=cursor.page_done if cursor is not None else None,
+        scroll_id=scroll_id,
+        prefetch=prefetch,
+    ):
+        with stage("normalize"):
+            row = normalize_result(item)
+        if cursor is not None:
+            cursor.write(row)
+        yield row
+        count += 1
+        if count >= per_domain_limit:
+            if cursor is not None:
+                cursor.finish()
+            break
+
+
+def _iter_batch(batch: List[str], q: Optional[str], categories: Optional[List[str]], per_domain_limit: int,
+                app_token: Optional[str], session: requests.Session, stats: Optional[Dict[str, int]],
+                published_from: Optional[str] = None, published_to: Optional[str] = None,
+                checkpoint: Optional[CheckpointStore] = None,
+                prefetch: int = 0) -> Generator[Dict[str, Any], None, None]:
+    """
+    Recorre varios dominios con una sola consulta (`domains=a,b,c`). La primera página
+    trae `resultSetSize` del lote: si no pasa de `len(batch) * per_domain_limit` (ni de
+    lo que una consulta puede recorrer) el lote se recorre junto y cada dominio se queda
+    con sus primeras `per_domain_limit` filas; si pasa, se parte en dos mitades hasta
+    aislar los dominios grandes, que se recorren solos con `_iter_domain`.
+    Las filas se agrupan y entregan por dominio, en el orden de `batch`. Si la API
+    devuelve un dominio que no está en el lote (un alias o CNAME de alguno), no se sabe
+    a cuál pertenece: se avisa y el lote se recorre dominio por dominio. Con checkpoint,
+    los dominios de un lote se confirman juntos al terminarlo.
+    """
+    def single(domain: str) -> Generator[Dict[str, Any], None, None]:
+        return _iter_domain(domain, q, categories, per_domain_limit, app_token, session, stats,
+                            None, published_from, published_to, checkpoint, prefetch)
+
+    if checkpoint is not None:
+        # Dominios con avance guardado: se reanudan solos desde su checkpoint
+        started = [d for d in batch if checkpoint.cursor(d).done or checkpoint.cursor(d).rows]
+        for domain in started:
+            yield from single(domain)
+        batch = [d for d in batch if d not in started]
+    if len(batch) <= 1:
+        for domain in batch:
+            yield from single(domain)
+        return
+
+    meta: Dict[str, Any] = {}
+    finished = []
+
+    def on_page(next_offset: int, done: bool, *args) -> None:
+        if done:
+            finished.append(True)
+
+    rows: Dict[str, List[DatasetRecord]] = {d: [] for d in batch}
+    too_big = False
+    alias = None
+    # El lote pasa de su límite solo si algún dominio pasa del suyo
+    max_total = min(len(batch) * per_domain_limit, OFFSET_WINDOW)
+    items = query_catalog(domain=",".join(batch), q=q, categories=categories, limit=100, max_pages=None,
+                          app_token=app_token, session=session, stats=stats, published_from=published_from,
+                          published_to=published_to, on_page=on_page, prefetch=prefetch, meta=meta)
+    try:
+        for item in items:
+            if meta.get("resultSetSize", 0) > max_total:
+                too_big = True
+                break
+            with stage("normalize"):
+                row = normalize_result(item)
+            bucket = rows.get(row["domain"])
+            if bucket is None:
+                alias = row["domain"]
+                break
+            if len(bucket) < per_domain_limit:
+                bucket.append(row)
+    finally:
+        items.close()
+    if alias is not None:
+        print(f"ADVERTENCIA: la consulta por lote devolvió el dominio '{alias}', que no está en el lote "
+              f"(¿alias de otro?); se recorren los {len(batch)} dominios por separado")
+        for domain in batch:
+            yield from single(domain)
+        return
+    if too_big:
+        mid = len(batch) // 2
+        yield from _iter_batch(batch[:mid], q, categories, per_domain_limit, app_token, session, stats,
+                               published_from, published_to, checkpoint, prefetch)
+        yield from _iter_batch(batch[mid:], q, categories, per_domain_limit, app_token, session, stats,
+                               published_from, published_to, checkpoint, prefetch)
+        return
+    for domain in batch:
+        cursor = checkpoint.cursor(domain) if checkpoint is not None else None
+        for row in rows[domain]:
+            if cursor is not None:
+                cursor.write(row)
+            yield row
+        # Un lote cortado por un error deja sus dominios pendientes
+        if cursor is not None and finished:
+            cursor.finish()
+
+
+def iter_by_domains(domains: List[str], q: Optional[str] = None, categories: Optional[List[str]] = None,
+                    per_domain_limit: int = 500, app_token: Optional[str] = None,
+                    stats: Optional[Dict[str, int]] = None, workers: int = 1,
+                    updated_since: Optional[Dict[str, str]] = None,
+                    published_from: Optional[str] = None,
+                    published_to: Optional[str] = None,
+                    checkpoint: Optional[CheckpointStore] = None,
+                    prefetch: int = 0,
+                    batch_size: int = 1) -> Generator[Dict[str, Any], None, None]:
+    """
+    Versión en streaming de `fetch_by_domains`: entrega cada fila normalizada apenas
+    llega su página, sin acumular el catálogo. Con workers > 1 cada dominio se
+    descarga en su hilo y sus filas se entregan (en orden de dominio) al terminar;
+    hay a lo sumo `workers` dominios (o lotes) en vuelo, así que la memoria no crece
+    con la cantidad de dominios.
+    Con `checkpoint` cada dominio guarda su avance por página y, al reanudar, sigue
+    desde donde quedó. `prefetch` se pasa a `query_catalog` (páginas por offset en vuelo).
+    Con batch_size > 1 los dominios se consultan de a lotes de ese tamaño (`_iter_batch`):
+    los dominios chicos comparten solicitudes y los grandes se recorren solos. Los
+    dominios con marca incremental se consultan siempre solos.
+    """
+    marks = updated_since or {}
+    units: List[List[str]] = []
+    batch: Optional[List[str]] = None
+    for domain in domains:
+        if batch_size <= 1 or domain in marks:
+            units.append([domain])
+            continue
+        if batch is None or len(batch) >= batch_size:
+            batch = []
+            units.append(batch)
+        batch.append(domain)
+
+    def iter_unit(unit: List[str], session: requests.Session,
+                  unit_stats: Optional[Dict[str, int]]) -> Generator[Dict[str, Any], None, None]:
+        if len(unit) == 1:
+            return _iter_domain(unit[0], q, categories, per_domain_limit, app_token, session, unit_stats,
+                                marks.get(unit[0]), published_from, published_to, checkpoint, prefetch)
+        return _iter_batch(unit, q, categories, per_domain_limit, app_token, session, unit_stats,
+                           published_from, published_to, checkpoint, prefetch)
+
+    if workers <= 1 or len(units) <= 1:
+        session = build_session()
+        for unit in units:
+            yield from iter_unit(unit, session, stats)
+        return
+
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+    timer = current_timer()
+
+    def run_one(unit: List[str]):
+        # Sesión y contadores propios por dominio (o lote): requests.Session no garantiza
+        # seguridad entre hilos y los contadores se combinan al final.
+        local_stats: Dict[str, int] = {}
+        with use_timer(timer):
+            rows = list(iter_unit(unit, build_session(), local_stats))
+        return rows, local_stats
+
+    # Ventana deslizante de `workers` unidades: mientras se espera un dominio lento solo
+    # quedan en memoria las filas de las unidades en vuelo, no las del catálogo entero
+    window = min(workers, len(units))
+    pending: deque = deque()
+    remaining = iter(units)
+    with ThreadPoolExecutor(max_workers=window) as pool:
+        try:
+            for unit in remaining:
+                pending.append(pool.submit(run_one, unit))
+                if len(pending) >= window:
+                    break
+            while pending:
+                rows, local_stats = pending.popleft().result()
+                unit = next(remaining, None)
+                if unit is not None:
+                    pending.append(pool.submit(run_one, unit))
+                merge_http_stats(stats, local_stats)
+                yield from rows
+                del rows
+        finally:
+            # Si el consumidor corta antes, no se descargan las unidades que faltan
+            for future in pending:
+                future.cancel()
 
 
 def fetch_by_domains(domains: List[str], q: Optional[str] = None, categories: Optional[List[str]] = None,
                      per_domain_limit: int = 500, app_token: Optional[str] = None,
-                     stats: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+                     stats: Optional[Dict[str, int]] = None, workers: int = 1,
+                     updated_since: Optional[Dict[str, str]] = None,
+                     published_from: Optional[str] = None,
+                     published_to: Optional[str] = None,
+                     batch_size: int = 1) -> List[Dict[str, Any]]:
     """
     Consulta el catálogo para una lista de dominios y devuelve una lista de resultados normalizados.
     Limita el total por dominio para evitar respuestas enormes por defecto.
+    - workers: dominios consultados en paralelo (1 = secuencial). El orden de salida
+      se conserva por dominio aunque se consulten concurrentemente.
+    - updated_since: {dominio: marca} para traer solo lo actualizado desde la marca.
+    - published_from / published_to: ventana de publicación aplicada durante la consulta.
+    - batch_size: dominios por consulta (> 1 agrupa los dominios chicos, ver `iter_by_domains`).
     """
-    all_rows: List[Dict[str, Any]] = []
-    session = _build_session()
-    for domain in domains:
-        count = 0
-        for item in query_catalog(
-            domain=domain,
-            q=q,
-            categories=categories,
-            limit=100,
-            max_pages=100,
-            app_token=app_token,
-            session=session,
-            stats=stats,
-        ):
-            all_rows.append(normalize_result(item))
-            count += 1
-            if count >= per_domain_limit:
-                break
-    return all_rows
+    return list(iter_by_domains(domains, q=q, categories=categories, per_domain_limit=per_domain_limit,
+                                app_token=app_token, stats=stats, workers=workers, updated_since=updated_since,
+                                published_from=published_from, published_to=published_to,
+                                batch_size=batch_size))
 
 
 def save_json(path: str, data: Any) -> None:
     os.makedirs(os.path.dirname(path), exist_ok=True)
     with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+        json.dump(data, f, ensure_ascii=False, indent=2, default=as_dict)
 
 
 def save_csv(path: str, rows: List[Dict[str, Any]]) -> None:
@@ -208,6 +686,7 @@ def save_csv(path: str, rows: List[Dict[str, Any]]) -> None:
     else:
         # Unir todas las claves para columnas completas
         headers = sorted({k for row in rows for k in row.keys()})
+        rows = [as_dict(row) for row in rows]
     with open(path, "w", encoding="utf-8", newline="") as f:
         writer = csv.DictWriter(f, fieldnames=headers)
         writer.writeheader()
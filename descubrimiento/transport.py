@@ -0,0 +1,200 @@
+"""
+Transporte HTTP común a los clientes Socrata y CKAN.
+
+Todo el proceso comparte un solo adapter de requests y, con él, el pool de conexiones
+por host de urllib3 (`PoolManager`, seguro entre hilos). Cada hilo usa su propia
+`requests.Session`, liviana (solo cookies y cabeceras), montada sobre ese adapter. Así
+una conexión TLS abierta por un dominio la reutilizan los demás hilos y las corridas
+siguientes del mismo proceso (p.ej. `service.py`).
+
+Con `pool_block` (default) un hilo que encuentra todas las conexiones del host ocupadas
+espera a que se libere una. Sin bloqueo, urllib3 abriría una conexión extra y la
+descartaría al devolverla ("Connection pool is full"), con un handshake de más.
+
+Parámetros (`configure` o variables de entorno):
+- pool_size (DISCOVERY_POOL_SIZE): conexiones por host que se conservan abiertas.
+- pool_hosts (DISCOVERY_POOL_HOSTS): hosts con pool propio antes de descartar el menos usado.
+- connect_timeout / read_timeout (DISCOVERY_CONNECT_TIMEOUT / DISCOVERY_READ_TIMEOUT).
+- keep_alive (DISCOVERY_KEEP_ALIVE=0 lo desactiva): conexiones persistentes con TCP
+  keepalive. Sin él, cada solicitud pide `Connection: close`.
+"""
+import argparse
+import os
+import socket
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+from http_cache import get_default_cache, make_adapter
+from metrics import observe_response, wire_bytes
+from rate_limit import THROTTLE_STATUS, AdaptiveRetry
+
+
+# Reintentos comunes a ambos clientes (el cliente async replica la misma semántica)
+RETRY_TOTAL = 3
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+class TransportConfig:
+    """Parámetros del pool compartido; ver el docstring del módulo."""
+
+    __slots__ = ("pool_size", "pool_hosts", "pool_block", "connect_timeout", "read_timeout", "keep_alive")
+
+    def __init__(self, pool_size: int = 16, pool_hosts: int = 32, pool_block: bool = True,
+                 connect_timeout: float = 10.0, read_timeout: float = 30.0, keep_alive: bool = True):
+        if pool_size < 1 or pool_hosts < 1:
+            raise ValueError("pool_size y pool_hosts deben ser >= 1")
+        self.pool_size = int(pool_size)
+        self.pool_hosts = int(pool_hosts)
+        self.pool_block = bool(pool_block)
+        self.connect_timeout = float(connect_timeout)
+        self.read_timeout = float(read_timeout)
+        self.keep_alive = bool(keep_alive)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _config_from_env() -> TransportConfig:
+    env = os.environ
+    return TransportConfig(
+        pool_size=int(env.get("DISCOVERY_POOL_SIZE", "16")),
+        pool_hosts=int(env.get("DISCOVERY_POOL_HOSTS", "32")),
+        connect_timeout=float(env.get("DISCOVERY_CONNECT_TIMEOUT", "10")),
+        read_timeout=float(env.get("DISCOVERY_READ_TIMEOUT", "30")),
+        keep_alive=env.get("DISCOVERY_KEEP_ALIVE", "1") != "0",
+    )
+
+
+_config = _config_from_env()
+_lock = threading.Lock()
+# (caché con la que se armó, adapter): se rearma si cambia la caché o la configuración
+_shared: Optional[Tuple[Any, HTTPAdapter]] = None
+
+
+def configure(**options: Any) -> TransportConfig:
+    """
+    Cambia parámetros del pool (los no indicados se conservan). Las sesiones creadas
+    desde este momento usan un adapter nuevo; las que ya están en uso terminan con el anterior.
+    """
+    global _config, _shared
+    values = _config.as_dict()
+    for name, value in options.items():
+        if name not in values:
+            raise ValueError(f"Parámetro de transporte desconocido: {name}")
+        if value is not None:
+            values[name] = value
+    with _lock:
+        _config = TransportConfig(**values)
+        _shared = None
+    return _config
+
+
+def get_config() -> TransportConfig:
+    return _config
+
+
+def request_timeout() -> Tuple[float, float]:
+    """Timeout (connect, read) para `session.get`."""
+    return (_config.connect_timeout, _config.read_timeout)
+
+
+def _build_adapter(config: TransportConfig) -> HTTPAdapter:
+    retries = AdaptiveRetry(
+        total=RETRY_TOTAL,
+        connect=RETRY_TOTAL,
+        read=RETRY_TOTAL,
+        status=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        status_forcelist=tuple(sorted(RETRY_STATUS)),
+        allowed_methods=frozenset({"GET"}),
+    )
+    adapter = make_adapter(retries, pool_connections=config.pool_hosts, pool_maxsize=config.pool_size,
+                           pool_block=config.pool_block)
+    if config.keep_alive:
+        # TCP keepalive: el sistema detecta conexiones ociosas cortadas por un proxy o NAT
+        options = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        adapter.init_poolmanager(config.pool_hosts, config.pool_size, block=config.pool_block,
+                                 socket_options=options)
+    return adapter
+
+
+def shared_adapter() -> HTTPAdapter:
+    """Adapter del proceso (con la caché HTTP configurada en este momento, si hay)."""
+    global _shared
+    cache = get_default_cache()
+    with _lock:
+        if _shared is None or _shared[0] is not cache:
+            _shared = (cache, _build_adapter(_config))
+        return _shared[1]
+
+
+def build_session() -> requests.Session:
+    """
+    Sesión HTTP con reintentos sobre el pool compartido. Crearla es barato; una
+    `requests.Session` no debe usarse desde varios hilos a la vez, el adapter sí.
+    """
+    session = requests.Session()
+    adapter = shared_adapter()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not _config.keep_alive:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def close() -> None:
+    """Cierra las conexiones del pool compartido (al terminar el proceso o en pruebas)."""
+    global _shared
+    with _lock:
+        shared, _shared = _shared, None
+    if shared is not None:
+        shared[1].close()
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Opciones de CLI del pool compartido (las usan run_discovery.py y service.py)."""
+    parser.add_argument("--pool-size", dest="pool_size", type=int, default=None,
+                        help=f"Conexiones abiertas por host en el pool compartido (default: {_config.pool_size})")
+    parser.add_argument("--connect-timeout", dest="connect_timeout", type=float, default=None,
+                        help=f"Segundos para establecer la conexión (default: {_config.connect_timeout:g})")
+    parser.add_argument("--read-timeout", dest="read_timeout", type=float, default=None,
+                        help=f"Segundos de espera entre bytes de la respuesta (default: {_config.read_timeout:g})")
+    parser.add_argument("--no-keep-alive", dest="keep_alive", action="store_false", default=None,
+                        help="Cerrar la conexión después de cada solicitud")
+
+
+def configure_from_args(args: argparse.Namespace) -> TransportConfig:
+    return configure(pool_size=args.pool_size, connect_timeout=args.connect_timeout,
+                     read_timeout=args.read_timeout, keep_alive=args.keep_alive)
+
+
+def update_http_stats(stats: Optional[Dict[str, int]], resp: requests.Response) -> None:
+    """Suma una respuesta a los contadores de la corrida y a las métricas por host."""
+    observe_response(resp)
+    if stats is None:
+        return
+    cache_status = getattr(resp, "cache_status", None)
+    if cache_status != "hit":
+        # Un hit de caché no llega a la red ni consume cuota
+        stats["requests"] = stats.get("requests", 0) + 1
+        stats["bytes_wire"] = stats.get("bytes_wire", 0) + wire_bytes(resp)
+        stats["bytes_decoded"] = stats.get("bytes_decoded", 0) + len(getattr(resp, "content", None) or b"")
+    retries_used = 0
+    raw = getattr(resp, "raw", None)
+    retries = getattr(raw, "retries", None)
+    history = getattr(retries, "history", None)
+    if history:
+        retries_used = len(history)
+        throttled = sum(1 for h in history if h.status in THROTTLE_STATUS)
+        if throttled:
+            stats["throttled"] = stats.get("throttled", 0) + throttled
+    stats["retries"] = stats.get("retries", 0) + retries_used
+    if cache_status == "miss":
+        stats["cache_misses"] = stats.get("cache_misses", 0) + 1
+    elif cache_status in ("hit", "revalidated"):
+        stats["cache_hits"] = stats.get("cache_hits", 0) + 1
@@ -0,0 +1,61 @@
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """
+    Convierte marcas de tiempo de los portales a datetime UTC.
+    Acepta el formato Socrata ("2024-05-20T12:34:56.000Z") y el de CKAN
+    ("2024-05-20T12:34:56.123456", sin zona, implícitamente UTC).
+    """
+    if not value or not isinstance(value, str):
+        return None
+    s = value.strip()
+    if s.endswith("Z"):
+        s = s[:-1] + "+00:00"
+    try:
+        dt = datetime.fromisoformat(s)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def format_timestamp(dt: datetime) -> str:
+    """Formato canónico guardado en el estado y aceptado por Solr (CKAN)."""
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def max_timestamp(values: Iterable[Optional[str]], current: Optional[str] = None) -> Optional[str]:
+    """Devuelve la marca más reciente entre `current` y `values` (formato canónico)."""
+    best = parse_timestamp(current)
+    for v in values:
+        dt = parse_timestamp(v)
+        if dt and (best is None or dt > best):
+            best = dt
+    return format_timestamp(best) if best else None
+
+
+def state_path(state_dir: str, country_slug: str) -> str:
+    return os.path.join(state_dir, f"{country_slug}_watermarks.json")
+
+
+def load_watermarks(path: str) -> Dict[str, str]:
+    """Lee {dominio|base_url: marca} de un país; vacío si aún no hay estado."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return {k: v for k, v in data.items() if isinstance(v, str)} if isinstance(data, dict) else {}
+
+
+def save_watermarks(path: str, marks: Dict[str, str]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(marks, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp, path)
@@ -0,0 +1,90 @@
+import os
+import sys
+import unittest
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+if DISCOVERY_DIR not in sys.path:
+    sys.path.insert(0, DISCOVERY_DIR)
+
+try:
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+    import async_discovery
+except ImportError:  # aiohttp es opcional
+    async_discovery = None
+
+
+@unittest.skipIf(async_discovery is None, "aiohttp no instalado")
+class AsyncClientTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.calls = 0
+        self.fail_first = 0
+
+        async def package_search(request):
+            self.calls += 1
+            if self.fail_first:
+                self.fail_first -= 1
+                return web.Response(status=503, headers={"Retry-After": "0"})
+            start, rows = int(request.query["start"]), int(request.query["rows"])
+            results = [{"id": str(i), "name": f"ds{i}"} for i in range(start, min(start + rows, 250))]
+            return web.json_response({"success": True, "result": {"count": 250, "results": results}})
+
+        self.socrata_params = []
+        created = ["2023-06-01", "2023-12-01", "2024-03-01", "2025-02-01"]
+
+        async def catalog(request):
+            self.socrata_params.append(dict(request.query))
+            offset, limit = int(request.query.get("offset", 0)), int(request.query["limit"])
+            items = [{"resource": {"id": d, "createdAt": d + "T00:00:00.000Z"}} for d in sorted(created)]
+            # Creado antes de la ventana y publicado dentro
+            items[1]["view"] = {"publication_date": "2024-02-01T00:00:00.000Z"}
+            return web.json_response({"results": items[offset:offset + limit], "resultSetSize": len(items)})
+
+        app = web.Application()
+        app.router.add_get("/api/3/action/package_search", package_search)
+        app.router.add_get("/api/catalog/v1", catalog)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.base_url = str(self.server.make_url("")).rstrip("/")
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    async def test_ckan_prefetch_en_orden_y_stats(self):
+        stats = {}
+        async with async_discovery.build_client_session() as session:
+            ids = [item["id"] async for item in async_discovery.aquery_ckan_catalog(
+                base_url=self.base_url, rows=100, session=session, stats=stats, prefetch=3)]
+        self.assertEqual(ids, [str(i) for i in range(250)])
+        # Sin compresión lo que viaja es el cuerpo tal cual
+        self.assertGreater(stats["bytes_wire"], 0)
+        self.assertEqual(stats.pop("bytes_wire"), stats.pop("bytes_decoded"))
+        self.assertEqual(stats, {"requests": 3, "retries": 0})
+
+    async def test_reintenta_503_y_cuenta_retries(self):
+        self.fail_first = 2
+        stats = {}
+        rows = await async_discovery.afetch_ckan_by_config(base_url=self.base_url, per_query_limit=50, stats=stats)
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(stats.pop("bytes_wire"), stats.pop("bytes_decoded"))
+        self.assertEqual(stats, {"requests": 1, "retries": 2, "throttled": 2})
+
+    async def test_socrata_ventana_de_publicacion(self):
+        base = async_discovery.socrata_discovery.DISCOVERY_BASE
+        async_discovery.socrata_discovery.DISCOVERY_BASE = self.base_url + "/api/catalog/v1"
+        try:
+            ids = [item["resource"]["id"] async for item in async_discovery.aquery_catalog(
+                domain="x", limit=1, max_pages=None, app_token="t",
+                published_from="2024-01-01", published_to="2024-12-31")]
+        finally:
+            async_discovery.socrata_discovery.DISCOVERY_BASE = base
+        self.assertEqual(ids, ["2023-12-01", "2024-03-01"])
+        self.assertEqual(self.socrata_params[0]["order"], "createdAt")
+        # Se corta en el primer asset creado después de la ventana
+        self.assertEqual(len(self.socrata_params), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+if DISCOVERY_DIR not in sys.path:
+    sys.path.insert(0, DISCOVERY_DIR)
+
+import catalog_diff  # noqa: E402
+import sinks  # noqa: E402
+
+
+def _row(i, **changes):
+    row = {"id": f"id-{i}", "permalink": f"https://p/d/{i}", "name": f"Dataset {i}", "type": "dataset",
+           "categories": "Salud,Educación", "download_count": i * 3, "publication_date": "2024-01-01"}
+    row.update(changes)
+    return row
+
+
+class CatalogDiffTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, rows, formats=("json",)):
+        base = os.path.join(self.tmp.name, name)
+        for sink in sinks.open_sinks(base, formats):
+            with sink:
+                for row in rows:
+                    sink.write(row)
+        return base
+
+    def test_altas_bajas_y_cambios_con_campos(self):
+        old = [_row(i) for i in range(50)]
+        new = [r for r in old if r["id"] not in ("id-7", "id-30")]
+        new[3] = _row(3, name="Dataset 3 (revisado)", download_count=999)
+        new[10] = _row(11, download_count=1)
+        new += [_row(100), _row(101)]
+        old_base, new_base = self._write("old", old), self._write("new", new)
+        stats = {}
+        entries = list(catalog_diff.diff_catalogs(old_base + ".json", new_base + ".json", stats=stats))
+        by_change = {c: [e["id"] for e in entries if e["change"] == c] for c in catalog_diff.CHANGES}
+        self.assertEqual(by_change, {"added": ["id-100", "id-101"], "removed": ["id-7", "id-30"],
+                                     "changed": ["id-3", "id-11"]})
+        changed = next(e for e in entries if e["id"] == "id-3")
+        self.assertEqual(changed["fields"], ["download_count", "name"])
+        self.assertEqual(changed["before"], {"download_count": 9, "name": "Dataset 3"})
+        self.assertEqual(changed["after"]["name"], "Dataset 3 (revisado)")
+        self.assertEqual((stats["old_rows"], stats["new_rows"], stats["changed"]), (50, 50, 2))
+
+        # Sin contar descargas, id-11 deja de ser un cambio
+        entries = list(catalog_diff.diff_catalogs(old_base + ".json", new_base + ".json",
+                                                  ignore=["download_count"]))
+        self.assertEqual([e["id"] for e in entries if e["change"] == "changed"], ["id-3"])
+        self.assertEqual(next(e for e in entries if e["id"] == "id-3")["fields"], ["name"])
+
+    def test_csv_contra_json_y_cli(self):
+        rows = [_row(i, download_count=None if i % 4 == 0 else i) for i in range(20)]
+        base = self._write("mismo", rows, formats=("json", "csv"))
+        self.assertEqual(list(catalog_diff.diff_catalogs(base + ".csv", base + ".json")), [])
+
+        new = self._write("nuevo", rows[1:] + [_row(20)], formats=("ndjson",))
+        out = os.path.join(self.tmp.name, "diff", "cambios.ndjson")
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            catalog_diff.main([base + ".csv", new + ".ndjson", "--out", out])
+        self.assertIn("1 agregadas, 1 eliminadas, 0 modificadas", stdout.getvalue())
+        with open(out, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual([(e["change"], e["id"]) for e in entries], [("added", "id-20"), ("removed", "id-0")])
+
+    def test_fechas_en_distinta_forma_no_son_cambios(self):
+        # JSON/CSV guardan las fechas del portal; Parquet/Arrow las devuelven con isoformat()
+        old = [_row(i, publication_date="2024-01-01", updated_at=f"2024-05-20T12:34:{i:02d}.000Z")
+               for i in range(5)]
+        new = [_row(i, publication_date="2024-01-01T00:00:00+00:00", updated_at=f"2024-05-20T12:34:{i:02d}+00:00")
+               for i in range(5)]
+        new[2]["updated_at"] = "2024-06-01T00:00:00+00:00"
+        old_base, new_base = self._write("old", old), self._write("new", new, formats=("ndjson",))
+        entries = list(catalog_diff.diff_catalogs(old_base + ".json", new_base + ".ndjson"))
+        self.assertEqual([(e["id"], e["fields"]) for e in entries], [("id-2", ["updated_at"])])
+        self.assertEqual(catalog_diff.timestamp_key("2024-05-20T09:34:56-03:00"),
+                         catalog_diff.timestamp_key("2024-05-20T12:34:56.000Z"))
+        self.assertEqual(catalog_diff.timestamp_key("sin fecha"), "sin fecha")
+
+
+if __name__ == "__main__":
+    unittest.main()
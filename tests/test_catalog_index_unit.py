@@ -0,0 +1,97 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+if DISCOVERY_DIR not in sys.path:
+    sys.path.insert(0, DISCOVERY_DIR)
+
+import catalog_index  # noqa: E402
+import run_discovery  # noqa: E402
+from records import DatasetRecord  # noqa: E402
+
+
+def _row(i, name, categories="Salud", date="2023-05-10T00:00:00.000Z", **extra):
+    fields = dict(id=f"id-{i}", permalink=f"https://x/d/{i}", name=name, description=f"Descripción {i}",
+                  domain="datos.example.gov", categories=categories, domain_category=categories.split(",")[0],
+                  tags="t1,t2", publication_date=date, download_count="7")
+    fields.update(extra)
+    return DatasetRecord(**fields)
+
+
+class CatalogIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "catalog.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _index(self, country, rows):
+        with catalog_index.IndexSink(self.db, country, batch_size=2) as sink:
+            for r in rows:
+                sink.write(r)
+        return sink
+
+    def test_busqueda_por_texto_pais_y_categoria(self):
+        self._index("Chile", [_row(1, "Hospitales públicos"), _row(2, "Matrícula escolar", "Educación")])
+        self._index("México", [_row(1, "Camas de hospital"), _row(3, "Presupuesto", "Finanzas")])
+        self._index("Colombia", [_row(4, "Hospitales de Bogotá")])
+        conn = catalog_index.connect(self.db)
+        try:
+            found = catalog_index.search(conn, "hospital", countries=["Chile", "México"], categories=["salud"])
+            self.assertEqual({(r["country"], r["id"]) for r in found}, {("Chile", "id-1"), ("México", "id-1")})
+            # Sin tildes y por categoría sola
+            self.assertEqual([r["name"] for r in catalog_index.search(conn, "matricula")], ["Matrícula escolar"])
+            self.assertEqual(len(catalog_index.search(conn, categories=["FINANZAS"])), 1)
+            self.assertEqual(dict(catalog_index.count_by(conn, "country")), {"Chile": 2, "México": 2, "Colombia": 1})
+        finally:
+            conn.close()
+
+    def test_upsert_actualiza_texto_y_categorias(self):
+        self._index("Chile", [_row(1, "Hospitales públicos")])
+        sink = self._index("Chile", [_row(1, "Escuelas rurales", "Educación", date="2024-01-02")])
+        self.assertEqual(sink.count, 1)
+        conn = catalog_index.connect(self.db)
+        try:
+            self.assertEqual(catalog_index.search(conn, "hospitales"), [])
+            found = catalog_index.search(conn, "escuelas", categories=["educación"])
+            self.assertEqual(len(found), 1)
+            self.assertEqual(found[0]["published_on"], "2024-01-02")
+            self.assertEqual(found[0]["download_count"], 7)
+            self.assertEqual(catalog_index.search(conn, categories=["Salud"]), [])
+            self.assertEqual(len(catalog_index.search(conn, published_from="2024-01-01")), 1)
+            self.assertEqual(catalog_index.search(conn, published_to="2023-12-31"), [])
+        finally:
+            conn.close()
+
+    def test_abort_descarta_lote_pendiente(self):
+        sink = catalog_index.IndexSink(self.db, "Chile", batch_size=10)
+        sink.write(_row(1, "Pendiente"))
+        sink.abort()
+        conn = catalog_index.connect(self.db)
+        try:
+            self.assertEqual(catalog_index.count_by(conn, "country"), [])
+        finally:
+            conn.close()
+
+    def test_finalize_country_indexa_filas_exportadas(self):
+        rows = [_row(1, "Hospitales"), _row(1, "Hospitales"), _row(2, "Antiguo", date="2010-01-01")]
+        with mock.patch.object(run_discovery, "OUTPUT_DIR", self.tmp.name):
+            count = run_discovery._finalize_country("Chile", "socrata", rows, {}, 0.0, "2020-01-01", None,
+                                                    formats=("json",), index_db=self.db)
+        self.assertEqual(count, 1)
+        conn = catalog_index.connect(self.db)
+        try:
+            self.assertEqual([r["name"] for r in catalog_index.search(conn, countries=["Chile"])],
+                             ["Hospitales"])
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
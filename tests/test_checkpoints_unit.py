@@ -0,0 +1,115 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+for path in (DISCOVERY_DIR, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import ckan_client  # noqa: E402
+import rate_limit  # noqa: E402
+import run_discovery  # noqa: E402
+import socrata_discovery  # noqa: E402
+from checkpoints import CheckpointStore  # noqa: E402
+from fake_portal import FakePortal, PortalState  # noqa: E402
+
+
+class CheckpointResumeTests(unittest.TestCase):
+    def setUp(self):
+        rate_limit.reset_limiters()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.state = PortalState(datasets=450, domains=["a.example", "b.example"])
+        self.portal = FakePortal(self.state).__enter__()
+        self._base = socrata_discovery.DISCOVERY_BASE
+        socrata_discovery.DISCOVERY_BASE = self.portal.socrata_base
+
+    def tearDown(self):
+        socrata_discovery.DISCOVERY_BASE = self._base
+        self.portal.__exit__(None, None, None)
+        rate_limit.reset_limiters()
+        self.tmp.cleanup()
+
+    def _store(self, resume, signature=None):
+        return CheckpointStore(self.tmp.name, "pais", signature or {"q": None}, resume=resume)
+
+    def test_ckan_reanuda_desde_la_ultima_pagina_confirmada(self):
+        store = self._store(resume=False)
+        rows = ckan_client.iter_ckan_by_config(base_url=self.portal.url, per_query_limit=1000,
+                                               prefetch=2, checkpoint=store)
+        first = [next(rows)["id"] for _ in range(250)]
+        rows.close()  # corte a mitad de la tercera página
+        store.close()
+        self.assertEqual(store.pending_sources(), [self.portal.url])
+
+        self.state.requests = 0
+        resumed = self._store(resume=True)
+        self.assertEqual(resumed.replayed_rows, 200)
+        ids = [r["id"] for r in ckan_client.iter_ckan_by_config(base_url=self.portal.url, per_query_limit=1000,
+                                                                 checkpoint=resumed)]
+        self.assertEqual(ids, [f"pkg-{i}" for i in range(450)])
+        self.assertEqual(ids[:250], first)
+        # Solo se piden las páginas 3, 4 y 5
+        self.assertEqual(self.state.requests, 3)
+        self.assertEqual(resumed.pending_sources(), [])
+
+    def test_socrata_por_dominio_y_firma_distinta(self):
+        store = self._store(resume=False)
+        rows = socrata_discovery.iter_by_domains(self.state.domains, per_domain_limit=300, checkpoint=store)
+        for _ in range(300 + 150):
+            next(rows)
+        rows.close()
+        store.close()
+
+        self.state.requests = 0
+        resumed = self._store(resume=True)
+        out = list(socrata_discovery.iter_by_domains(self.state.domains, per_domain_limit=300, checkpoint=resumed))
+        self.assertEqual(len(out), 600)
+        self.assertEqual(len({(r["id"], r["permalink"]) for r in out}), 600)
+        # a.example terminó por límite; b.example sigue desde offset 100 (páginas 2 y 3)
+        self.assertEqual(self.state.requests, 2)
+
+        with mock.patch("builtins.print"):
+            other = self._store(resume=True, signature={"q": "salud"})
+        self.assertEqual(other.replayed_rows, 0)
+        self.assertFalse(os.path.exists(other.partial_dir))
+
+    def test_run_for_country_con_error_de_red_y_resume(self):
+        config = {"platform": "ckan", "base_url": self.portal.url}
+        real_get_page = ckan_client._get_page
+
+        def flaky(session, endpoint, params, stats=None):
+            if params["start"] >= 300:
+                raise requests.exceptions.ConnectionError("red caída")
+            return real_get_page(session, endpoint, params, stats)
+
+        with mock.patch.object(run_discovery, "OUTPUT_DIR", self.tmp.name), \
+                mock.patch.object(run_discovery, "STATE_DIR", os.path.join(self.tmp.name, "state")), \
+                mock.patch("builtins.print"):
+            with mock.patch.object(ckan_client, "_get_page", flaky):
+                count, metrics = run_discovery.run_for_country("Pais", config, with_metrics=True,
+                                                               formats=("json",), checkpoints=True)
+            self.assertEqual(count, 300)
+            self.assertEqual(metrics["pending_sources"], [self.portal.url])
+
+            count, metrics = run_discovery.run_for_country("Pais", config, with_metrics=True,
+                                                           formats=("json",), checkpoints=True, resume=True)
+            self.assertEqual(count, 450)
+            self.assertEqual(metrics["resumed_rows"], 300)
+            self.assertEqual(metrics["http_requests"], 2)
+            self.assertNotIn("pending_sources", metrics)
+            self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "state", "pais_checkpoint.json")))
+            with open(os.path.join(self.tmp.name, "pais_catalog.json"), encoding="utf-8") as f:
+                self.assertEqual(len(json.load(f)), 450)
+
+
+if __name__ == "__main__":
+    unittest.main()
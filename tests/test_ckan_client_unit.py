@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+for path in (DISCOVERY_DIR, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import ckan_client  # noqa: E402
+import rate_limit  # noqa: E402
+from fake_portal import FakePortal, PortalState  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self._payload = payload
+        self.status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._payload
+
+
+class FakeCkanSession:
+    """Sirve package_search sobre un catálogo sintético; páginas tempranas responden más lento."""
+
+    def __init__(self, total):
+        self.total = total
+        self.starts = []
+
+    def get(self, url, params=None, **kwargs):
+        start, rows = params["start"], params["rows"]
+        self.starts.append(start)
+        time.sleep(0.02 if start < 2 * rows else 0.0)
+        results = [{"id": str(i), "name": f"ds{i}"} for i in range(start, min(start + rows, self.total))]
+        return FakeResponse({"success": True, "result": {"count": self.total, "results": results}})
+
+
+class QueryCkanCatalogTests(unittest.TestCase):
+    def test_ventana_de_fechas_en_fq(self):
+        params = ckan_client.build_search_params(groups=["salud"], created_from="2024-01-01",
+                                                 created_to="2024-12-31")
+        self.assertEqual(
+            params["fq"],
+            "(groups:salud) AND metadata_created:[2024-01-01T00:00:00Z TO 2024-12-31T23:59:59.999Z]",
+        )
+        only_from = ckan_client.build_search_params(created_from="2024-01-01")
+        self.assertEqual(only_from["fq"], "metadata_created:[2024-01-01T00:00:00Z TO *]")
+
+    def _worker_sessions(self, total):
+        """Los hilos del prefetch no comparten la sesión del llamador: arman una cada uno."""
+        catalog = FakeCkanSession(total)
+        created = []
+
+        def build_session():
+            created.append(FakeCkanSession(total))
+            created[-1].starts = catalog.starts
+            return created[-1]
+
+        patcher = mock.patch.object(ckan_client, "build_session", build_session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return catalog, created
+
+    def test_prefetch_conserva_orden(self):
+        session, created = self._worker_sessions(total=95)
+        stats = {}
+        items = list(ckan_client.query_ckan_catalog(base_url="http://ckan.local", rows=10, session=session,
+                                                    stats=stats, prefetch=4))
+        self.assertEqual([it["id"] for it in items], [str(i) for i in range(95)])
+        self.assertEqual(stats["requests"], 10)
+        self.assertEqual(sorted(session.starts), list(range(0, 100, 10)))
+        # Una sesión por hilo del pool, nunca la del llamador
+        self.assertTrue(1 <= len(created) <= 4)
+        self.assertNotIn(session, created)
+
+    def test_prefetch_respeta_max_pages(self):
+        session, _ = self._worker_sessions(total=95)
+        items = list(ckan_client.query_ckan_catalog(base_url="http://ckan.local", rows=10, max_pages=3,
+                                                    session=session, prefetch=4))
+        self.assertEqual(len(items), 30)
+
+    def test_secuencial_igual_a_prefetch(self):
+        seq = list(ckan_client.query_ckan_catalog(base_url="http://ckan.local", rows=10,
+                                                  session=FakeCkanSession(total=42)))
+        session, _ = self._worker_sessions(total=42)
+        par = list(ckan_client.query_ckan_catalog(base_url="http://ckan.local", rows=10,
+                                                  session=session, prefetch=3))
+        self.assertEqual(seq, par)
+
+
+class CkanLeanTests(unittest.TestCase):
+    def setUp(self):
+        rate_limit.reset_limiters()
+
+    def tearDown(self):
+        ckan_client.set_lean(False)
+        ckan_client._lean_rejected.clear()
+        rate_limit.reset_limiters()
+
+    def _fetch(self, state, lean):
+        ckan_client.set_lean(lean)
+        stats = {}
+        with FakePortal(state) as portal:
+            rows = ckan_client.fetch_ckan_by_config(base_url=portal.url, per_query_limit=1000, stats=stats)
+            base = portal.url
+        return [dict(r, permalink=r["permalink"].replace(base, ""), link=None) for r in rows], stats
+
+    def test_lean_con_gzip_mismas_filas_y_menos_bytes(self):
+        full, full_stats = self._fetch(PortalState(datasets=250), lean=False)
+        lean, lean_stats = self._fetch(PortalState(datasets=250, compress=True), lean=True)
+        self.assertEqual(len(lean), 250)
+        # En el índice Solr la organización viene por nombre, no por título
+        for row in full + lean:
+            row.pop("organization")
+            row.pop("domain_category")
+        self.assertEqual(lean, full)
+        self.assertEqual(full_stats["bytes_wire"], full_stats["bytes_decoded"])
+        self.assertLess(lean_stats["bytes_decoded"], full_stats["bytes_decoded"] / 2)
+        self.assertLess(lean_stats["bytes_wire"], lean_stats["bytes_decoded"] / 2)
+
+    def test_portal_sin_fl_vuelve_al_package_completo(self):
+        state = PortalState(datasets=250, lean_supported=False)
+        with mock.patch("builtins.print") as printed:
+            rows, stats = self._fetch(state, lean=True)
+        self.assertEqual([r["id"] for r in rows], [f"pkg-{i}" for i in range(250)])
+        self.assertEqual(rows[0]["organization"], "Organización 0")
+        # Un solo rechazo, una sola advertencia
+        self.assertEqual(state.requests, 4)
+        # La solicitud rechazada también salió a la red y se cuenta
+        self.assertEqual(stats["requests"], 4)
+        self.assertGreater(stats["bytes_wire"], 0)
+        self.assertEqual(printed.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
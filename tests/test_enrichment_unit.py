@@ -0,0 +1,129 @@
+import csv
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+for path in (DISCOVERY_DIR, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import enrichment  # noqa: E402
+import rate_limit  # noqa: E402
+import run_discovery  # noqa: E402
+import transport  # noqa: E402
+from ckan_client import normalize_ckan_result  # noqa: E402
+from fake_portal import FakePortal, PortalState  # noqa: E402
+from socrata_discovery import normalize_result  # noqa: E402
+
+
+class EnrichmentTests(unittest.TestCase):
+    def setUp(self):
+        rate_limit.reset_limiters()
+        self.state = PortalState(datasets=12, domains=["datos.example"])
+        self.portal = FakePortal(self.state).__enter__()
+        patches = [mock.patch.object(enrichment, "SOCRATA_VIEWS_URL", self.portal.url + "/api/views/{id}.json"),
+                   mock.patch.object(enrichment, "SODA_RESOURCE_URL", self.portal.url + "/resource/{id}.json")]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        self.portal.__exit__(None, None, None)
+        transport.close()
+        rate_limit.reset_limiters()
+
+    def test_socrata_por_tipo_de_vista_y_en_orden(self):
+        rows = [normalize_result(self.state.socrata_item("datos.example", i)) for i in range(10)]
+        stats = {}
+        out = list(enrichment.enrich_rows(iter(rows), workers=4, stats=stats, app_token="t"))
+        self.assertEqual([r["id"] for r in out], [r["id"] for r in rows])
+        by_index = {int(r["id"].split("-")[0]): r for r in out}
+        # dataset con cachedContents (0) y sin ellos (5): el segundo cuenta con $select=count(*)
+        for i in (0, 5):
+            self.assertEqual(by_index[i]["formats"], enrichment.SODA_EXPORT_FORMATS)
+            self.assertEqual(by_index[i]["row_count"], PortalState.row_count(i))
+            self.assertIsNone(by_index[i]["size_bytes"])
+        self.assertEqual(by_index[1]["formats"], "GEOJSON,KML,KMZ,SHAPEFILE")
+        self.assertEqual((by_index[3]["formats"], by_index[3]["size_bytes"]), ("PDF", PortalState.resource_size(3, 0)))
+        self.assertEqual(by_index[4]["formats"], "CSV,XLSX")
+        # Los gráficos (2, 7) no se exportan ni se cuentan
+        for i in (2, 7):
+            self.assertEqual((by_index[i]["formats"], by_index[i]["row_count"]), ("", None))
+        # Una vista por fila más un conteo por cada dataset tabular impar (5)
+        self.assertEqual(stats["enrich_requests"], 10 + 1)
+        self.assertEqual((stats["enriched_rows"], stats["enrich_errors"]), (10, 0))
+
+    def test_socrata_solo_cuenta_datasets_y_tolera_fallas_del_conteo(self):
+        for view, asset_type in (({"viewType": "story"}, None),
+                                 ({"viewType": "tabular", "displayType": "chart"}, None),
+                                 ({"viewType": "tabular"}, "filter"),
+                                 ({"viewType": "measure"}, "measure")):
+            self.assertEqual(enrichment.socrata_fields(view, asset_type),
+                             {"formats": "", "size_bytes": None, "row_count": None})
+            self.assertFalse(enrichment.is_tabular_dataset(view, asset_type))
+        self.assertTrue(enrichment.is_tabular_dataset({"viewType": "tabular", "displayType": "table"}, "dataset"))
+
+        # El conteo falla con 400: la fila conserva los formatos de la vista
+        row = normalize_result(self.state.socrata_item("datos.example", 5))
+        enricher = enrichment.Enricher(app_token="t")
+        real_get_json = enricher._get_json
+
+        def get_json(url, params=None, headers=None):
+            if "/resource/" in url:
+                raise requests.exceptions.HTTPError("400 Client Error: Bad Request")
+            return real_get_json(url, params, headers)
+
+        with mock.patch.object(enricher, "_get_json", get_json), mock.patch("builtins.print"):
+            enricher.enrich(row)
+        self.assertEqual((row["formats"], row["row_count"]), (enrichment.SODA_EXPORT_FORMATS, None))
+        self.assertEqual(enricher.stats()["enriched_rows"], 1)
+        self.assertEqual(enricher.stats()["enrich_errors"], 0)
+
+    def test_ckan_recursos_datastore_y_fallas(self):
+        rows = [normalize_ckan_result(self.state.ckan_item(i), base_url=self.portal.url) for i in (3, 4, 5)]
+        missing = normalize_ckan_result(dict(self.state.ckan_item(1), id="pkg-999"), base_url=self.portal.url)
+        stats = {}
+        out = list(enrichment.enrich_rows(rows + [missing], workers=2, stats=stats))
+        self.assertEqual(out[0]["formats"], "CSV,JSON,XLSX")
+        self.assertEqual(out[0]["size_bytes"], sum(PortalState.resource_size(3, j) for j in range(3)))
+        # Solo el primer recurso está en el DataStore
+        self.assertEqual(out[1]["row_count"], PortalState.row_count(4))
+        self.assertEqual((out[2]["formats"], out[2]["size_bytes"], out[2]["row_count"]), ("", None, None))
+        self.assertIsNone(out[3]["formats"])
+        self.assertEqual((stats["enriched_rows"], stats["enrich_skipped"]), (3, 1))
+
+        enricher = enrichment.Enricher(app_token="t")
+        with mock.patch.object(enricher, "_ckan", side_effect=requests.exceptions.ConnectionError("caído")), \
+                mock.patch("builtins.print"):
+            row = enricher.enrich(normalize_ckan_result(self.state.ckan_item(6), base_url=self.portal.url))
+        self.assertIsNone(row["row_count"])
+        self.assertEqual(enricher.stats()["enrich_errors"], 1)
+        # Una fila ya enriquecida no se vuelve a pedir
+        before = self.state.requests
+        self.assertIs(enricher.enrich(out[0]), out[0])
+        self.assertEqual(self.state.requests, before)
+
+    def test_run_for_country_exporta_las_columnas(self):
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.object(run_discovery, "OUTPUT_DIR", tmp):
+            count, metrics = run_discovery.run_for_country(
+                "Prueba", {"platform": "ckan", "base_url": self.portal.url}, per_domain_limit=12,
+                with_metrics=True, enrich=True, enrich_workers=3)
+            with open(os.path.join(tmp, "prueba_catalog.csv"), encoding="utf-8") as f:
+                exported = list(csv.DictReader(f))
+        self.assertEqual((count, metrics["enriched_rows"]), (12, 12))
+        self.assertIn("enrich", metrics["stage_seconds"])
+        self.assertEqual(metrics["enrich_requests"], 12 + sum(1 for i in range(12) if i % 5))
+        row = next(r for r in exported if r["id"] == "pkg-4")
+        self.assertEqual((row["formats"], row["row_count"]), ("CSV,JSON,XLSX", str(PortalState.row_count(4))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import sys
+import unittest
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+for path in (DISCOVERY_DIR, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import ckan_client  # noqa: E402
+import rate_limit  # noqa: E402
+import socrata_discovery  # noqa: E402
+from fake_portal import FakePortal, PortalState  # noqa: E402
+
+
+class FakePortalEndToEndTests(unittest.TestCase):
+    """Los clientes completan el catálogo sintético pese a 429 y errores 500."""
+
+    def setUp(self):
+        rate_limit.reset_limiters()
+        self.state = PortalState(datasets=250, domains=["a.example", "b.example"],
+                                 burst_every=4, burst_len=1, retry_after=0)
+        self.portal = FakePortal(self.state).__enter__()
+        self._base = socrata_discovery.DISCOVERY_BASE
+        socrata_discovery.DISCOVERY_BASE = self.portal.socrata_base
+
+    def tearDown(self):
+        socrata_discovery.DISCOVERY_BASE = self._base
+        self.portal.__exit__(None, None, None)
+        rate_limit.reset_limiters()
+
+    def test_socrata_por_dominios(self):
+        stats = {}
+        rows = socrata_discovery.fetch_by_domains(self.state.domains, per_domain_limit=1000, stats=stats, workers=2)
+        self.assertEqual(len(rows), 500)
+        self.assertEqual(len({(r["id"], r["permalink"]) for r in rows}), 500)
+        self.assertGreater(stats["throttled"], 0)
+
+    def test_ckan_con_prefetch(self):
+        stats = {}
+        rows = ckan_client.fetch_ckan_by_config(base_url=self.portal.url, per_query_limit=1000, stats=stats,
+                                                prefetch=2)
+        self.assertEqual([r["id"] for r in rows], [f"pkg-{i}" for i in range(250)])
+        self.assertEqual(stats["requests"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+if DISCOVERY_DIR not in sys.path:
+    sys.path.insert(0, DISCOVERY_DIR)
+
+import requests  # noqa: E402
+
+import http_cache  # noqa: E402
+import transport  # noqa: E402
+
+
+class _EtagHandler(BaseHTTPRequestHandler):
+    hits = 0
+    not_modified = 0
+
+    def do_GET(self):
+        type(self).hits += 1
+        if self.headers.get("If-None-Match") == '"v1"':
+            type(self).not_modified += 1
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = b'{"results": [], "path": "%s"}' % self.path.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def setUp(self):
+        _EtagHandler.hits = _EtagHandler.not_modified = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _EtagHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api"
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def _session(self, cache):
+        session = requests.Session()
+        session.mount("http://", http_cache.CachingAdapter(cache))
+        return session
+
+    def test_hit_sin_red_y_stats(self):
+        session = self._session(http_cache.ResponseCache(self.tmp.name, ttl=3600))
+        stats = {}
+        for _ in range(3):
+            resp = session.get(self.url, params={"offset": 0})
+            transport.update_http_stats(stats, resp)
+            self.assertEqual(resp.json()["results"], [])
+        self.assertEqual(_EtagHandler.hits, 1)
+        self.assertEqual(stats, {"requests": 1, "retries": 0, "cache_misses": 1, "cache_hits": 2,
+                                 "bytes_wire": 40, "bytes_decoded": 40})
+
+    def test_params_distintos_no_comparten_entrada(self):
+        session = self._session(http_cache.ResponseCache(self.tmp.name, ttl=3600))
+        session.get(self.url, params={"offset": 0})
+        resp = session.get(self.url, params={"offset": 100})
+        self.assertEqual(resp.cache_status, "miss")
+        self.assertEqual(_EtagHandler.hits, 2)
+
+    def test_revalida_con_etag_al_vencer_ttl(self):
+        session = self._session(http_cache.ResponseCache(self.tmp.name, ttl=0))
+        session.get(self.url)
+        resp = session.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.cache_status, "revalidated")
+        self.assertIn("path", resp.json())
+        self.assertEqual(_EtagHandler.not_modified, 1)
+
+    def test_eviction_lru_por_tamano(self):
+        cache = http_cache.ResponseCache(self.tmp.name, ttl=3600, max_bytes=400)
+        for i in range(10):
+            cache.put(f"k{i}", "u", 200, {}, os.urandom(100))
+        self.assertLessEqual(cache._size, 400)
+        self.assertIsNotNone(cache.get("k9"))
+        self.assertIsNone(cache.get("k0"))
+
+
+if __name__ == "__main__":
+    unittest.main()
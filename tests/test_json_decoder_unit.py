@@ -0,0 +1,86 @@
+import json
+import os
+import sys
+import unittest
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+if DISCOVERY_DIR not in sys.path:
+    sys.path.insert(0, DISCOVERY_DIR)
+
+import json_decoder  # noqa: E402
+from ckan_client import CKAN_ITEM_FIELDS, CKAN_ITEMS_PATH, normalize_ckan_result  # noqa: E402
+
+
+def _package(i):
+    return {
+        "id": f"pkg-{i}",
+        "name": f"paquete-{i}",
+        "title": f"Ñandú {i} ☃ \"citado\"",
+        "notes": "x" * (i * 37),
+        "metadata_created": "2024-05-10T08:30:00.123456",
+        "num_resources": 2,
+        "organization": {"title": "Org", "name": "org", "image_url": "http://img"},
+        "groups": [{"title": "Salud", "id": "g1", "description": "larga"}],
+        "tags": [{"name": "t1", "vocabulary_id": None}],
+        "resources": [{"url": f"http://r/{j}", "format": "CSV", "size": j * 1.5} for j in range(20)],
+        "extras": [{"key": "k", "value": "v" * 100}],
+    }
+
+
+class JsonDecoderTests(unittest.TestCase):
+    def setUp(self):
+        self.page = {"help": "ayuda", "success": True,
+                     "result": {"count": 30, "facets": {}, "results": [_package(i) for i in range(30)],
+                                "sort": "score desc", "search_facets": {}}}
+        self.body = json.dumps(self.page, ensure_ascii=False).encode("utf-8")
+
+    def tearDown(self):
+        json_decoder.configure(backend="auto", stream=False)
+
+    def test_proyeccion_conserva_lo_que_usa_el_normalizador(self):
+        item = json_decoder.project(_package(1), CKAN_ITEM_FIELDS)
+        self.assertNotIn("resources", item)
+        self.assertNotIn("extras", item)
+        self.assertEqual(item["organization"], {"title": "Org", "name": "org"})
+        self.assertEqual(normalize_ckan_result(item, "http://x"), normalize_ckan_result(_package(1), "http://x"))
+
+    def test_incremental_igual_a_completo_con_bloques_pequenos(self):
+        expected = json_decoder.project_page(json.loads(self.body), CKAN_ITEMS_PATH, CKAN_ITEM_FIELDS)
+        for chunk_size in (1, 7, 64, 1 << 16):
+            doc = {}
+            items = [json_decoder.project(it, CKAN_ITEM_FIELDS)
+                     for it in json_decoder.iter_items(self.body, CKAN_ITEMS_PATH, doc, chunk_size=chunk_size)]
+            self.assertEqual(items, expected["result"]["results"], chunk_size)
+            # Claves antes y después del arreglo
+            self.assertEqual(doc["result"]["count"], 30)
+            self.assertEqual(doc["result"]["sort"], "score desc")
+            self.assertTrue(doc["success"])
+
+    def test_decode_page_en_ambos_modos_y_backends(self):
+        results = []
+        for backend in ("json", "auto"):
+            for stream in (False, True):
+                json_decoder.configure(backend=backend, stream=stream)
+                results.append(json_decoder.decode_page(self.body, CKAN_ITEMS_PATH, CKAN_ITEM_FIELDS))
+        for r in results[1:]:
+            self.assertEqual(r, results[0])
+        # Socrata: el arreglo va antes de resultSetSize, y números al final del cuerpo
+        json_decoder.configure(stream=True)
+        doc = json_decoder.decode_page(b'{"results": [{"a": 1, "b": 2}], "resultSetSize": 12345}',
+                                       ("results",), {"a": None})
+        self.assertEqual(doc, {"results": [{"a": 1}], "resultSetSize": 12345})
+        # Forma inesperada: se devuelve tal cual
+        self.assertEqual(json_decoder.decode_page(b'{"success": false, "result": null}', CKAN_ITEMS_PATH),
+                         {"success": False, "result": None})
+
+    def test_json_invalido_o_truncado(self):
+        json_decoder.configure(stream=True)
+        for body in (self.body[:-5], b'{"results": [1, 2', b'{"results": [1 2]}', b'{"results": []} x'):
+            with self.assertRaises(ValueError, msg=body):
+                json_decoder.decode_page(body, ("results",))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import unittest
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+for path in (DISCOVERY_DIR, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import ckan_client  # noqa: E402
+import metrics  # noqa: E402
+import rate_limit  # noqa: E402
+from fake_portal import FakePortal, PortalState  # noqa: E402
+
+
+class StageTimerTests(unittest.TestCase):
+    def test_etapas_anidadas_no_se_solapan(self):
+        timer = metrics.StageTimer()
+
+        def fuente():
+            for i in range(3):
+                time.sleep(0.01)
+                with metrics.stage("normalize"):
+                    time.sleep(0.005)
+                yield i
+
+        with timer.stage("export"):
+            for _ in timer.timed("dedupe", timer.timed("fetch", fuente())):
+                time.sleep(0.01)
+        totals = timer.totals()
+        self.assertEqual(list(totals), ["fetch", "normalize", "dedupe", "export"])
+        self.assertAlmostEqual(totals["fetch"], 0.03, delta=0.015)
+        self.assertAlmostEqual(totals["normalize"], 0.015, delta=0.01)
+        self.assertLess(totals["dedupe"], 0.01)
+        self.assertAlmostEqual(totals["export"], 0.03, delta=0.015)
+
+    def test_sin_timer_activo_no_mide(self):
+        with metrics.stage("normalize") as scope:
+            self.assertIs(scope, metrics._NO_SCOPE)
+
+
+class HistogramTests(unittest.TestCase):
+    def test_cuantiles_y_prometheus(self):
+        http = metrics.HttpMetrics()
+        for latency in (0.004, 0.02, 0.02, 0.3):
+            http.observe("a.example", 200, latency=latency, ttfb=latency / 2, nbytes=100)
+        http.observe("a.example", 200, latency=0.1, retry_causes=["429", "ConnectTimeoutError"])
+        data = http.to_dict()["a.example"]
+        self.assertEqual(data["latency_seconds"]["count"], 5)
+        self.assertEqual(data["latency_seconds"]["p50"], 0.025)
+        self.assertEqual(data["status"], {"200": 5})
+        self.assertEqual(data["retry_causes"], {"429": 1, "ConnectTimeoutError": 1})
+        text = metrics.to_prometheus(http, [{"country": "Chile", "elapsed_seconds": 1.5,
+                                             "stage_seconds": {"fetch": 1.2}}])
+        self.assertIn('discovery_http_request_seconds_bucket{host="a.example",le="+Inf"} 5', text)
+        self.assertIn('discovery_http_request_seconds_bucket{host="a.example",le="0.025"} 3', text)
+        self.assertIn('discovery_http_response_bytes_total{host="a.example"} 400', text)
+        self.assertIn('discovery_stage_seconds_total{country="Chile",stage="fetch"} 1.2', text)
+
+
+class HttpInstrumentationTests(unittest.TestCase):
+    def setUp(self):
+        rate_limit.reset_limiters()
+        metrics.HTTP.reset()
+
+    def tearDown(self):
+        metrics.HTTP.reset()
+
+    def test_cliente_ckan_registra_latencia_bytes_y_decodificacion(self):
+        with FakePortal(PortalState(datasets=150, burst_every=2, burst_len=1, retry_after=0)) as portal:
+            rows = ckan_client.fetch_ckan_by_config(base_url=portal.url, per_query_limit=1000)
+            host = metrics.host_of(portal.url)
+        self.assertEqual(len(rows), 150)
+        data = metrics.HTTP.to_dict()[host]
+        self.assertEqual(data["status"], {"200": 2})
+        self.assertEqual(data["latency_seconds"]["count"], 2)
+        self.assertEqual(data["json_decode_seconds"]["count"], 2)
+        self.assertGreater(data["response_bytes"], 0)
+        self.assertGreaterEqual(data["retry_causes"].get("429", 0), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
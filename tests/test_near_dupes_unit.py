@@ -0,0 +1,103 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+if DISCOVERY_DIR not in sys.path:
+    sys.path.insert(0, DISCOVERY_DIR)
+
+import run_discovery  # noqa: E402
+from near_dupes import NearDupeIndex, annotate_near_dupes  # noqa: E402
+from records import DatasetRecord  # noqa: E402
+
+
+DESCRIPTION = ("Registro mensual de casos notificados de dengue por departamento y municipio, "
+               "con semana epidemiológica, grupo de edad, sexo y tipo de caso confirmado")
+
+
+def _row(i, name, description="", tags=None, downloads=0, date="2024-01-01", domain="a.example"):
+    return {"id": f"id-{i}", "permalink": f"https://{domain}/d/{i}", "domain": domain, "name": name,
+            "description": description, "tags": tags or [], "download_count": downloads,
+            "publication_date": date}
+
+
+class NearDupeTests(unittest.TestCase):
+    def test_agrupa_copias_con_pequenas_diferencias(self):
+        rows = [
+            _row(0, "Casos de dengue 2024", DESCRIPTION, ["salud", "dengue"], downloads=10, date="2024-03-01"),
+            _row(1, "Casos de Dengue 2024", DESCRIPTION + ".", ["salud", "dengue"], downloads=500,
+                 date="2024-05-01", domain="b.example"),
+            # Sin tildes ni mayúsculas
+            _row(2, "CASOS DE DENGUE 2024", DESCRIPTION.replace("epidemiológica", "epidemiologica"),
+                 ["Salud", "Dengue"], downloads=500, date="2024-02-01", domain="c.example"),
+            _row(3, "Presupuesto municipal ejecutado", "Ejecución presupuestal de gastos e ingresos por rubro "
+                 "y fuente de financiación del municipio", ["hacienda"], downloads=900),
+            _row(4, "Casos de malaria 2019", "Registro anual de casos de malaria por región sanitaria",
+                 ["salud"]),
+            _row(5, ""),
+            _row(6, ""),
+        ]
+        index = NearDupeIndex()
+        for r in rows:
+            index.add(DatasetRecord(**r))
+        index.cluster()
+        labels = [index.labels(i) for i in range(len(rows))]
+        # Más descargas y, a igualdad, publicado primero
+        self.assertEqual({labels[i][1] for i in (0, 1, 2)}, {"id-2"})
+        self.assertEqual(len({labels[i][0] for i in (0, 1, 2)}), 1)
+        self.assertEqual(len({lab[0] for lab in labels}), 5)
+        # Filas sin texto no se agrupan entre sí
+        self.assertEqual(labels[5][1], "id-5")
+        self.assertEqual(labels[6][1], "id-6")
+        self.assertEqual(index.stats(), {"near_dupe_clusters": 1, "near_dupe_rows": 2})
+        self.assertGreater(index.similarity(0, 1), 0.7)
+        self.assertLess(index.similarity(0, 4), 0.3)
+
+    def test_annotate_conserva_orden_y_borra_el_temporal(self):
+        rows = [_row(i, f"Conjunto {i} de indicadores educativos", f"Matrícula por colegio número {i * 7919}")
+                for i in range(200)]
+        rows.append(_row(200, rows[17]["name"], rows[17]["description"], downloads=3))
+        stats = {}
+        with tempfile.TemporaryDirectory() as tmp:
+            out = list(annotate_near_dupes(iter(rows), tmp, stats=stats))
+            self.assertEqual(os.listdir(tmp), [])
+        self.assertEqual([r["id"] for r in out], [r["id"] for r in rows])
+        self.assertEqual(out[17]["canonical_id"], "id-200")
+        self.assertEqual(out[17]["cluster_id"], out[200]["cluster_id"])
+        self.assertEqual(stats, {"near_dupe_clusters": 1, "near_dupe_rows": 1})
+        # Mismas filas, mismos ids de grupo
+        with tempfile.TemporaryDirectory() as tmp:
+            again = list(annotate_near_dupes(rows, tmp))
+        self.assertEqual([r["cluster_id"] for r in again], [r["cluster_id"] for r in out])
+
+    def test_run_for_country_agrega_columnas(self):
+        domains = {"a.example": [_row(0, "Casos de dengue 2024", DESCRIPTION, downloads=1)],
+                   "b.example": [_row(1, "Casos de dengue 2024", DESCRIPTION, downloads=2, domain="b.example")]}
+
+        def fake_iter(domain_list, **kwargs):
+            for d in domain_list:
+                yield from (DatasetRecord(**r) for r in domains[d])
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(run_discovery, "OUTPUT_DIR", tmp), \
+                mock.patch.object(run_discovery, "iter_by_domains", fake_iter):
+            count, metrics = run_discovery.run_for_country("Pais", {"domains": list(domains)}, with_metrics=True,
+                                                           formats=("json", "csv"), near_dupes=True)
+            with open(os.path.join(tmp, "pais_catalog.json"), encoding="utf-8") as f:
+                data = json.load(f)
+            with open(os.path.join(tmp, "pais_catalog.csv"), encoding="utf-8") as f:
+                header = f.readline().strip().split(",")
+        self.assertEqual(count, 2)
+        self.assertEqual([r["canonical_id"] for r in data], ["id-1", "id-1"])
+        self.assertIn("cluster_id", header)
+        self.assertEqual(metrics["near_dupe_clusters"], 1)
+        self.assertIn("near_dupes", metrics["stage_seconds"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import sys
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+if DISCOVERY_DIR not in sys.path:
+    sys.path.insert(0, DISCOVERY_DIR)
+
+import rate_limit  # noqa: E402
+import socrata_discovery  # noqa: E402
+import transport  # noqa: E402
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_rafaga_y_espera(self):
+        clock = _Clock()
+        bucket = rate_limit.TokenBucket(rate=2.0, burst=2, clock=clock)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 0.5)
+        clock.now += 1.0
+        self.assertEqual(bucket.reserve(), 0.0)
+
+    def test_retry_after_y_aimd(self):
+        clock = _Clock()
+        bucket = rate_limit.TokenBucket(rate=4.0, burst=4, clock=clock)
+        bucket.on_throttle(retry_after=3)
+        bucket.on_throttle(retry_after=1)  # misma ráfaga: un solo recorte
+        self.assertEqual(bucket.rate, 2.0)
+        self.assertGreaterEqual(bucket.reserve(), 3.0)
+        for _ in range(20):
+            clock.now += rate_limit.INCREASE_INTERVAL
+            bucket.on_success()
+        self.assertEqual(bucket.rate, 4.0)  # no supera la cuota
+
+    def test_host_sin_cuota_se_limita_tras_el_primer_rechazo(self):
+        bucket = rate_limit.TokenBucket(clock=_Clock())
+        self.assertEqual(bucket.reserve(), 0.0)
+        bucket.on_throttle()
+        self.assertEqual(bucket.rate, rate_limit.ADAPTIVE_START_RATE)
+
+    def test_cuota_socrata_segun_app_token(self):
+        rate_limit.reset_limiters()
+        try:
+            anon = rate_limit.limiter_for(socrata_discovery.DISCOVERY_BASE)
+            # Sin token no hay cuota fija: no se frena hasta el primer 429
+            self.assertIsNone(anon.ceiling)
+            self.assertEqual(anon.reserve(), 0.0)
+            with_token = rate_limit.limiter_for(socrata_discovery.DISCOVERY_BASE, has_token=True)
+            self.assertIs(anon, with_token)
+            self.assertEqual(with_token.ceiling, socrata_discovery.SOCRATA_TOKEN_QUOTA[0])
+        finally:
+            rate_limit.reset_limiters()
+
+
+class _ThrottlingHandler(BaseHTTPRequestHandler):
+    remaining_429 = 0
+
+    def do_GET(self):
+        if type(self).remaining_429:
+            type(self).remaining_429 -= 1
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = b'{"results": []}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class AdaptiveRetryTests(unittest.TestCase):
+    def setUp(self):
+        rate_limit.reset_limiters()
+        _ThrottlingHandler.remaining_429 = 1
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _ThrottlingHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        rate_limit.reset_limiters()
+
+    def test_429_bloquea_el_host_y_se_cuenta(self):
+        session = transport.build_session()
+        stats = {}
+        start = time.monotonic()
+        resp = session.get(self.url, timeout=5)
+        transport.update_http_stats(stats, resp)
+        self.assertEqual(resp.status_code, 200)
+        self.assertGreaterEqual(time.monotonic() - start, 0.9)
+        self.assertEqual(stats["throttled"], 1)
+        limiter = rate_limit.limiter_for(self.url)
+        self.assertEqual(limiter.throttled, 1)
+        self.assertIsNotNone(limiter.rate)  # el host quedó limitado tras el 429
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+if DISCOVERY_DIR not in sys.path:
+    sys.path.insert(0, DISCOVERY_DIR)
+
+import run_discovery  # noqa: E402
+import sinks  # noqa: E402
+from dates import parse_day  # noqa: E402
+from ckan_client import normalize_ckan_result  # noqa: E402
+from records import DatasetRecord, as_dict  # noqa: E402
+from socrata_discovery import normalize_result, save_json  # noqa: E402
+
+
+def _socrata_item(i, domain):
+    return {
+        "resource": {"name": f"D{i}", "id": f"id-{i}", "type": "dataset", "updatedAt": "2024-01-01T00:00:00Z"},
+        "metadata": {"domain": domain},
+        "permalink": f"https://{domain}/d/{i}",
+        "classification": {"categories": ["salud"], "tags": ["a", "b"]},
+    }
+
+
+class TestDatasetRecord(unittest.TestCase):
+    def test_interfaz_de_dict(self):
+        rec = normalize_result(_socrata_item(1, "datos.gov.co"))
+        self.assertIsInstance(rec, DatasetRecord)
+        self.assertEqual(rec["id"], "id-1")
+        self.assertEqual(rec.get("tags"), "a,b")
+        self.assertIsNone(rec.get("license"))
+        self.assertEqual(rec.get("no_existe", "x"), "x")
+        with self.assertRaises(KeyError):
+            rec["no_existe"]
+        rec["row_count"] = 10
+        self.assertIn("row_count", rec)
+        self.assertEqual(as_dict(rec)["row_count"], 10)
+        self.assertFalse(hasattr(rec, "__dict__"))
+
+    def test_campos_repetidos_se_internan(self):
+        # Cadenas iguales pero construidas por separado, como al decodificar JSON
+        a = normalize_result(_socrata_item(1, "".join(["datos.", "gov.co"])))
+        b = normalize_result(_socrata_item(2, "".join(["datos.gov", ".co"])))
+        self.assertIs(a["domain"], b["domain"])
+        c = normalize_ckan_result({"license_title": "".join(["CC", " BY"]), "organization": {"title": "SHCP"}})
+        d = normalize_ckan_result({"license_title": "".join(["C", "C BY"]), "organization": {"title": "SHCP"}})
+        self.assertIs(c["license"], d["license"])
+
+    def test_dedupe_resumen_y_sinks_con_records(self):
+        rows = [normalize_result(_socrata_item(i % 3, "datos.gov.co")) for i in range(6)]
+        deduped = run_discovery._dedupe_rows(rows)
+        self.assertEqual([r["id"] for r in deduped], ["id-0", "id-1", "id-2"])
+        summary = run_discovery._aggregate_summary(deduped)
+        self.assertIn({"metric": "type", "key": "dataset", "count": 3}, summary)
+        with tempfile.TemporaryDirectory() as tmp:
+            with sinks.JsonArraySink(os.path.join(tmp, "c.json")) as sink:
+                for r in deduped:
+                    sink.write(r)
+            save_json(os.path.join(tmp, "s.json"), deduped)
+            with open(os.path.join(tmp, "c.json"), encoding="utf-8") as f:
+                self.assertEqual(json.load(f)[0]["domain"], "datos.gov.co")
+            with open(os.path.join(tmp, "s.json"), encoding="utf-8") as f:
+                self.assertEqual(json.load(f)[2]["id"], "id-2")
+
+
+class TestParseDay(unittest.TestCase):
+    def test_formas_de_los_portales(self):
+        self.assertEqual(parse_day("2023-05-10T00:00:00.000Z"), date(2023, 5, 10))
+        self.assertEqual(parse_day("2023-05-10T14:03:22.123456"), date(2023, 5, 10))
+        self.assertEqual(parse_day("2023-05-10"), date(2023, 5, 10))
+        self.assertEqual(parse_day(" 2023-05-10 08:00:00 "), date(2023, 5, 10))
+        self.assertEqual(parse_day("2023-05-10T23:30:00-05:00"), date(2023, 5, 10))
+
+    def test_valores_invalidos(self):
+        self.assertIsNone(parse_day(None))
+        self.assertIsNone(parse_day(""))
+        self.assertIsNone(parse_day("sin fecha"))
+        self.assertIsNone(parse_day("2023-13-45"))
+        self.assertIsNone(parse_day(20230510))
+
+    def test_record_parsea_una_vez_y_filtra(self):
+        rec = normalize_ckan_result({"id": "a", "metadata_created": "2021-03-04T10:00:00.5"})
+        self.assertEqual(rec.published_on, date(2021, 3, 4))
+        self.assertNotIn("published_on", rec.keys())
+        rec["publication_date"] = "2022-01-01"
+        self.assertEqual(rec.published_on, date(2022, 1, 1))
+        rows = [rec, {"id": "b", "publication_date": "2020-06-01T00:00:00Z"}, {"id": "c"}]
+        kept = run_discovery._filter_by_publication_date(rows, "2020-01-01", "2021-12-31")
+        self.assertEqual([r["id"] for r in kept], ["b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -48,6 +48,212 @@ class RunDiscoveryHelpersTests(unittest.TestCase):
         ids = [r["id"] for r in filtered]
         self.assertEqual(ids, ["1", "3"])
 
+    def test_merge_metrics_suma_totales(self):
+        metrics = [
+            {"country": "A", "elapsed_seconds": 2.0, "http_requests": 3, "http_retries": 1,
+             "raw_rows": 10, "dedup_removed": 1, "date_filtered": 2, "total_filtered": 3},
+            {"country": "B", "elapsed_seconds": 4.0, "http_requests": 5, "http_retries": 0,
+             "raw_rows": 7, "dedup_removed": 0, "date_filtered": 0, "total_filtered": 0},
+        ]
+        report = run_discovery._merge_metrics(metrics, 4.0, workers=2)
+        self.assertEqual(report["totals"]["http_requests"], 8)
+        self.assertEqual(report["totals"]["exported_rows"], 14)
+        self.assertEqual(report["sum_country_seconds"], 6.0)
+        self.assertEqual(report["speedup"], 1.5)
+        self.assertEqual([m["country"] for m in report["countries"]], ["A", "B"])
+
+    def test_run_all_escribe_consolidado_sin_releer_catalogos(self):
+        import csv
+        import tempfile
+        from unittest import mock
+
+        rows = {"a.example": [{"id": "1", "permalink": "u/1", "type": "dataset", "categories": "salud",
+                               "publication_date": "2024-01-01"},
+                              {"id": "2", "permalink": "u/2", "type": "map", "categories": "",
+                               "publication_date": "2023-01-01"}],
+                "b.example": [{"id": "3", "permalink": "u/3", "type": "dataset", "categories": "salud,vías",
+                               "publication_date": "2024-06-01"}]}
+
+        def fake_iter(domains, **kwargs):
+            for d in domains:
+                yield from rows[d]
+
+        countries = {"A": {"domains": ["a.example"]}, "B": {"domains": ["b.example"]}}
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(run_discovery, "OUTPUT_DIR", tmp), \
+                mock.patch.object(run_discovery, "iter_by_domains", fake_iter), \
+                mock.patch.object(run_discovery, "iter_catalog", side_effect=AssertionError("relectura")):
+            run_discovery.run_all(countries, workers=2)
+            with open(os.path.join(tmp, "latam_summary.csv"), encoding="utf-8") as f:
+                flat = {(r["metric"], r["key"]): int(r["count"]) for r in csv.DictReader(f)}
+            with open(os.path.join(tmp, "latam_summary_cube.csv"), encoding="utf-8") as f:
+                cube = list(csv.DictReader(f))
+            with open(os.path.join(tmp, "a_summary_cube.csv"), encoding="utf-8") as f:
+                self.assertEqual(len(list(csv.DictReader(f))), 2)
+        self.assertEqual(flat[("type", "dataset")], 2)
+        self.assertEqual(flat[("category", "salud")], 2)
+        latam = {(r["type"], r["category"], r["year"]): int(r["count"]) for r in cube if r["country"] == "LATAM"}
+        self.assertEqual(latam, {("dataset", "salud", "2024"): 2, ("dataset", "vías", "2024"): 1,
+                                 ("map", "", "2023"): 1})
+        self.assertEqual({r["country"] for r in cube}, {"A", "B", "LATAM"})
+
+    def test_fetch_by_domains_paralelo_conserva_orden(self):
+        import socrata_discovery
+        from unittest import mock
+
+        def fake_query(domain=None, stats=None, **kwargs):
+            stats["requests"] = stats.get("requests", 0) + 1
+            for i in range(3):
+                yield {"resource": {"id": f"{domain}-{i}"}, "metadata": {"domain": domain}}
+
+        with mock.patch.object(socrata_discovery, "query_catalog", side_effect=fake_query):
+            stats = {"requests": 0, "retries": 0}
+            rows = socrata_discovery.fetch_by_domains(["a", "b", "c"], per_domain_limit=2,
+                                                      stats=stats, workers=3)
+        self.assertEqual([r["id"] for r in rows], ["a-0", "a-1", "b-0", "b-1", "c-0", "c-1"])
+        self.assertEqual(stats["requests"], 3)
+
+    def test_iter_by_domains_paralelo_acota_dominios_en_vuelo(self):
+        import time
+        import socrata_discovery
+        from unittest import mock
+
+        started = []
+
+        def fake_query(domain=None, stats=None, **kwargs):
+            started.append(domain)
+            for i in range(3):
+                yield {"resource": {"id": f"{domain}-{i}"}, "metadata": {"domain": domain}}
+
+        domains = [f"d{i}" for i in range(12)]
+        with mock.patch.object(socrata_discovery, "query_catalog", side_effect=fake_query):
+            rows = socrata_discovery.iter_by_domains(domains, per_domain_limit=3, stats={}, workers=2)
+            first = next(rows)
+            # Con el consumidor detenido no se siguen descargando dominios
+            time.sleep(0.2)
+            self.assertLessEqual(len(started), 3)
+            ids = [first["id"]] + [r["id"] for r in rows]
+        self.assertEqual(ids, [f"{d}-{i}" for d in domains for i in range(3)])
+
+    def test_query_catalog_empuja_ventana_de_fechas(self):
+        import socrata_discovery
+
+        created = ["2025-03-01", "2024-06-01", "2024-02-01", "2023-12-01", "2023-01-01"]
+        sent = []
+
+        class Resp:
+            status_code = 200
+            raw = None
+
+            def __init__(self, payload):
+                self.payload = payload
+
+            def raise_for_status(self):
+                pass
+
+            def json(self):
+                return self.payload
+
+        class Session:
+            def get(self, url, params=None, **kwargs):
+                sent.append(dict(params))
+                ordered = sorted(created, reverse=params.get("order") == "createdAt DESC")
+                page = ordered[params["offset"]:params["offset"] + params["limit"]]
+                return Resp({"results": [
+                    {"resource": {"id": d, "createdAt": d + "T00:00:00.000Z"}} for d in page
+                ]})
+
+        items = list(socrata_discovery.query_catalog(
+            domain="x", limit=2, app_token="t", session=Session(),
+            published_from="2024-01-01", published_to="2024-12-31",
+        ))
+        self.assertEqual([it["resource"]["id"] for it in items], ["2024-02-01", "2024-06-01"])
+        self.assertEqual(sent[0]["order"], "createdAt")
+        # Se corta al ver 2025-03-01, sin pedir una página más
+        self.assertEqual(len(sent), 3)
+
+    def test_query_catalog_no_corta_por_fecha_inicial(self):
+        import socrata_discovery
+
+        # Creado antes de la ventana y publicado dentro: no debe perderse
+        items = [
+            {"resource": {"id": "nuevo", "createdAt": "2024-03-01T00:00:00.000Z"}},
+            {"resource": {"id": "borrador", "createdAt": "2023-12-01T00:00:00.000Z"},
+             "view": {"publication_date": "2024-02-01T00:00:00.000Z"}},
+            {"resource": {"id": "viejo", "createdAt": "2023-06-01T00:00:00.000Z"}},
+        ]
+        sent = []
+
+        class Resp:
+            status_code = 200
+            raw = None
+
+            def raise_for_status(self):
+                pass
+
+            def json(self):
+                return {"results": items}
+
+        class Session:
+            def get(self, url, params=None, **kwargs):
+                sent.append(dict(params))
+                return Resp()
+
+        got = list(socrata_discovery.query_catalog(
+            domain="x", limit=10, app_token="t", session=Session(), published_from="2024-01-01",
+        ))
+        self.assertEqual([it["resource"]["id"] for it in got], ["nuevo", "borrador"])
+        self.assertNotIn("order", sent[0])
+
+    def test_item_solo_con_created_at_pasa_la_ventana_y_el_filtro(self):
+        from datetime import date
+
+        import socrata_discovery
+        from records import publication_day
+
+        # Sin publication_date: la ventana de la consulta usa createdAt y el filtro también
+        item = {"resource": {"id": "a", "createdAt": "2024-03-01T00:00:00.000Z"}}
+        self.assertTrue(socrata_discovery._in_window(socrata_discovery._item_publication_day(item),
+                                                     date(2024, 1, 1), date(2024, 12, 31)))
+        row = socrata_discovery.normalize_result(item)
+        self.assertEqual(publication_day(row), date(2024, 3, 1))
+        kept = run_discovery._filter_by_publication_date([row], "2024-01-01", "2024-12-31")
+        self.assertEqual([r["id"] for r in kept], ["a"])
+
+    def test_incremental_fusiona_delta_y_avanza_marca(self):
+        import tempfile
+        from unittest import mock
+
+        calls = []
+
+        def fake_ckan(base_url=None, modified_since=None, **kwargs):
+            calls.append(modified_since)
+            if modified_since is None:
+                return [
+                    {"id": "1", "permalink": "p/1", "name": "A", "updated_at": "2024-01-01T00:00:00"},
+                    {"id": "2", "permalink": "p/2", "name": "B", "updated_at": "2024-02-01T00:00:00"},
+                ]
+            return [
+                {"id": "2", "permalink": "p/2", "name": "B v2", "updated_at": "2024-03-01T00:00:00"},
+                {"id": "3", "permalink": "p/3", "name": "C", "updated_at": "2024-03-02T10:00:00"},
+            ]
+
+        config = {"platform": "ckan", "base_url": "https://ckan.local"}
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.object(run_discovery, "OUTPUT_DIR", tmp), \
+                mock.patch.object(run_discovery, "STATE_DIR", os.path.join(tmp, "state")), \
+                mock.patch.object(run_discovery, "iter_ckan_by_config", side_effect=fake_ckan):
+            run_discovery.run_for_country("Test", config, incremental=True)
+            count, metrics = run_discovery.run_for_country("Test", config, incremental=True, with_metrics=True)
+            rows = run_discovery._load_catalog(os.path.join(tmp, "test_catalog.json"))
+            marks = run_discovery.load_watermarks(os.path.join(tmp, "state", "test_watermarks.json"))
+
+        self.assertEqual(calls, [None, "2024-02-01T00:00:00Z"])
+        self.assertEqual(count, 3)
+        self.assertEqual([r["name"] for r in rows], ["A", "B v2", "C"])
+        self.assertEqual(metrics["delta_rows"], 2)
+        self.assertEqual(marks, {"https://ckan.local": "2024-03-02T10:00:00Z"})
+
 
 if __name__ == "__main__":
     unittest.main()
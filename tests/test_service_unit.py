@@ -0,0 +1,146 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+if DISCOVERY_DIR not in sys.path:
+    sys.path.insert(0, DISCOVERY_DIR)
+
+import run_discovery  # noqa: E402
+import service  # noqa: E402
+import socrata_discovery  # noqa: E402
+from records import DatasetRecord  # noqa: E402
+
+
+PORTAL = {
+    "a.example": [
+        {"id": "1", "permalink": "u/1", "name": "Casos de dengue", "type": "dataset", "domain": "a.example",
+         "categories": "Salud", "publication_date": "2024-02-01"},
+        {"id": "2", "permalink": "u/2", "name": "Red vial", "type": "map", "domain": "a.example",
+         "categories": "Transporte", "publication_date": "2023-07-01"},
+    ],
+    "b.example": [
+        {"id": "3", "permalink": "u/3", "name": "Matrícula escolar", "type": "dataset", "domain": "b.example",
+         "categories": "Educación,Salud", "publication_date": "2024-09-01"},
+    ],
+}
+
+
+def fake_iter(domains, **kwargs):
+    for d in domains:
+        yield from (DatasetRecord(**r) for r in PORTAL[d])
+
+
+class ServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patches = [mock.patch.object(run_discovery, "OUTPUT_DIR", self.tmp.name),
+                   mock.patch.object(run_discovery, "iter_by_domains", fake_iter)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        countries = {"Uno": {"domains": ["a.example"]}, "Dos": {"domains": ["b.example"]}}
+        # Catálogo de una corrida anterior: el servicio lo sirve antes de actualizar
+        run_discovery.run_for_country("Uno", countries["Uno"])
+        self.service = service.DiscoveryService(countries, index_db=os.path.join(self.tmp.name, "catalog.db"))
+        self.assertEqual(self.service.load_all(), 1)
+        self.service.start()
+        self.server = service.make_server(self.service, port=0)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.service.close()
+        self.tmp.cleanup()
+
+    def _call(self, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base + path, data=data, method="POST" if data is not None else "GET")
+        try:
+            with urllib.request.urlopen(req, timeout=5) as resp:
+                return resp.status, json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def _wait(self, job_id):
+        for _ in range(200):
+            status, job = self._call(f"/jobs/{job_id}")
+            if job["status"] in ("done", "error"):
+                return job
+            time.sleep(0.02)
+        self.fail("el trabajo no terminó")
+
+    def test_consultas_desde_memoria_y_refresh(self):
+        status, health = self._call("/health")
+        self.assertEqual((status, health["countries"]), (200, ["Uno"]))
+        status, page = self._call("/datasets?country=uno&type=dataset")
+        self.assertEqual(page["total"], 1)
+        self.assertEqual(page["items"][0]["name"], "Casos de dengue")
+        self.assertEqual(self._call("/datasets?year=2023")[1]["items"][0]["id"], "2")
+        self.assertEqual(self._call("/search?q=dengue")[0], 503)
+
+        status, job = self._call("/refresh", {"countries": ["Dos"]})
+        self.assertEqual((status, job["status"]), (202, "queued"))
+        job = self._wait(job["id"])
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["results"]["Dos"]["rows"], 1)
+
+        page = self._call("/datasets?category=salud&limit=1")[1]
+        self.assertEqual((page["total"], len(page["items"])), (2, 1))
+        self.assertEqual(self._call("/datasets?category=salud&offset=1")[1]["items"][0]["country"], "Dos")
+        self.assertEqual([r["name"] for r in self._call("/search?q=matricula")[1]], ["Matrícula escolar"])
+        countries = {c["country"]: c for c in self._call("/countries")[1]}
+        self.assertIsNone(countries["Uno"]["last_run"])
+        self.assertEqual(countries["Dos"]["last_run"]["http_requests"], 0)
+        summary = self._call("/summary")[1]
+        self.assertIn({"metric": "category", "key": "Salud", "count": 2}, summary)
+        cube = self._call("/summary?country=Dos&cube=1")[1]
+        self.assertEqual({r["category"] for r in cube}, {"Educación", "Salud"})
+
+    def test_errores(self):
+        self.assertEqual(self._call("/datasets?country=Marte")[0], 404)
+        self.assertEqual(self._call("/datasets?limit=x")[0], 400)
+        self.assertEqual(self._call("/refresh", {"countries": "Uno"})[0], 400)
+        self.assertEqual(self._call("/refresh", {"countries": ["Marte"]})[0], 404)
+        self.assertEqual(self._call("/jobs/99")[0], 404)
+        self.assertEqual(self._call("/nada")[0], 404)
+        with mock.patch.object(run_discovery, "iter_by_domains", side_effect=RuntimeError("portal caído")), \
+                mock.patch("builtins.print"):
+            job = self._wait(self._call("/refresh", {"countries": ["Uno"]})[1]["id"])
+        self.assertEqual(job["status"], "error")
+        self.assertIn("portal caído", job["results"]["Uno"]["error"])
+        # El catálogo anterior sigue disponible
+        self.assertEqual(self._call("/datasets?country=Uno")[1]["total"], 2)
+
+
+class WarmStateTests(unittest.TestCase):
+    def test_token_se_relee_solo_si_cambia_el_archivo(self):
+        with tempfile.TemporaryDirectory() as tmp, mock.patch.dict(os.environ, {"SOCRATA_APP_TOKEN": ""}):
+            path = os.path.join(tmp, "secretos.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"socrata_app_token": "abc"}, f)
+            self.assertEqual(socrata_discovery.load_app_token(path), "abc")
+            with mock.patch.object(socrata_discovery, "_read_token_file") as reread:
+                self.assertEqual(socrata_discovery.load_app_token(path), "abc")
+            reread.assert_not_called()
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"socrata_app_token": "nuevo-token"}, f)
+            self.assertEqual(socrata_discovery.load_app_token(path), "nuevo-token")
+            os.remove(path)
+            self.assertIsNone(socrata_discovery.load_app_token(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import csv
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+if DISCOVERY_DIR not in sys.path:
+    sys.path.insert(0, DISCOVERY_DIR)
+
+import sinks  # noqa: E402
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional
+    pq = None
+
+
+class SinksTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = os.path.join(self.tmp.name, "pais_catalog")
+        self.rows = [
+            {"id": "1", "name": "Ñandú, \"aves\"", "categories": "a,b", "type": "dataset"},
+            {"id": "2", "name": "B", "license": "CC-BY", "extra": "ignorado"},
+        ]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_json_csv_ndjson_con_esquema_fijo(self):
+        for sink in sinks.open_sinks(self.base, ["json", "csv", "ndjson"]):
+            with sink:
+                for row in self.rows:
+                    sink.write(row)
+        with open(self.base + ".json", encoding="utf-8") as f:
+            data = json.load(f)
+        self.assertEqual([r["name"] for r in data], ["Ñandú, \"aves\"", "B"])
+        self.assertEqual(list(data[0].keys()), sinks.CATALOG_FIELDS)
+        with open(self.base + ".csv", encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            self.assertEqual(reader.fieldnames, sinks.CATALOG_FIELDS)
+            self.assertEqual([r["license"] for r in reader], ["", "CC-BY"])
+        self.assertEqual([r["id"] for r in sinks.iter_catalog(self.base + ".ndjson")], ["1", "2"])
+
+    def test_abort_conserva_archivo_anterior(self):
+        with open(self.base + ".json", "w", encoding="utf-8") as f:
+            f.write("[]")
+        with self.assertRaises(RuntimeError):
+            with sinks.JsonArraySink(self.base + ".json") as sink:
+                sink.write(self.rows[0])
+                raise RuntimeError("corte")
+        with open(self.base + ".json", encoding="utf-8") as f:
+            self.assertEqual(f.read(), "[]")
+        self.assertFalse(os.path.exists(self.base + ".json.part"))
+
+    def test_iter_json_array_en_bloques_pequenos(self):
+        path = self.base + ".json"
+        rows = [{"id": str(i), "description": "x" * (i * 7)} for i in range(50)]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        self.assertEqual(list(sinks.iter_json_array(path, chunk_size=16)), rows)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("[]")
+        self.assertEqual(list(sinks.iter_json_array(path)), [])
+
+    def test_summary_sink(self):
+        summary = sinks.SummarySink()
+        for row in self.rows:
+            summary.write(row)
+        self.assertEqual(summary.rows()[0], {"metric": "type", "key": "dataset", "count": 1})
+        self.assertIn({"metric": "category", "key": "b", "count": 1}, summary.rows())
+
+    def test_summary_cubo_y_consolidado(self):
+        co = sinks.SummarySink("Colombia", "socrata")
+        for i, cats in enumerate(["salud, educación", "salud", "", "salud, educación"]):
+            co.write({"id": str(i), "type": "dataset", "categories": cats,
+                      "publication_date": f"202{int(i == 1)}-03-01T00:00:00.000Z"})
+        mx = sinks.SummarySink("México", "ckan")
+        mx.write({"id": "m", "type": "dataset", "categories": ["salud"], "publication_date": None})
+        self.assertEqual(co.by_type, {"dataset": 4})
+        self.assertEqual(co.by_category, {"salud": 3, "educación": 2})
+        self.assertEqual(len(co.cells), 3)
+        self.assertIn({"country": "Colombia", "platform": "socrata", "type": "dataset", "category": "salud",
+                       "year": 2020, "count": 2}, co.cube_rows())
+        self.assertIn({"country": "Colombia", "platform": "socrata", "type": "dataset", "category": "",
+                       "year": 2020, "count": 1}, co.cube_rows())
+
+        total = sinks.SummarySink("LATAM").merge(co).merge(mx)
+        cube = total.cube_rows(rollup="LATAM")
+        latam = [r for r in cube if r["country"] == "LATAM"]
+        self.assertEqual(cube[-len(latam):], latam)
+        self.assertIn({"country": "LATAM", "platform": "", "type": "dataset", "category": "salud",
+                       "year": 2020, "count": 2}, latam)
+        self.assertIn({"country": "México", "platform": "ckan", "type": "dataset", "category": "salud",
+                       "year": None, "count": 1}, cube)
+        self.assertEqual(sum(r["count"] for r in latam if r["category"] == "salud"), 4)
+        path = os.path.join(self.tmp.name, "cubo.csv")
+        sinks.save_summary_cube(path, cube)
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(next(csv.reader(f)), sinks.SUMMARY_CUBE_FIELDS)
+
+
+@unittest.skipIf(pq is None, "pyarrow no instalado")
+class ColumnarSinksTests(unittest.TestCase):
+    def test_parquet_tipado_en_varios_lotes(self):
+        rows = [
+            {"id": str(i), "domain": f"d{i % 3}", "tags": "salud,covid", "categories": "",
+             "publication_date": "2024-05-01T10:00:00.000Z", "num_resources": i, "download_count": None}
+            for i in range(25)
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "c.parquet")
+            with sinks.ParquetSink(path, batch_size=7) as sink:
+                for row in rows:
+                    sink.write(row)
+            table = pq.read_table(path)
+            back = list(sinks.iter_catalog(path))
+        self.assertEqual(table.num_rows, 25)
+        self.assertEqual(str(table.schema.field("domain").type), "dictionary<values=string, indices=int32, ordered=0>")
+        self.assertEqual(table.column("tags")[0].as_py(), ["salud", "covid"])
+        self.assertEqual(table.column("categories")[0].as_py(), [])
+        self.assertEqual(table.column("num_resources")[24].as_py(), 24)
+        self.assertEqual(table.column("publication_date")[0].as_py().year, 2024)
+        self.assertEqual(back[4]["domain"], "d1")
+
+
+if __name__ == "__main__":
+    unittest.main()
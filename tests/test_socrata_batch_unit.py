@@ -0,0 +1,124 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+for path in (DISCOVERY_DIR, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import rate_limit  # noqa: E402
+import socrata_discovery  # noqa: E402
+from checkpoints import CheckpointStore  # noqa: E402
+from fake_portal import FakePortal, PortalState  # noqa: E402
+
+
+class SocrataBatchTests(unittest.TestCase):
+    def setUp(self):
+        rate_limit.reset_limiters()
+        # 30 subdominios: la mayoría con 15 assets y dos grandes
+        self.domains = [f"d{i:02d}.example" for i in range(30)]
+        self.sizes = {d: 15 for d in self.domains}
+        self.sizes["d03.example"] = self.sizes["d21.example"] = 450
+        self.state = PortalState(domains=self.domains, domain_sizes=self.sizes)
+        self.portal = FakePortal(self.state).__enter__()
+        self._base = socrata_discovery.DISCOVERY_BASE
+        socrata_discovery.DISCOVERY_BASE = self.portal.socrata_base
+
+    def tearDown(self):
+        socrata_discovery.DISCOVERY_BASE = self._base
+        self.portal.__exit__(None, None, None)
+        rate_limit.reset_limiters()
+
+    def test_dominios_chicos_caben_en_una_consulta_por_lote(self):
+        self.sizes.update({"d03.example": 15, "d21.example": 15})
+        rows, stats = self._fetch(batch_size=20)
+        self.assertEqual(len(rows), 30 * 15)
+        # 300 + 150 filas en páginas de 100, contra 30 consultas sin lotes
+        self.assertEqual(stats["requests"], 3 + 2)
+        self.assertEqual([d for d, _ in rows[:15]], ["d00.example"] * 15)
+
+    def _fetch(self, **kwargs):
+        self.state.requests = 0
+        stats = {}
+        rows = socrata_discovery.fetch_by_domains(self.domains, per_domain_limit=300, stats=stats, **kwargs)
+        return [(r["domain"], r["id"]) for r in rows], stats
+
+    def test_lotes_mismas_filas_con_menos_solicitudes(self):
+        single, single_stats = self._fetch()
+        batched, batched_stats = self._fetch(batch_size=20)
+        self.assertEqual(batched, single)
+        self.assertEqual(len(batched), 28 * 15 + 2 * 300)
+        self.assertEqual(single_stats["requests"], 28 + 2 * 3)
+        # 735 y 585 filas caben en 20 * 300: cada lote es una sola consulta (8 + 6 páginas)
+        self.assertEqual(batched_stats["requests"], 8 + 6)
+        self.assertEqual(self.state.requests, batched_stats["requests"])
+        # Con hilos el resultado es el mismo
+        threaded, _ = self._fetch(batch_size=20, workers=3)
+        self.assertEqual(threaded, single)
+
+    def test_lote_que_pasa_del_limite_se_biseca(self):
+        # Con límite 30 los lotes pasan de 20 * 30 y se parten hasta aislar d03 y d21
+        self.state.requests = 0
+        stats = {}
+        rows = socrata_discovery.fetch_by_domains(self.domains, per_domain_limit=30, stats=stats, batch_size=20)
+        self.assertEqual(len(rows), 28 * 15 + 2 * 30)
+        self.assertEqual([r["domain"] for r in rows[45:75]], ["d03.example"] * 30)
+        self.assertLess(stats["requests"], 30)
+
+    def test_alias_de_dominio_recorre_el_lote_por_separado(self):
+        # d05 publica sus assets con metadata.domain de su alias (CNAME)
+        real_item = self.state.socrata_item
+
+        def aliased(domain, i):
+            item = real_item(domain, i)
+            if domain == "d05.example":
+                item["metadata"]["domain"] = "datos.d05.example"
+            return item
+
+        with mock.patch.object(self.state, "socrata_item", aliased):
+            single, _ = self._fetch()
+            with mock.patch("builtins.print") as printed:
+                batched, _ = self._fetch(batch_size=20)
+        self.assertEqual(batched, single)
+        self.assertEqual(sum(1 for d, _ in batched if d == "datos.d05.example"), 15)
+        self.assertIn("datos.d05.example", str(printed.call_args_list))
+
+    def test_lote_cortado_queda_pendiente_y_se_reanuda(self):
+        real_get_page = socrata_discovery._get_page
+        calls = {"n": 0}
+
+        def flaky(session, params, headers):
+            if "," in params.get("domains", "") and "d25.example" in params["domains"]:
+                calls["n"] += 1
+                if calls["n"] == 1:
+                    raise requests.exceptions.ConnectionError("red caída")
+            return real_get_page(session, params, headers)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CheckpointStore(tmp, "pais", {"q": None})
+            with mock.patch.object(socrata_discovery, "_get_page", flaky), mock.patch("builtins.print"):
+                first = list(socrata_discovery.iter_by_domains(self.domains, per_domain_limit=300,
+                                                               checkpoint=store, batch_size=20))
+            store.close()
+            self.assertTrue(store.pending_sources())
+            self.assertIn("d25.example", store.pending_sources())
+            self.assertNotIn("d25.example", {r["domain"] for r in first})
+
+            resumed = CheckpointStore(tmp, "pais", {"q": None}, resume=True)
+            rows = list(socrata_discovery.iter_by_domains(self.domains, per_domain_limit=300,
+                                                          checkpoint=resumed, batch_size=20))
+            self.assertEqual(resumed.pending_sources(), [])
+        self.assertEqual(len({(r["domain"], r["id"]) for r in rows}), 28 * 15 + 2 * 300)
+        self.assertEqual(resumed.replayed_rows, len(first))
+
+
+if __name__ == "__main__":
+    unittest.main()
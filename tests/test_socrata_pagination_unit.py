@@ -0,0 +1,113 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+BENCH_DIR = os.path.join(ROOT, "benchmarks")
+for path in (DISCOVERY_DIR, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import rate_limit  # noqa: E402
+import socrata_discovery  # noqa: E402
+from checkpoints import CheckpointStore  # noqa: E402
+from fake_portal import FakePortal, PortalState  # noqa: E402
+
+
+class SocrataPaginationTests(unittest.TestCase):
+    def setUp(self):
+        rate_limit.reset_limiters()
+        # Dominio más grande que la ventana de offset de la API
+        self.state = PortalState(datasets=10250, domains=["grande.example"])
+        self.portal = FakePortal(self.state).__enter__()
+        self._base = socrata_discovery.DISCOVERY_BASE
+        socrata_discovery.DISCOVERY_BASE = self.portal.socrata_base
+
+    def tearDown(self):
+        socrata_discovery.DISCOVERY_BASE = self._base
+        self.portal.__exit__(None, None, None)
+        rate_limit.reset_limiters()
+
+    def _ids(self, **kwargs):
+        return [it["resource"]["id"] for it in socrata_discovery.query_catalog(
+            domain="grande.example", max_pages=None, app_token="t", **kwargs)]
+
+    def test_scroll_completa_dominio_grande_sin_pagina_vacia(self):
+        ids = self._ids(pagination="scroll")
+        self.assertEqual(len(ids), 10250)
+        self.assertEqual(ids, sorted(set(ids)))
+        # 103 páginas: la última viene incompleta y no se pide otra
+        self.assertEqual(self.state.requests, 103)
+
+    def test_offset_se_detiene_en_la_ventana_y_avisa(self):
+        with mock.patch("builtins.print") as printed:
+            ids = self._ids(pagination="offset")
+        self.assertEqual(len(ids), 10000)
+        self.assertEqual(self.state.requests, 100)
+        self.assertIn("--pagination scroll", printed.call_args_list[0][0][0])
+
+    def test_auto_con_prefetch_sondea_y_pasa_a_scroll(self):
+        ids = self._ids(pagination="auto", prefetch=4)
+        self.assertEqual(len(set(ids)), 10250)
+        self.assertEqual(self.state.requests, 1 + 103)
+
+    def test_auto_con_prefetch_en_dominio_chico_usa_offset_en_paralelo(self):
+        small = PortalState(datasets=450, domains=["chico.example"])
+        with FakePortal(small) as portal, mock.patch.object(socrata_discovery, "DISCOVERY_BASE",
+                                                            portal.socrata_base):
+            pages = []
+            items = socrata_discovery.query_catalog(domain="chico.example", max_pages=None, app_token="t",
+                                                    pagination="auto", prefetch=3,
+                                                    on_page=lambda *args: pages.append(args))
+            ids = [it["resource"]["id"] for it in items]
+        self.assertEqual(len(ids), 450)
+        self.assertEqual(ids, [small.socrata_item("chico.example", i)["resource"]["id"] for i in range(450)])
+        self.assertEqual(small.requests, 5)
+        self.assertEqual(pages[-1], (500, True))
+
+    def test_prefetch_no_comparte_sesiones_entre_hilos(self):
+        real_get_page = socrata_discovery._get_page
+        threads_by_session = {}
+
+        def spy(session, params, headers):
+            threads_by_session.setdefault(id(session), set()).add(threading.get_ident())
+            return real_get_page(session, params, headers)
+
+        session = socrata_discovery.build_session()
+        with mock.patch.object(socrata_discovery, "_get_page", spy):
+            ids = self._ids(pagination="offset", prefetch=4, session=session)
+        self.assertEqual(len(ids), 10000)
+        # La del llamador solo pide la primera página; cada hilo del pool usa la suya
+        self.assertEqual(threads_by_session[id(session)], {threading.get_ident()})
+        self.assertTrue(all(len(threads) == 1 for threads in threads_by_session.values()))
+        self.assertGreater(len(threads_by_session), 1)
+
+    def test_checkpoint_reanuda_por_scroll_id(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = CheckpointStore(tmp, "pais", {"q": None})
+            rows = socrata_discovery.iter_by_domains(["grande.example"], per_domain_limit=20000, checkpoint=store)
+            first = [next(rows)["id"] for _ in range(5050)]
+            rows.close()
+            store.close()
+            with open(store.path, encoding="utf-8") as f:
+                saved = json.load(f)["sources"]["grande.example"]
+            self.assertEqual(saved["offset"], 5000)
+            self.assertEqual(saved["scroll_id"], first[4999])
+
+            self.state.requests = 0
+            resumed = CheckpointStore(tmp, "pais", {"q": None}, resume=True)
+            ids = [r["id"] for r in socrata_discovery.iter_by_domains(["grande.example"], per_domain_limit=20000,
+                                                                      checkpoint=resumed)]
+        self.assertEqual(ids[:5050], first)
+        self.assertEqual(len(set(ids)), 10250)
+        self.assertEqual(self.state.requests, 53)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DISCOVERY_DIR = os.path.join(ROOT, "descubrimiento")
+if DISCOVERY_DIR not in sys.path:
+    sys.path.insert(0, DISCOVERY_DIR)
+
+import http_cache  # noqa: E402
+import rate_limit  # noqa: E402
+import transport  # noqa: E402
+
+
+class _SlowHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 para que el cliente pueda reutilizar la conexión
+    protocol_version = "HTTP/1.1"
+    connections = set()
+    close_headers = 0
+
+    def do_GET(self):
+        type(self).connections.add(self.client_address)
+        if self.headers.get("Connection", "").lower() == "close":
+            type(self).close_headers += 1
+        time.sleep(0.01)
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TransportTests(unittest.TestCase):
+    def setUp(self):
+        rate_limit.reset_limiters()
+        self.original = transport.get_config().as_dict()
+        _SlowHandler.connections = set()
+        _SlowHandler.close_headers = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api"
+
+    def tearDown(self):
+        transport.close()
+        transport.configure(**self.original)
+        self.server.shutdown()
+        self.server.server_close()
+        rate_limit.reset_limiters()
+
+    def _get_many(self, threads, per_thread):
+        def worker(_):
+            # Una sesión por hilo, como los clientes; el pool es el mismo
+            session = transport.build_session()
+            stats = {}
+            for _ in range(per_thread):
+                resp = session.get(self.url, timeout=transport.request_timeout())
+                transport.update_http_stats(stats, resp)
+                self.assertEqual(resp.json(), {"ok": True})
+            return stats["requests"]
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            return sum(pool.map(worker, range(threads)))
+
+    def test_pool_compartido_acota_las_conexiones(self):
+        transport.configure(pool_size=2)
+        self.assertEqual(self._get_many(threads=8, per_thread=5), 40)
+        # 8 hilos sobre 2 conexiones: esperan turno en vez de abrir y descartar conexiones
+        self.assertLessEqual(len(_SlowHandler.connections), 2)
+        pool = transport.shared_adapter().poolmanager.connection_from_url(self.url)
+        self.assertLessEqual(pool.num_connections, 2)
+        # Una corrida posterior reutiliza las mismas conexiones
+        before = set(_SlowHandler.connections)
+        self._get_many(threads=2, per_thread=3)
+        self.assertEqual(_SlowHandler.connections, before)
+
+    def test_configure_y_cache_rearman_el_adapter(self):
+        first = transport.build_session().get_adapter(self.url)
+        self.assertIs(transport.build_session().get_adapter(self.url), first)
+        config = transport.configure(connect_timeout=2, read_timeout=7)
+        self.assertEqual(transport.request_timeout(), (2.0, 7.0))
+        self.assertEqual(config.pool_size, self.original["pool_size"])
+        second = transport.shared_adapter()
+        self.assertIsNot(second, first)
+        with tempfile.TemporaryDirectory() as tmp:
+            http_cache.configure_cache(tmp)
+            try:
+                self.assertIsInstance(transport.shared_adapter(), http_cache.CachingAdapter)
+            finally:
+                http_cache.configure_cache(None)
+        self.assertNotIsInstance(transport.shared_adapter(), http_cache.CachingAdapter)
+        with self.assertRaises(ValueError):
+            transport.configure(pool_sise=4)
+
+    def test_sin_keep_alive_cierra_cada_conexion(self):
+        transport.configure(keep_alive=False)
+        self._get_many(threads=1, per_thread=3)
+        self.assertEqual(_SlowHandler.close_headers, 3)
+        self.assertEqual(len(_SlowHandler.connections), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()